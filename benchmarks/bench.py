@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the igpu query and object-construction hot paths
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+
+The benchmarks run against the in-process fakes of NVML and nvidia_smi (see `igpu.fake`), so
+they need no GPU. Results are written as JSON, and two result files can be compared:
+
+    python benchmarks/bench.py --output before.json
+    python benchmarks/bench.py --output after.json --compare before.json
+
+The import of igpu can be checked against a time budget, in milliseconds. The check also fails
+if `import igpu` loads any of the heavy dependencies (see `HEAVY_MODULES`):
+
+    python benchmarks/bench.py --import-only --import-budget 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from typing import Dict, List, Callable, Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#pylint: disable=wrong-import-position
+import igpu
+from igpu import parser
+from igpu.fake import FakeNVML, FakeSMI, FakeProcess
+
+# The modules which must only be imported on first use, not by `import igpu`.
+HEAVY_MODULES = ('pynvml', 'psutil', 'numpy', 'asyncio')
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns the given percentile (0 to 1) of a sorted list, by linear interpolation."""
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 3) -> Dict:
+    """
+    Runs `func` `repeat` times, returning the latency percentiles (in microseconds) and the
+    allocations of a single call, traced with tracemalloc: the blocks and bytes still allocated
+    after the call (e.g. the returned objects) and the peak of traced memory during the call.
+    """
+    for _ in range(warmup):
+        func()
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        timings.append((time.perf_counter_ns() - start) / 1000.0)
+    timings.sort()
+
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+    finally:
+        tracemalloc.stop()
+    del result
+    return {
+        'repeat': repeat,
+        'latency_us': {
+            'min': timings[0],
+            'p50': percentile(timings, 0.50),
+            'p90': percentile(timings, 0.90),
+            'p99': percentile(timings, 0.99),
+            'max': timings[-1],
+            'mean': statistics.mean(timings),
+        },
+        'alloc': {
+            'blocks': sum(stat.count for stat in snapshot.statistics('filename')),
+            'bytes': current,
+            'peak_bytes': peak,
+        },
+    }
+
+
+def make_fake(devices: int, processes: int) -> FakeNVML:
+    """Returns a FakeNVML with `processes` compute processes spread over the devices."""
+    fake = FakeNVML(device_count=devices)
+    for position in range(processes):
+        fake.devices[position % devices].processes.append(FakeProcess())
+    return fake
+
+
+def run_config(devices: int, processes: int, repeat: int) -> List[Dict]:
+    """Runs all benchmarks for a device and process count."""
+    fake = make_fake(devices, processes)
+    smi = FakeSMI(fake)
+    nvml_backend = igpu.NVMLBackend(fake)
+    smi_backend = igpu.SMIBackend(smi)
+    query_dict = parser.get_all_info(smi)
+    device_dict = nvml_backend.query(0)
+
+    benchmarks: Dict[str, Callable[[], Any]] = dict()
+    benchmarks['parser.get_all_info'] = lambda: parser.get_all_info(smi)
+    benchmarks['parser.parser_query_dict'] = lambda: parser.parser_query_dict(0, query_dict)
+    benchmarks['GPUInfo.__init__'] = lambda: igpu.GPUInfo(device_dict)
+
+    igpu.set_backend(nvml_backend)
+    gpu_info = igpu.get_device(0)
+    benchmarks['GPUInfo.update'] = gpu_info.update
+    benchmarks['GPUInfo.__str__'] = lambda: str(gpu_info)
+    benchmarks['igpu.snapshot'] = igpu.snapshot
+
+    results = list()
+    for name, func in benchmarks.items():
+        backend_name = 'smi' if name.startswith('parser.') else 'nvml'
+        results.append(dict(benchmark=name, backend=backend_name, devices=devices,
+                            processes=processes, **measure(func, repeat)))
+
+    for backend_name, backend in (('nvml', nvml_backend), ('smi', smi_backend)):
+        igpu.set_backend(backend)
+        results.append(dict(benchmark='igpu.devices', backend=backend_name, devices=devices,
+                            processes=processes, **measure(igpu.devices, repeat)))
+    return results
+
+
+def _igpu_env() -> Dict[str, str]:
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    return dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+
+
+def import_time(runs: int = 5) -> Dict:
+    """
+    Returns the cumulative import time of igpu, in microseconds, over fresh interpreters, and
+    the heavy modules (see `HEAVY_MODULES`) loaded by the import.
+    """
+    timings = list()
+    env = _igpu_env()
+    code = f'import sys, igpu; print(*(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    loaded = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, env=env,
+                            check=True).stdout.decode().split()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import igpu'],
+            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, env=env, check=True
+        ).stderr.decode()
+        for line in output.splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == 'igpu':
+                timings.append(float(fields[1]))
+    timings.sort()
+    return {'runs': runs, 'p50': percentile(timings, 0.5), 'min': timings[0], 'loaded': loaded}
+
+
+def check_import(result: Dict, budget_ms: float) -> bool:
+    """Prints the import time against a budget, returning False if it is exceeded."""
+    success = result['p50'] <= budget_ms * 1000.0 and not result['loaded']
+    print(f'import igpu: {result["p50"] / 1000.0:.1f} ms (budget {budget_ms:.1f} ms), '
+          f'heavy modules loaded: {", ".join(result["loaded"]) or "none"}'
+          f'{"" if success else " FAILED"}')
+    return success
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> bool:
+    """Prints the p50 latency changes against a baseline, returning False on regressions."""
+    def key(result: Dict) -> tuple:
+        return result['benchmark'], result['backend'], result['devices'], result['processes']
+
+    previous = {key(result): result for result in baseline['results']}
+    success = True
+    for result in current['results']:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        ratio = result['latency_us']['p50'] / max(old['latency_us']['p50'], 1e-9)
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = ' REGRESSION'
+            success = False
+        print(f'{result["benchmark"]:26s} {result["backend"]:5s} {result["devices"]:3d} GPUs '
+              f'{result["processes"]:5d} procs: {old["latency_us"]["p50"]:12.1f} -> '
+              f'{result["latency_us"]["p50"]:12.1f} us ({ratio:6.2f}x){flag}')
+    return success
+
+
+def main() -> int:
+    """Runs the benchmarks."""
+    args_parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    args_parser.add_argument('--devices', type=int, nargs='+', default=[1, 8, 64])
+    args_parser.add_argument('--processes', type=int, nargs='+', default=[0, 100, 1000])
+    args_parser.add_argument('--repeat', type=int, default=50)
+    args_parser.add_argument('--output', help='the JSON output file (default: stdout)')
+    args_parser.add_argument('--compare', help='a previous JSON output to compare with')
+    args_parser.add_argument('--threshold', type=float, default=0.1,
+                             help='the p50 slowdown reported as a regression (default: 0.1)')
+    args_parser.add_argument('--import-budget', type=float,
+                             help='the maximum p50 import time of igpu, in milliseconds')
+    args_parser.add_argument('--import-only', action='store_true',
+                             help='only measures the import time')
+    args = args_parser.parse_args()
+
+    if args.import_only:
+        result = import_time()
+        if args.import_budget is None:
+            print(json.dumps(result, indent=2))
+            return 0
+        return 0 if check_import(result, args.import_budget) else 1
+
+    results = list()
+    for devices in args.devices:
+        for processes in args.processes:
+            print(f'Running {devices} GPUs, {processes} processes...', file=sys.stderr)
+            results.extend(run_config(devices, processes, args.repeat))
+
+    report = {
+        'igpu_version': igpu.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'import_time_us': import_time(),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text)
+    else:
+        print(text)
+
+    success = True
+    if args.import_budget is not None:
+        success = check_import(report['import_time_us'], args.import_budget)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            success = compare(report, json.load(baseline_file), args.threshold) and success
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
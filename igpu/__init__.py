@@ -4,16 +4,89 @@ __author__ = 'Antonio C. Nazare Jr.'
 __email__ = 'antonio.nazare@dcc.ufmg.br'
 __version__ = '0.1.2'
 
+import sys
+import types
+import importlib
 
-from igpu.core import count_devices, count_visible_devices
-from igpu.core import devices_index, visible_devices_index
-from igpu.core import nvidia_driver_version
-from igpu.core import get_device, devices, visible_devices
-from igpu.gpu_info import GPUMemoryInfo
-from igpu.gpu_info import GPUUtilizationInfo
-from igpu.gpu_info import GPUPCIInfo
-from igpu.gpu_info import GPUClockInfo
-from igpu.gpu_info import GPUPowerInfo
-from igpu.gpu_info import GPUProcessInfo
-from igpu.gpu_info import GPUProcessesInfo
-from igpu.gpu_info import GPUInfo
+# The public names are imported on first access (PEP 562), so `import igpu` does not load NVML,
+# psutil or NumPy: each one is only imported by the first function that needs it.
+__LAZY_ATTRIBUTES = {
+    'count_devices': 'igpu.core',
+    'count_visible_devices': 'igpu.core',
+    'devices_index': 'igpu.core',
+    'visible_devices_index': 'igpu.core',
+    'nvidia_driver_version': 'igpu.core',
+    'get_device': 'igpu.core',
+    'devices': 'igpu.core',
+    'visible_devices': 'igpu.core',
+    'GPUMemoryInfo': 'igpu.gpu_info',
+    'GPUUtilizationInfo': 'igpu.gpu_info',
+    'GPUPCIInfo': 'igpu.gpu_info',
+    'GPUClockInfo': 'igpu.gpu_info',
+    'GPUPowerInfo': 'igpu.gpu_info',
+    'GPUProcessInfo': 'igpu.gpu_info',
+    'GPUProcessesInfo': 'igpu.gpu_info',
+    'GPUInfo': 'igpu.gpu_info',
+    'Backend': 'igpu.backend',
+    'SMIBackend': 'igpu.backend',
+    'NVMLBackend': 'igpu.backend',
+    'get_backend': 'igpu.backend',
+    'set_backend': 'igpu.backend',
+    'Session': 'igpu.session',
+    'get_session': 'igpu.session',
+    'set_session': 'igpu.session',
+    'CachedBackend': 'igpu.cache',
+    'ReplayBackend': 'igpu.replay',
+    'Sampler': 'igpu.sampler',
+    'History': 'igpu.history',
+    'Recorder': 'igpu.recorder',
+    'Recording': 'igpu.recorder',
+    'snapshot': 'igpu.columnar',
+    'snapshot_dtype': 'igpu.columnar',
+    'watch': 'igpu.watch',
+    'Watcher': 'igpu.watch',
+    'select': 'igpu.selection',
+    'Accountant': 'igpu.accounting',
+    'Publisher': 'igpu.shm',
+    'SharedMemoryBackend': 'igpu.shm',
+}
+
+__SUBMODULES = (
+    'accounting', 'aio', 'backend', 'cache', 'cli', 'cluster', 'columnar', 'core', 'exporter',
+    'fake', 'gpu_info', 'history', 'metrics', 'parser', 'process', 'recorder', 'replay',
+    'sampler', 'selection', 'session', 'shm', 'watch',
+)
+
+__all__ = list(__LAZY_ATTRIBUTES) + ['aio']
+
+
+def __getattr__(name: str):
+    module_name = __LAZY_ATTRIBUTES.get(name)
+    if module_name is not None:
+        value = getattr(importlib.import_module(module_name), name)
+    elif name in __SUBMODULES:
+        value = importlib.import_module(f'igpu.{name}')
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__LAZY_ATTRIBUTES) | set(__SUBMODULES))
+
+
+class _Package(types.ModuleType):
+    """
+    The igpu package module. Importing a submodule binds it to the package attribute of the same
+    name, which would replace the `watch` function by the `igpu.watch` module once the module is
+    imported; the function is kept instead.
+    """
+
+    def __setattr__(self, name: str, value) -> None:
+        if name == 'watch' and isinstance(value, types.ModuleType):
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of the igpu command entry point (`python -m igpu`)
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import sys
+from igpu.cli import main
+
+sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu process accounting
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import time
+import threading
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+import numpy as np
+from igpu.backend import get_backend
+from igpu.process import ProcessCache, get_process_cache
+
+SAMPLE_DTYPE = np.dtype([
+    ('timestamp', np.float64),
+    ('gpu_memory', np.float32),
+    ('sm_util', np.float32),
+    ('memory_util', np.float32),
+])
+
+
+class ProcessSeries(object):
+    """
+    The usage of a process on a device over time.
+
+    Each poll appends one compact sample (see `SAMPLE_DTYPE`) to a fixed-size ring buffer: the
+    GPU memory of the process and the mean of the per-process utilization samples reported by
+    NVML since the previous poll (NaN if none). The totals are accumulated over the whole life
+    of the process, regardless of the buffer size.
+
+    Attributes:
+        device (int): The device index.
+        pid (int): The process PID.
+        name (str): The process name.
+        user (str): The name of the user that owns the process.
+        create_time (float): The process creation time, in seconds since the epoch, or 'N/A'
+            if it cannot be read.
+        first_seen (float): The time of the first poll which saw the process on the device.
+        last_seen (float): The time of the last poll which saw the process on the device.
+        running (bool): False once the process left the device.
+        gpu_seconds (float): The time the process held a context on the device, in seconds.
+        memory_seconds (float): The integral of the GPU memory over time, in MiB seconds.
+        sm_seconds (float): The integral of the SM utilization over time, in seconds of full
+            utilization. Only the polls with utilization samples are accounted.
+        peak_memory (float): The peak GPU memory, in MiB.
+    """
+
+    __slots__ = (
+        'device', 'pid', 'name', 'user', 'create_time', 'first_seen', 'last_seen', 'running',
+        'gpu_seconds', 'memory_seconds', 'sm_seconds', 'peak_memory', '_samples', '_count',
+    )
+
+    def __init__(self, device: int, process_dict: Dict, timestamp: float,
+                 capacity: int) -> None:
+        self.device = device
+        self.pid = process_dict['pid']
+        self.name = process_dict['name']
+        self.user = process_dict['user']
+        self.create_time = process_dict['create_time']
+        self.first_seen = self.last_seen = timestamp
+        self.running = True
+        self.gpu_seconds = self.memory_seconds = self.sm_seconds = self.peak_memory = 0.0
+        self._samples = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self._count = 0
+
+    def add_sample(self, timestamp: float, gpu_memory: float, sm_util: float,
+                   memory_util: float) -> Tuple[float, float, float]:
+        """
+        Appends a poll sample and accumulates the totals since the previous one. Called by the
+        `Accountant` at each poll which sees the process.
+
+        Args:
+            timestamp (float): The poll time, in seconds since the epoch.
+            gpu_memory (float): The GPU memory of the process, in MiB.
+            sm_util (float): The mean SM utilization since the previous poll, in percent, or
+                NaN if unknown.
+            memory_util (float): The mean memory utilization since the previous poll, in
+                percent, or NaN if unknown.
+
+        Returns:
+            tuple: The increments of the gpu, memory and SM seconds, for the user totals.
+        """
+        elapsed = timestamp - self.last_seen if self._count else 0.0
+        increments = (elapsed, gpu_memory * elapsed,
+                      0.0 if sm_util != sm_util else sm_util / 100.0 * elapsed)
+        self.gpu_seconds += increments[0]
+        self.memory_seconds += increments[1]
+        self.sm_seconds += increments[2]
+        self.peak_memory = max(self.peak_memory, gpu_memory)
+        self.last_seen = timestamp
+        self._samples[self._count % len(self._samples)] = (timestamp, gpu_memory, sm_util,
+                                                           memory_util)
+        self._count += 1
+        return increments
+
+    @property
+    def count(self) -> int:
+        """int: Returns the number of samples taken, including the ones no longer kept."""
+        return self._count
+
+    def samples(self) -> np.ndarray:
+        """
+        Returns the samples kept in the buffer, from the oldest to the newest.
+
+        Returns:
+            ndarray: A copy of the samples, with the `SAMPLE_DTYPE` dtype.
+        """
+        capacity = len(self._samples)
+        end = self._count % capacity
+        if self._count <= capacity:
+            return self._samples[:self._count].copy()
+        return np.concatenate((self._samples[end:], self._samples[:end]))
+
+    def __repr__(self) -> str:
+        return (f'ProcessSeries(device={self.device}, pid={self.pid}, name={self.name!r}, '
+                f'user={self.user!r}, gpu_seconds={self.gpu_seconds:.1f})')
+
+
+class Accountant(object):
+    """
+    Tracks the GPU usage of the compute processes over time, for accounting.
+
+    Each poll reads, for each device, the compute processes with their GPU memory, without
+    resolving their metadata, and only the per-process utilization samples taken by the driver
+    since the previous poll (`nvmlDeviceGetProcessUtilization` with the timestamp of the last
+    sample). The processes are identified by (device, pid, creation time) through the process
+    cache (see `igpu.process.ProcessCache`), which resolves the metadata (name, user and creation
+    time) of a process only once; a reused PID starts a new series.
+
+    The usage of each process is kept in a `ProcessSeries`, until `retention` seconds after the
+    process leaves the device. The totals of each user are kept for the life of the accountant.
+
+    Args:
+        interval (float): The polling interval of the background thread, in seconds.
+        devices (list): The indexes of the accounted devices. If None, all available devices.
+        capacity (int): The number of samples kept per process.
+        retention (float): The time the series of a finished process is kept, in seconds.
+        process_cache (ProcessCache): The process metadata cache. If None, the shared cache.
+    """
+
+    def __init__(self, interval: float = 1.0, devices: Optional[Iterable[int]] = None,
+                 capacity: int = 3600, retention: float = 3600.0,
+                 process_cache: Optional[ProcessCache] = None) -> None:
+        if interval <= 0:
+            raise ValueError(f'Invalid interval: {interval}')
+        if capacity <= 0:
+            raise ValueError(f'Invalid capacity: {capacity}')
+        self._interval = interval
+        self._devices = None if devices is None else list(devices)
+        self._capacity = capacity
+        self._retention = retention
+        self._process_cache = get_process_cache() if process_cache is None else process_cache
+        self._since: Dict[int, int] = dict()
+        self._active: Dict[Tuple[int, int, Any], ProcessSeries] = dict()
+        self._finished: List[ProcessSeries] = list()
+        self._totals: Dict[str, List[float]] = dict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def interval(self) -> float:
+        """float: Returns the polling interval, in seconds."""
+        return self._interval
+
+    @property
+    def running(self) -> bool:
+        """bool: Returns True if the polling thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def poll(self) -> None:
+        """
+        Reads the processes and the new utilization samples of all devices. Called by the
+        polling thread at each interval; it can also be called directly when the thread is not
+        running.
+        """
+        backend = get_backend()
+        devices = self._devices
+        if devices is None:
+            devices = range(backend.device_count())
+        timestamp = time.time()
+        for device_index in devices:
+            processes = backend.compute_processes(device_index)
+            if processes is None:
+                raise ValueError(f'Invalid device index: {device_index}')
+            samples = backend.process_utilization(device_index, self._since.get(device_index, 0))
+            utilization: Dict[int, List[float]] = dict()
+            for pid, sample_time, sm_util, memory_util in samples or list():
+                values = utilization.setdefault(pid, [0.0, 0.0, 0])
+                values[0] += sm_util
+                values[1] += memory_util
+                values[2] += 1
+                self._since[device_index] = max(self._since.get(device_index, 0), sample_time)
+            self._update(device_index, timestamp, processes, utilization)
+        with self._lock:
+            self._finished = [series for series in self._finished
+                              if timestamp - series.last_seen <= self._retention]
+
+    def _update(self, device_index: int, timestamp: float, processes: List[Tuple[int, float]],
+                utilization: Dict[int, List[float]]) -> None:
+        current = {(device_index, process_dict['pid'], process_dict['create_time']): process_dict
+                   for process_dict in self._process_cache.lookup(processes)}
+        with self._lock:
+            for key, process_dict in current.items():
+                if key not in self._active:
+                    self._active[key] = ProcessSeries(
+                        device_index, process_dict, timestamp, self._capacity)
+            for key in [key for key in self._active if key[0] == device_index]:
+                series = self._active[key]
+                if key not in current:
+                    series.running = False
+                    self._finished.append(self._active.pop(key))
+                    continue
+                sm_util = memory_util = float('NaN')
+                if key[1] in utilization:
+                    sm_total, memory_total, count = utilization[key[1]]
+                    sm_util, memory_util = sm_total / count, memory_total / count
+                increments = series.add_sample(
+                    timestamp, float(current[key]['gpu_memory']), sm_util, memory_util)
+                totals = self._totals.setdefault(series.user, [0.0, 0.0, 0.0])
+                for position, increment in enumerate(increments):
+                    totals[position] += increment
+
+    def processes(self, running: Optional[bool] = None) -> List[ProcessSeries]:
+        """
+        Returns the series of the accounted processes.
+
+        Args:
+            running (bool): If True, only the running processes; if False, only the finished
+                ones still retained. If None, both.
+
+        Returns:
+            list: The ProcessSeries objects, ordered by device and first poll.
+        """
+        with self._lock:
+            ret = list()
+            if running is None or running:
+                ret.extend(self._active.values())
+            if running is None or not running:
+                ret.extend(self._finished)
+        return sorted(ret, key=lambda series: (series.device, series.first_seen, series.pid))
+
+    def usage(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the accumulated usage of each user, since the accountant was created.
+
+        Returns:
+            dict: For each user name, a dict with the 'gpu_seconds', 'memory_seconds' (MiB
+            seconds) and 'sm_seconds' (seconds of full SM utilization) of the user processes.
+        """
+        with self._lock:
+            return {
+                user: {'gpu_seconds': totals[0], 'memory_seconds': totals[1],
+                       'sm_seconds': totals[2]}
+                for user, totals in self._totals.items()
+            }
+
+    def start(self) -> 'Accountant':
+        """
+        Starts the polling thread.
+
+        Returns:
+            Accountant: The accountant itself.
+        """
+        if self.running:
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='igpu-accountant', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops the polling thread, waiting for the current poll to finish.
+
+        Args:
+            timeout (float): The maximum time to wait for the thread, in seconds.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as err: #pylint: disable=broad-except
+                self.last_error = err
+            next_time += self._interval
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            self._stop_event.wait(next_time - now)
+
+    def __enter__(self) -> 'Accountant':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu asyncio API
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor, Executor
+from typing import Dict, List, Optional, Iterable, Union, Any, Callable, Hashable
+from igpu import core
+from igpu import parser
+from igpu.gpu_info import GPUInfo
+
+MAX_WORKERS = 2
+
+__EXECUTOR: Optional[Executor] = None
+# The in-flight queries of each event loop, by query key.
+__INFLIGHT: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_executor() -> Executor:
+    """
+    Returns the executor where the blocking igpu queries run. If no executor has been set, a
+    ThreadPoolExecutor with `MAX_WORKERS` threads is created on the first call.
+
+    Returns:
+        Executor: The current executor.
+    """
+    global __EXECUTOR #pylint: disable=global-statement
+    if __EXECUTOR is None:
+        __EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='igpu-aio')
+    return __EXECUTOR
+
+
+def set_executor(executor: Optional[Executor]) -> None:
+    """
+    Sets the executor where the blocking igpu queries run.
+
+    Args:
+        executor (Executor): The new executor. If None, a new default executor is created on the
+            next query.
+    """
+    global __EXECUTOR #pylint: disable=global-statement
+    __EXECUTOR = executor
+
+
+def _forget(inflight: Dict[Hashable, asyncio.Future], key: Hashable,
+            future: asyncio.Future) -> None:
+    if inflight.get(key) is future:
+        del inflight[key]
+    if not future.cancelled():
+        future.exception()
+
+
+async def _coalesced(key: Hashable, func: Callable, *args: Any,
+                     timeout: Optional[float] = None) -> Any:
+    """
+    Runs `func(*args)` on the executor, sharing the result with the concurrent callers of the
+    same key. The shared query is shielded: the timeout or the cancellation of a caller does not
+    affect the other callers waiting for it.
+    """
+    loop = asyncio.get_running_loop()
+    inflight = __INFLIGHT.setdefault(loop, dict())
+    future = inflight.get(key)
+    if future is None:
+        future = loop.run_in_executor(get_executor(), functools.partial(func, *args))
+        inflight[key] = future
+        future.add_done_callback(functools.partial(_forget, inflight, key))
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+
+async def devices(fields: Optional[Iterable[str]] = None,
+                  timeout: Optional[float] = None) -> List[GPUInfo]:
+    """
+    Coroutine version of `igpu.devices()`.
+
+    Concurrent calls with the same `fields` share a single query, and thus the same GPUInfo
+    objects. Note that accessing a section which was not queried loads it synchronously.
+
+    Args:
+        fields (list): The GPUInfo sections to query. If None, all sections are queried.
+        timeout (float): The maximum time to wait, in seconds. If None, waits forever.
+
+    Returns:
+        list: A list of GpuInfo objects.
+    """
+    fields = parser.check_fields(fields)
+    return await _coalesced(('devices', fields), core.devices, fields, timeout=timeout)
+
+
+async def get_device(device_index: Union[int, str], fields: Optional[Iterable[str]] = None,
+                     timeout: Optional[float] = None) -> GPUInfo:
+    """
+    Coroutine version of `igpu.get_device()`.
+
+    Concurrent calls with the same arguments share a single query. Note that accessing a
+    section which was not queried loads it synchronously.
+
+    Args:
+        device_index (int or str): The index or the UUID of the desired device.
+        fields (list): The GPUInfo sections to query. If None, all sections are queried.
+        timeout (float): The maximum time to wait, in seconds. If None, waits forever.
+
+    Returns:
+        GpuInfo: A GpuInfo object containing the device properties and stats.
+    """
+    fields = parser.check_fields(fields)
+    return await _coalesced(('get_device', device_index, fields), core.get_device,
+                            device_index, fields, timeout=timeout)
+
+
+async def update(gpu_info: GPUInfo, timeout: Optional[float] = None) -> GPUInfo:
+    """
+    Coroutine version of `GPUInfo.update()`.
+
+    Concurrent updates of the same object share a single query.
+
+    Args:
+        gpu_info (GPUInfo): The object to update.
+        timeout (float): The maximum time to wait, in seconds. If None, waits forever.
+
+    Returns:
+        GpuInfo: The updated object.
+    """
+    await _coalesced(('update', id(gpu_info)), gpu_info.update, timeout=timeout)
+    return gpu_info
+
+
+async def snapshot(devices_index: Optional[Iterable[int]] = None,
+                   metrics: Optional[Iterable[str]] = None,
+                   timeout: Optional[float] = None) -> Any:
+    """
+    Coroutine version of `igpu.snapshot()`.
+
+    Concurrent calls with the same arguments share a single query, and thus the same array.
+
+    Args:
+        devices_index (list): The device indexes. If None, all available devices.
+        metrics (list): The metric names. If None, all metrics.
+        timeout (float): The maximum time to wait, in seconds. If None, waits forever.
+
+    Returns:
+        ndarray: The snapshot array.
+    """
+    from igpu import columnar #pylint: disable=import-outside-toplevel
+    devices_index = None if devices_index is None else tuple(devices_index)
+    metrics = None if metrics is None else tuple(metrics)
+    return await _coalesced(('snapshot', devices_index, metrics), columnar.snapshot,
+                            devices_index, metrics, timeout=timeout)
@@ -0,0 +1,686 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu query backends
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+from typing import Dict, List, Optional, Any, Iterable, Tuple, Sequence
+from igpu import parser
+from igpu import metrics as igpu_metrics
+from igpu.session import Session, get_session
+
+
+class Backend(object):
+    """
+    Base class of the igpu query backends.
+
+    A backend is responsible for reading the device attributes and returning them as a parsed
+    device dict, i.e., the dict expected by the GPUInfo constructor (see
+    `parser.parser_query_dict`).
+
+    The immutable attributes (see `parser.STATIC_ATTRIBUTES`), such as the device identification,
+    the PCI topology and the maximum clocks, are read only once per device and cached by the
+    backend. Subsequent queries only read the attributes that can change over time.
+    """
+
+    def __init__(self) -> None:
+        self._static_cache: Dict[int, Dict[str, Dict]] = dict()
+
+    def device_count(self) -> int:
+        """
+        Returns the number of available GPU devices installed on the host.
+
+        Returns:
+            int: The number of available devices.
+        """
+        raise NotImplementedError
+
+    def driver_version(self) -> Optional[str]:
+        """
+        Returns the nvidia driver version string, or None if it is not available.
+
+        Returns:
+            str: The driver version, as reported by NVML (e.g. '430.34').
+        """
+        raise NotImplementedError
+
+    def index_from_uuid(self, uuid: str) -> Optional[int]:
+        """
+        Given a device UUID, returns the device index.
+
+        Args:
+            uuid (str): The device UUID (e.g. 'GPU-2b8d3a4c-...').
+
+        Returns:
+            int: The device index, or None if there is no device with the given UUID.
+        """
+        for device_index, cached in self._static_cache.items():
+            if 'identity' in cached and cached['identity']['uuid'] == uuid:
+                return device_index
+        for device_dict in self.query_all(fields=tuple()):
+            if device_dict['uuid'] == uuid:
+                return device_dict['index']
+        return None
+
+    def clear_cache(self) -> None:
+        """
+        Clears the cached immutable attributes, which are read again on the next query.
+        """
+        self._static_cache.clear()
+
+    def query(self, device_index: int, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """
+        Given a device index, returns the parsed device dict.
+
+        The identification attributes (index, name, serial, uuid and bios) are always present.
+        The remaining sections are only queried and present if listed in `fields`.
+
+        The values are normalized once, following `igpu.metrics.SCHEMA`: numbers are floats in
+        fixed units (MiB, %, C, MHz and W), and missing values are NaN (or 'N/A' for strings).
+
+        Args:
+            device_index (int): The index of the desired device.
+            fields (list): The desired sections, a subset of `parser.FIELDS`. If None, all
+                sections are queried.
+
+        Returns:
+            dict: The parsed device dict, or None if the index is invalid.
+        """
+        fields = parser.check_fields(fields)
+        static_fields = self._missing_static_fields(device_index, fields)
+        device_dict = self._query(device_index, fields, static_fields)
+        if device_dict is not None:
+            self._merge_static(igpu_metrics.normalize(device_dict), fields, static_fields)
+        return device_dict
+
+    def query_all(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Returns the parsed device dict of all available devices, ordered by index.
+
+        Args:
+            fields (list): The desired sections, a subset of `parser.FIELDS`. If None, all
+                sections are queried.
+
+        Returns:
+            list: A list of parsed device dicts.
+        """
+        fields = parser.check_fields(fields)
+        ret = list()
+        for device_index in range(self.device_count()):
+            device_dict = self.query(device_index, fields)
+            if device_dict is None:
+                raise ValueError(f'Invalid device index: {device_index}')
+            ret.append(device_dict)
+        return ret
+
+    def read_metrics(self, device_index: int, metrics: Sequence[str], out: Any) -> bool:
+        """
+        Reads numeric metrics of a device into a preallocated array, without building a GPUInfo.
+
+        Args:
+            device_index (int): The index of the desired device.
+            metrics (list): The metric names (see `igpu.metrics.METRIC_NAMES`), validated by
+                the caller.
+            out (ndarray): A float array with one position per metric, where the values are
+                written. Values which are not available are written as NaN.
+
+        Returns:
+            bool: False if the index is invalid, True otherwise.
+        """
+        device_dict = self.query(device_index, igpu_metrics.fields_of(metrics))
+        if device_dict is None:
+            return False
+        out[:] = igpu_metrics.metric_values(device_dict, metrics)
+        return True
+
+    def process_count(self, device_index: int) -> Optional[int]:
+        """
+        Returns the number of processes with compute context on a device, without resolving
+        their metadata when the backend can avoid it.
+
+        Args:
+            device_index (int): The index of the desired device.
+
+        Returns:
+            int: The number of processes, or None if the index is invalid.
+        """
+        processes = self.compute_processes(device_index)
+        return None if processes is None else len(processes)
+
+    def compute_processes(self, device_index: int) -> Optional[List[Tuple[int, float]]]:
+        """
+        Returns the processes with compute context on a device and their GPU memory, without
+        resolving their metadata when the backend can avoid it.
+
+        Args:
+            device_index (int): The index of the desired device.
+
+        Returns:
+            list: The (pid, GPU memory in MiB) pairs, or None if the index is invalid.
+        """
+        device_dict = self.query(device_index, ('processes',))
+        if device_dict is None:
+            return None
+        return [(process['pid'], process['gpu_memory'])
+                for process in device_dict['processes'] or list()]
+
+    def process_utilization(self, device_index: int,
+                            since: int = 0) -> Optional[List[Tuple[int, int, float, float]]]:
+        """
+        Returns the per-process utilization samples of a device taken after a given time, as
+        reported by `nvmlDeviceGetProcessUtilization`. Passing the timestamp of the last
+        returned sample fetches only the new samples.
+
+        Args:
+            device_index (int): The index of the desired device.
+            since (int): The CPU timestamp, in microseconds since the epoch, after which the
+                samples are returned. If 0, all samples kept by the driver.
+
+        Returns:
+            list: The (pid, timestamp in microseconds, SM utilization, memory utilization)
+            samples, the utilizations in percent, or None if the per-process utilization is not
+            available.
+        """
+        #pylint: disable=unused-argument,no-self-use
+        return None
+
+    def topology_level(self, device_a: int, device_b: int) -> Optional[int]:
+        """
+        Returns the level of the closest common ancestor of two devices in the system topology,
+        as the NVML topology levels: 0 for the same board, 10 for a single PCIe switch, 20 for
+        multiple PCIe switches, 30 for a PCIe host bridge, 40 for a NUMA node and 50 for the
+        whole system. The level is immutable and cached with the static attributes.
+
+        Args:
+            device_a (int): The index of a device.
+            device_b (int): The index of another device.
+
+        Returns:
+            int: The topology level, or None if the topology is not available.
+        """
+        cached = self._static_cache.setdefault(device_a, dict()).setdefault('topology', dict())
+        if device_b not in cached:
+            cached[device_b] = self._topology_level(device_a, device_b)
+        return cached[device_b]
+
+    def _topology_level(self, device_a: int, device_b: int) -> Optional[int]:
+        """
+        Reads the topology level of two devices (see `topology_level`). The backends which can
+        read the system topology should implement it.
+        """
+        #pylint: disable=unused-argument,no-self-use
+        return None
+
+    def _query(self, device_index: int, fields: Tuple[str, ...],
+               static_fields: Tuple[str, ...]) -> Optional[Dict]:
+        """
+        Reads the device attributes. Must be implemented by the backends.
+
+        Args:
+            device_index (int): The index of the desired device.
+            fields (tuple): The sections to read.
+            static_fields (tuple): The sections, including the device identification
+                ('identity'), whose immutable attributes must also be read.
+
+        Returns:
+            dict: The parsed device dict, or None if the index is invalid.
+        """
+        raise NotImplementedError
+
+    def _missing_static_fields(self, device_index: int,
+                               fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        cached = self._static_cache.get(device_index, dict())
+        return tuple(
+            field for field in ('identity',) + fields
+            if field in parser.STATIC_ATTRIBUTES and field not in cached
+        )
+
+    def _merge_static(self, device_dict: Dict, fields: Tuple[str, ...],
+                      static_fields: Tuple[str, ...]) -> None:
+        cached = self._static_cache.setdefault(device_dict['index'], dict())
+        for field in ('identity',) + fields:
+            if field not in parser.STATIC_ATTRIBUTES:
+                continue
+            section = device_dict if field == 'identity' else device_dict[field]
+            if field in static_fields:
+                cached[field] = {key: section[key] for key in parser.STATIC_ATTRIBUTES[field]}
+            else:
+                section.update(cached[field])
+
+
+class SMIBackend(Backend):
+    """
+    Backend based on the `pynvml.smi.nvidia_smi.DeviceQuery` interface.
+
+    Each query builds the nvidia-smi like dict for all devices, with the minimal filter list for
+    the desired sections, which is then parsed by `parser.parser_query_dict`. Since DeviceQuery
+    always reads every device, the cost of a single device query grows with the device count;
+    prefer the NVMLBackend when querying one device at a time.
+
+    Args:
+        smi_instance: The nvidia_smi instance. If None, the `nvidia_smi` singleton is used.
+    """
+
+    def __init__(self, smi_instance: Any = None) -> None:
+        Backend.__init__(self)
+        self._smi = smi_instance
+
+    @property
+    def smi(self) -> Any:
+        """nvidia_smi: Returns the nvidia_smi instance used by the backend."""
+        if self._smi is None:
+            from pynvml.smi import nvidia_smi #pylint: disable=import-outside-toplevel
+            self._smi = nvidia_smi.getInstance()
+        return self._smi
+
+    def device_count(self) -> int:
+        query = self.smi.DeviceQuery('count')
+        if query:
+            return int(query['count'])
+        return 0
+
+    def driver_version(self) -> Optional[str]:
+        query = self.smi.DeviceQuery('driver_version')
+        if query:
+            return query['driver_version']
+        return None
+
+    def _query(self, device_index: int, fields: Tuple[str, ...],
+               static_fields: Tuple[str, ...]) -> Optional[Dict]:
+        query_dict = parser.get_query_dict(parser.query_filters(fields, static_fields), self.smi)
+        return parser.parser_query_dict(device_index, query_dict, fields, static_fields)
+
+    def query_all(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        fields = parser.check_fields(fields)
+        static_fields: Tuple[str, ...] = tuple()
+        for device_index in range(self.device_count()):
+            static_fields += self._missing_static_fields(device_index, fields)
+        static_fields = tuple(set(static_fields))
+        query_dict = parser.get_query_dict(parser.query_filters(fields, static_fields), self.smi)
+        ret = list()
+        for device_index in range(len(query_dict.get('gpu', list()))):
+            device_dict = parser.parser_query_dict(device_index, query_dict, fields, static_fields)
+            self._merge_static(igpu_metrics.normalize(device_dict), fields, static_fields)
+            ret.append(device_dict)
+        return ret
+
+
+class NVMLBackend(Backend):
+    """
+    Backend that calls the NVML functions directly.
+
+    The device attributes are read with the NVML device functions (nvmlDeviceGetMemoryInfo,
+    nvmlDeviceGetUtilizationRates, and so on) and written straight into the parsed device dict,
+    skipping the nvidia-smi like dict built by `DeviceQuery`. Errors are reported in the same way
+    as the SMI backend: "N/A" for unsupported attributes and the NVML error string otherwise.
+
+    The NVML library and the device handles are managed by a `Session`. When NVML reports that
+    it was reset, the session is refreshed, the cached immutable attributes are cleared and the
+    query is retried once.
+
+    Args:
+        nvml: The NVML module. If given, the backend creates its own Session with this module.
+            Any object exposing the same functions and constants can be used, e.g.
+            `igpu.fake.FakeNVML`.
+        session (Session): The NVML session. If neither `nvml` nor `session` are given, the
+            current session (see `session.get_session`) is used.
+    """
+
+    def __init__(self, nvml: Any = None, session: Optional[Session] = None) -> None:
+        Backend.__init__(self)
+        if session is None and nvml is not None:
+            session = Session(nvml)
+        self._session = session
+        self._session_key: Optional[Tuple[int, int]] = None
+
+    @property
+    def session(self) -> Session:
+        """Session: Returns the NVML session used by the backend."""
+        if self._session is None:
+            return get_session()
+        return self._session
+
+    @property
+    def nvml(self) -> Any:
+        """module: Returns the NVML module, opening the session on the first access."""
+        return self.session.nvml
+
+    def _sync_session(self) -> Session:
+        session = self.session
+        session_key = (id(session), session.generation)
+        if session_key != self._session_key:
+            self.clear_cache()
+            self._session_key = session_key
+        return session
+
+    def _call(self, func, *args) -> Any:
+        try:
+            return func(*args)
+        except self.nvml.NVMLError as err:
+            if self.session.is_reset_error(err):
+                raise
+            if err.value == self.nvml.NVML_ERROR_NOT_SUPPORTED:
+                return 'N/A'
+            return str(err)
+
+    @staticmethod
+    def _str(value: Any) -> Any:
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        return value
+
+    def device_count(self) -> int:
+        return self._sync_session().device_count()
+
+    def index_from_uuid(self, uuid: str) -> Optional[int]:
+        return self._sync_session().index_from_uuid(uuid)
+
+    def driver_version(self) -> Optional[str]:
+        return self._str(self.nvml.nvmlSystemGetDriverVersion())
+
+    def query(self, device_index: int, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        session = self._sync_session()
+        try:
+            return Backend.query(self, device_index, fields)
+        except session.nvml.NVMLError as err:
+            if not session.is_reset_error(err):
+                raise
+            session.refresh()
+            self._sync_session()
+            return Backend.query(self, device_index, fields)
+
+    def read_metrics(self, device_index: int, metrics: Sequence[str], out: Any) -> bool:
+        session = self._sync_session()
+        try:
+            return self._read_metrics(session, device_index, metrics, out)
+        except session.nvml.NVMLError as err:
+            if not session.is_reset_error(err):
+                raise
+            session.refresh()
+            self._sync_session()
+            return self._read_metrics(session, device_index, metrics, out)
+
+    def _with_session(self, func, *args) -> Any:
+        """Calls `func(session, *args)`, refreshing the session and retrying once on reset."""
+        session = self._sync_session()
+        try:
+            return func(session, *args)
+        except session.nvml.NVMLError as err:
+            if not session.is_reset_error(err):
+                raise
+            session.refresh()
+            self._sync_session()
+            return func(session, *args)
+
+    def compute_processes(self, device_index: int) -> Optional[List[Tuple[int, float]]]:
+        return self._with_session(self._compute_processes, device_index)
+
+    @staticmethod
+    def _compute_processes(session: Session,
+                           device_index: int) -> Optional[List[Tuple[int, float]]]:
+        handle = session.handle(device_index)
+        if handle is None:
+            return None
+        try:
+            processes = session.nvml.nvmlDeviceGetComputeRunningProcesses(handle)
+        except session.nvml.NVMLError as err:
+            if session.is_reset_error(err):
+                raise
+            return list()
+        return [
+            (process.pid,
+             0 if process.usedGpuMemory is None else int(process.usedGpuMemory / 1024 / 1024))
+            for process in processes
+        ]
+
+    def process_utilization(self, device_index: int,
+                            since: int = 0) -> Optional[List[Tuple[int, int, float, float]]]:
+        return self._with_session(self._process_utilization, device_index, since)
+
+    @staticmethod
+    def _process_utilization(session: Session, device_index: int,
+                             since: int) -> Optional[List[Tuple[int, int, float, float]]]:
+        handle = session.handle(device_index)
+        if handle is None:
+            return None
+        nvml = session.nvml
+        try:
+            samples = nvml.nvmlDeviceGetProcessUtilization(handle, since)
+        except AttributeError:
+            return None
+        except nvml.NVMLError as err:
+            if session.is_reset_error(err):
+                raise
+            # No sample after `since` is reported as NOT_FOUND (or as a SUCCESS error by pynvml).
+            if err.value in (nvml.NVML_SUCCESS, nvml.NVML_ERROR_NOT_FOUND):
+                return list()
+            return None
+        return [(sample.pid, sample.timeStamp, float(sample.smUtil), float(sample.memUtil))
+                for sample in samples]
+
+    def topology_level(self, device_a: int, device_b: int) -> Optional[int]:
+        self._sync_session()
+        return Backend.topology_level(self, device_a, device_b)
+
+    def _topology_level(self, device_a: int, device_b: int) -> Optional[int]:
+        session = self.session
+        handle_a, handle_b = session.handle(device_a), session.handle(device_b)
+        if handle_a is None or handle_b is None:
+            return None
+        try:
+            return session.nvml.nvmlDeviceGetTopologyCommonAncestor(handle_a, handle_b)
+        except AttributeError:
+            return None
+        except session.nvml.NVMLError as err:
+            if session.is_reset_error(err):
+                raise
+            return None
+
+    def _read_metrics(self, session: Session, device_index: int, metrics: Sequence[str],
+                      out: Any) -> bool:
+        #pylint: disable=too-many-branches
+        handle = session.handle(device_index)
+        if handle is None:
+            return False
+        nvml = session.nvml
+        memory_info = rates = None
+        for position, name in enumerate(metrics):
+            try:
+                if name.startswith('memory.'):
+                    if memory_info is None:
+                        memory_info = nvml.nvmlDeviceGetMemoryInfo(handle)
+                    if name == 'memory.total':
+                        value = memory_info.total / 1024 / 1024
+                    elif name == 'memory.used':
+                        value = memory_info.used / 1024 / 1024
+                    else:
+                        value = (memory_info.total - memory_info.used) / 1024 / 1024
+                elif name in ('utilization.gpu', 'utilization.memory'):
+                    if rates is None:
+                        rates = nvml.nvmlDeviceGetUtilizationRates(handle)
+                    value = rates.gpu if name == 'utilization.gpu' else rates.memory
+                elif name == 'utilization.fan':
+                    value = nvml.nvmlDeviceGetFanSpeed(handle)
+                elif name == 'utilization.temperature':
+                    value = nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU)
+                elif name == 'clocks.graphics':
+                    value = nvml.nvmlDeviceGetClockInfo(handle, nvml.NVML_CLOCK_GRAPHICS)
+                elif name == 'clocks.sm':
+                    value = nvml.nvmlDeviceGetClockInfo(handle, nvml.NVML_CLOCK_SM)
+                elif name == 'clocks.memory':
+                    value = nvml.nvmlDeviceGetClockInfo(handle, nvml.NVML_CLOCK_MEM)
+                elif name == 'power.draw':
+                    value = nvml.nvmlDeviceGetPowerUsage(handle) / 1000.0
+                elif name == 'power.limit':
+                    value = nvml.nvmlDeviceGetPowerManagementLimit(handle) / 1000.0
+                else:
+                    raise ValueError(f'Invalid metric: {name}')
+            except nvml.NVMLError as err:
+                if session.is_reset_error(err):
+                    raise
+                value = float('NaN')
+            out[position] = value
+        return True
+
+    def _query(self, device_index: int, fields: Tuple[str, ...],
+               static_fields: Tuple[str, ...]) -> Optional[Dict]:
+        session = self.session
+        nvml = session.nvml
+        handle = session.handle(device_index)
+        if handle is None:
+            return None
+
+        parsed_dict: Dict[str, Any] = dict()
+        parsed_dict['index'] = device_index
+        if 'identity' in static_fields:
+            parsed_dict['name'] = self._str(self._call(nvml.nvmlDeviceGetName, handle))
+            parsed_dict['serial'] = self._str(self._call(nvml.nvmlDeviceGetSerial, handle))
+            parsed_dict['uuid'] = self._str(self._call(nvml.nvmlDeviceGetUUID, handle))
+            parsed_dict['bios'] = self._str(self._call(nvml.nvmlDeviceGetVbiosVersion, handle))
+
+        for field in fields:
+            parsed_dict[field] = getattr(self, f'_{field}')(handle, field in static_fields)
+        return parsed_dict
+
+    def _memory(self, handle: Any, _static: bool) -> Dict:
+        mem_info = self._call(self.nvml.nvmlDeviceGetMemoryInfo, handle)
+        if isinstance(mem_info, str):
+            total = used = free = mem_info
+        else:
+            total = mem_info.total / 1024 / 1024
+            used = mem_info.used / 1024 / 1024
+            free = total - used
+        return {'total': total, 'used': used, 'free': free, 'unit': 'MiB'}
+
+    def _utilization(self, handle: Any, _static: bool) -> Dict:
+        nvml = self.nvml
+        rates = self._call(nvml.nvmlDeviceGetUtilizationRates, handle)
+        if isinstance(rates, str):
+            gpu = memory = rates
+        else:
+            gpu, memory = rates.gpu, rates.memory
+        pstate = self._call(nvml.nvmlDeviceGetPowerState, handle)
+        return {
+            'gpu': gpu,
+            'memory': memory,
+            'fan': self._call(nvml.nvmlDeviceGetFanSpeed, handle),
+            'performance': pstate if isinstance(pstate, str) else f'P{pstate}',
+            'temperature': self._call(nvml.nvmlDeviceGetTemperature, handle,
+                                      nvml.NVML_TEMPERATURE_GPU),
+        }
+
+    def _pci(self, handle: Any, static: bool) -> Dict:
+        nvml = self.nvml
+        current_width = self._call(nvml.nvmlDeviceGetCurrPcieLinkWidth, handle)
+        pci_dict = {
+            'current_link_generation': str(
+                self._call(nvml.nvmlDeviceGetCurrPcieLinkGeneration, handle)),
+            'current_link_width': current_width if isinstance(current_width, str)
+                                  else f'{current_width}x',
+        }
+        if static:
+            pci_info = self._call(nvml.nvmlDeviceGetPciInfo, handle)
+            max_width = self._call(nvml.nvmlDeviceGetMaxPcieLinkWidth, handle)
+            if isinstance(pci_info, str):
+                pci_dict.update(dict.fromkeys(
+                    ('bus', 'bus_id', 'device', 'device_id', 'sub_system_id'), 'N/A'))
+            else:
+                pci_dict.update({
+                    'bus': f'{pci_info.bus:02X}',
+                    'bus_id': self._str(pci_info.busId),
+                    'device': f'{pci_info.device:02X}',
+                    'device_id': f'{pci_info.pciDeviceId:08X}',
+                    'sub_system_id': f'{pci_info.pciSubSystemId:08X}',
+                })
+            pci_dict.update({
+                'max_link_generation': str(
+                    self._call(nvml.nvmlDeviceGetMaxPcieLinkGeneration, handle)),
+                'max_link_width': max_width if isinstance(max_width, str) else f'{max_width}x',
+            })
+        return pci_dict
+
+    def _clocks(self, handle: Any, static: bool) -> Dict:
+        nvml = self.nvml
+        clocks_dict = {
+            'graphics': self._call(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_GRAPHICS),
+            'sm': self._call(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_SM),
+            'memory': self._call(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_MEM),
+            'unit': 'MHz',
+        }
+        if static:
+            clocks_dict.update({
+                'max_graphics': self._call(nvml.nvmlDeviceGetMaxClockInfo, handle,
+                                           nvml.NVML_CLOCK_GRAPHICS),
+                'max_sm': self._call(nvml.nvmlDeviceGetMaxClockInfo, handle, nvml.NVML_CLOCK_SM),
+                'max_memory': self._call(nvml.nvmlDeviceGetMaxClockInfo, handle,
+                                         nvml.NVML_CLOCK_MEM),
+            })
+        return clocks_dict
+
+    def _power(self, handle: Any, static: bool) -> Dict:
+        nvml = self.nvml
+        management = self._call(nvml.nvmlDeviceGetPowerManagementMode, handle)
+        draw = self._call(nvml.nvmlDeviceGetPowerUsage, handle)
+        limit = self._call(nvml.nvmlDeviceGetPowerManagementLimit, handle)
+        if not isinstance(management, str):
+            management = 'Supported' if management != 0 else 'N/A'
+        power_dict = {
+            'management': management,
+            'draw': draw if isinstance(draw, str) else draw / 1000.0,
+            'limit': limit if isinstance(limit, str) else limit / 1000.0,
+            'unit': 'W',
+        }
+        if static:
+            constraints = self._call(nvml.nvmlDeviceGetPowerManagementLimitConstraints, handle)
+            if isinstance(constraints, str):
+                power_dict['min_limit'] = power_dict['max_limit'] = constraints
+            else:
+                power_dict['min_limit'] = constraints[0] / 1000.0
+                power_dict['max_limit'] = constraints[1] / 1000.0
+        return power_dict
+
+    def _processes(self, handle: Any, _static: bool) -> Optional[List[Dict]]:
+        try:
+            processes = self.nvml.nvmlDeviceGetComputeRunningProcesses(handle)
+        except self.nvml.NVMLError as err:
+            if self.session.is_reset_error(err):
+                raise
+            return None
+        if not processes:
+            return None
+        return parser.processes_info(
+            (process.pid,
+             0 if process.usedGpuMemory is None else int(process.usedGpuMemory / 1024 / 1024))
+            for process in processes
+        ) or None
+
+
+__BACKEND: Optional[Backend] = None
+
+
+def get_backend() -> Backend:
+    """
+    Returns the backend used by the igpu functions. If no backend has been set, a NVMLBackend
+    is created on the first call.
+
+    Returns:
+        Backend: The current backend.
+    """
+    global __BACKEND #pylint: disable=global-statement
+    if __BACKEND is None:
+        __BACKEND = NVMLBackend()
+    return __BACKEND
+
+
+def set_backend(backend: Backend) -> None:
+    """
+    Sets the backend used by the igpu functions.
+
+    Args:
+        backend (Backend): The new backend, e.g. `NVMLBackend(FakeNVML(device_count=8))`.
+    """
+    global __BACKEND #pylint: disable=global-statement
+    __BACKEND = backend
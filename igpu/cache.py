@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu query cache
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import time
+import threading
+from typing import Dict, List, Optional, Any, Iterable, Tuple, Union, Callable, Hashable
+from igpu import parser
+from igpu.backend import Backend, get_backend
+
+# The cached groups: the device identification and the GPUInfo sections.
+CACHE_GROUPS = ('identity',) + parser.FIELDS
+
+# The default max-age of each group, in seconds. None means forever.
+DEFAULT_MAX_AGE: Dict[str, Optional[float]] = dict(
+    {field: 1.0 for field in parser.FIELDS}, identity=None
+)
+
+
+class _Flight(object):
+    """A query in flight, shared by all callers of the same key."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CachedBackend(Backend):
+    """
+    Backend wrapper which caches the query results of another backend.
+
+    Each section of each device is cached with its own max-age, so several consumers calling
+    `igpu.devices()` or `igpu.get_device()` share the same NVML reads. Only the expired sections
+    are queried again. Concurrent callers of the same query are deduplicated while it is in
+    flight (single-flight): one thread reads the devices and the others wait for its result.
+
+    In the `stale_ok` mode, an expired value is returned immediately while it is refreshed on a
+    background thread. Callers only block when there is no cached value at all.
+
+    The device count and the driver version are cached with the 'identity' max-age. The compute
+    processes and their utilization samples (see `igpu.Accountant`) are read from the wrapped
+    backend, uncached.
+
+    Args:
+        backend (Backend): The wrapped backend. If None, the current backend (see
+            `backend.get_backend`) at the creation time.
+        max_age (float or dict): The max-age, in seconds, of the cached values. A float applies
+            to all GPUInfo sections. A dict maps groups (see `CACHE_GROUPS`) to their max-age,
+            overriding `DEFAULT_MAX_AGE`. A max-age of None means forever.
+        stale_ok (bool): If True, returns expired values while they are refreshed.
+    """
+
+    def __init__(self, backend: Optional[Backend] = None,
+                 max_age: Union[float, Dict[str, Optional[float]]] = 1.0,
+                 stale_ok: bool = False) -> None:
+        Backend.__init__(self)
+        self._backend = get_backend() if backend is None else backend
+        self._max_age = self._check_max_age(max_age)
+        self.stale_ok = stale_ok
+        self.last_error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[Any, str], Tuple[float, Any]] = dict()
+        self._inflight: Dict[Hashable, _Flight] = dict()
+
+    @staticmethod
+    def _check_max_age(max_age: Union[float, Dict[str, Optional[float]]]) \
+            -> Dict[str, Optional[float]]:
+        ret = dict(DEFAULT_MAX_AGE)
+        if isinstance(max_age, dict):
+            invalid = set(max_age).difference(CACHE_GROUPS)
+            if invalid:
+                raise ValueError(f'Invalid cache groups: {sorted(invalid)}. '
+                                 f'Valid: {list(CACHE_GROUPS)}')
+            ret.update(max_age)
+        else:
+            ret.update({field: max_age for field in parser.FIELDS})
+        for group, age in ret.items():
+            if age is not None and age < 0:
+                raise ValueError(f'Invalid max-age for {group}: {age}')
+        return ret
+
+    @property
+    def backend(self) -> Backend:
+        """Backend: Returns the wrapped backend."""
+        return self._backend
+
+    @property
+    def max_age(self) -> Dict[str, Optional[float]]:
+        """dict: Returns the max-age of each cached group, in seconds."""
+        return dict(self._max_age)
+
+    def clear_cache(self) -> None:
+        """
+        Clears all cached values, and the immutable attributes cached by the wrapped backend.
+        """
+        with self._lock:
+            self._entries.clear()
+        self._backend.clear_cache()
+
+    def device_count(self) -> int:
+        return self._cached_global('device_count', self._backend.device_count)
+
+    def driver_version(self) -> Optional[str]:
+        return self._cached_global('driver_version', self._backend.driver_version)
+
+    def index_from_uuid(self, uuid: str) -> Optional[int]:
+        with self._lock:
+            for (device_index, group), (_, identity) in self._entries.items():
+                if group == 'identity' and identity['uuid'] == uuid:
+                    return device_index
+        return self._backend.index_from_uuid(uuid)
+
+    def topology_level(self, device_a: int, device_b: int) -> Optional[int]:
+        return self._backend.topology_level(device_a, device_b)
+
+    def compute_processes(self, device_index: int) -> Optional[List[Tuple[int, float]]]:
+        return self._backend.compute_processes(device_index)
+
+    def process_utilization(self, device_index: int,
+                            since: int = 0) -> Optional[List[Tuple[int, int, float, float]]]:
+        # Not cached: each caller only asks for the samples after its own last one.
+        return self._backend.process_utilization(device_index, since)
+
+    def query(self, device_index: int, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        fields = parser.check_fields(fields)
+        entries, stale = self._lookup([device_index], fields)
+        if not stale:
+            return self._assemble(entries, device_index, fields)
+        refresh_fields = tuple(group for group in stale if group != 'identity')
+        key = (device_index, refresh_fields)
+        if self.stale_ok and None not in entries.values():
+            self._refresh_async(key, self._query, device_index, refresh_fields)
+            return self._assemble(entries, device_index, fields)
+        device_dict = self._single_flight(key, self._query, device_index, refresh_fields)
+        if device_dict is None:
+            return None
+        return self._assemble(entries, device_index, fields, device_dict)
+
+    def query_all(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        fields = parser.check_fields(fields)
+        devices = range(self.device_count())
+        entries, stale = self._lookup(devices, fields)
+        if not stale:
+            return [self._assemble(entries, device_index, fields) for device_index in devices]
+        refresh_fields = tuple(group for group in stale if group != 'identity')
+        key = ('all', refresh_fields)
+        if self.stale_ok and None not in entries.values():
+            self._refresh_async(key, self._query_all, refresh_fields)
+            return [self._assemble(entries, device_index, fields) for device_index in devices]
+        device_dicts = self._single_flight(key, self._query_all, refresh_fields)
+        return [
+            self._assemble(entries, device_dict['index'], fields, device_dict)
+            for device_dict in device_dicts
+        ]
+
+    def _query(self, device_index: int, fields: Tuple[str, ...]) -> Optional[Dict]:
+        timestamp = time.monotonic()
+        device_dict = self._backend.query(device_index, fields)
+        if device_dict is not None:
+            self._store(timestamp, device_dict, fields)
+        return device_dict
+
+    def _query_all(self, fields: Tuple[str, ...]) -> List[Dict]:
+        timestamp = time.monotonic()
+        device_dicts = self._backend.query_all(fields)
+        for device_dict in device_dicts:
+            self._store(timestamp, device_dict, fields)
+        return device_dicts
+
+    def _store(self, timestamp: float, device_dict: Dict, fields: Tuple[str, ...]) -> None:
+        device_index = device_dict['index']
+        identity = {key: value for key, value in device_dict.items() if key not in parser.FIELDS}
+        with self._lock:
+            self._entries[(device_index, 'identity')] = (timestamp, identity)
+            for field in fields:
+                self._entries[(device_index, field)] = (timestamp, device_dict[field])
+
+    def _fresh(self, group: str, entry: Optional[Tuple[float, Any]], now: float) -> bool:
+        if entry is None:
+            return False
+        max_age = self._max_age[group]
+        return max_age is None or now - entry[0] <= max_age
+
+    def _lookup(self, devices: Iterable[int], fields: Tuple[str, ...]) \
+            -> Tuple[Dict[Tuple[int, str], Optional[Tuple[float, Any]]], Tuple[str, ...]]:
+        """Returns the cached entries of the devices and the groups with expired entries."""
+        now = time.monotonic()
+        groups = ('identity',) + fields
+        with self._lock:
+            entries = {
+                (device_index, group): self._entries.get((device_index, group))
+                for device_index in devices for group in groups
+            }
+        stale = {group for (_, group), entry in entries.items()
+                 if not self._fresh(group, entry, now)}
+        return entries, tuple(group for group in groups if group in stale)
+
+    @staticmethod
+    def _assemble(entries: Dict, device_index: int, fields: Tuple[str, ...],
+                  device_dict: Optional[Dict] = None) -> Dict:
+        """
+        Builds a device dict from the fetched `device_dict` and the cached entries. The sections
+        are copied, since they are shared with the cache and the other callers, and the callers
+        may modify the returned dict (e.g. GPUInfo.update).
+        """
+        def section(group: str) -> Any:
+            if device_dict is not None and (group == 'identity' or group in device_dict):
+                return device_dict if group == 'identity' else device_dict[group]
+            return entries[(device_index, group)][1]
+
+        ret = {key: value for key, value in section('identity').items()
+               if key not in parser.FIELDS}
+        for field in fields:
+            value = section(field)
+            if isinstance(value, dict):
+                value = dict(value)
+            elif isinstance(value, list):
+                value = [dict(process_dict) for process_dict in value]
+            ret[field] = value
+        return ret
+
+    def _cached_global(self, name: str, func: Callable) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((None, name))
+        if self._fresh('identity', entry, now):
+            return entry[1]
+
+        def fetch() -> Any:
+            timestamp = time.monotonic()
+            value = func()
+            with self._lock:
+                self._entries[(None, name)] = (timestamp, value)
+            return value
+
+        if self.stale_ok and entry is not None:
+            self._refresh_async(name, fetch)
+            return entry[1]
+        return self._single_flight(name, fetch)
+
+    def _begin(self, key: Hashable) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._inflight[key] = _Flight()
+            return flight, True
+
+    def _run(self, key: Hashable, flight: _Flight, func: Callable, *args: Any) -> Any:
+        try:
+            flight.result = func(*args)
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+        return flight.result
+
+    def _single_flight(self, key: Hashable, func: Callable, *args: Any) -> Any:
+        flight, leader = self._begin(key)
+        if leader:
+            return self._run(key, flight, func, *args)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _refresh_async(self, key: Hashable, func: Callable, *args: Any) -> None:
+        flight, leader = self._begin(key)
+        if not leader:
+            return
+
+        def refresh() -> None:
+            try:
+                self._run(key, flight, func, *args)
+            except Exception as err: #pylint: disable=broad-except
+                self.last_error = err
+
+        threading.Thread(target=refresh, name='igpu-cache-refresh', daemon=True).start()
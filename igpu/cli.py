@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of the igpu command line interface
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime
+from typing import List, Optional, Sequence, TextIO
+import igpu
+from igpu import parser
+from igpu import metrics as igpu_metrics
+from igpu.backend import get_backend
+from igpu.columnar import snapshot
+from igpu.process import get_process_cache
+
+# The fastest refresh of the top mode, in seconds (10 Hz).
+MIN_INTERVAL = 0.1
+
+# The metrics shown by the top mode, read in a single columnar snapshot per frame.
+_METRICS = (
+    'memory.total', 'memory.used', 'utilization.gpu', 'utilization.memory', 'utilization.fan',
+    'utilization.temperature', 'clocks.sm', 'power.draw', 'power.limit',
+)
+
+_HEADER = (f'{"GPU":>3s}  {"Name":<20s}  {"Temp":>4s}  {"Fan":>4s}  {"SM MHz":>6s}  '
+           f'{"Power (W)":>11s}  {"Memory (MiB)":>15s}  {"GPU-Util":<18s}  {"Mem":>4s}')
+_PROCESS_HEADER = f'{"GPU":>3s}  {"PID":>7s}  {"User":<12s}  {"Memory":>10s}  Name'
+
+
+def _number(value: float, width: int, suffix: str = '') -> str:
+    if value != value:
+        return f'{"N/A":>{width}s}'
+    return f'{value:{width - len(suffix)}.0f}{suffix}'
+
+
+def _bar(percent: float, width: int = 10) -> str:
+    if percent != percent:
+        return f'{"N/A":<{width + 8}s}'
+    filled = int(min(max(percent, 0.0), 100.0) * width / 100.0 + 0.5)
+    return f'[{"|" * filled:<{width}s}] {percent:4.0f}%'
+
+
+def _clean(text: str, width: int) -> str:
+    """Returns the text without control characters, cut to the given width."""
+    return ''.join(char if char.isprintable() else '?' for char in text)[:width]
+
+
+class TopView(object):
+    """
+    Renders the devices as text lines, like nvidia-smi: a header, a line per device and,
+    optionally, a line per compute process.
+
+    The device names are read once; at each frame, the metrics of all devices are read in a
+    single columnar snapshot (see `igpu.snapshot`), written into the same array, and formatted
+    straight from it, without building GPUInfo objects.
+
+    Args:
+        devices (list): The device indexes. If None, all available devices.
+        processes (bool): If True, also lists the compute processes.
+    """
+
+    def __init__(self, devices: Optional[Sequence[int]] = None, processes: bool = True) -> None:
+        backend = get_backend()
+        if devices is None:
+            devices = range(backend.device_count())
+        self._devices = list(devices)
+        self._names = list()
+        for device_index in self._devices:
+            device_dict = backend.query(device_index, tuple())
+            if device_dict is None:
+                raise ValueError(f'Invalid device index: {device_index}')
+            self._names.append(_clean(device_dict['name'], 20))
+        self._processes = processes
+        self._driver_version = backend.driver_version()
+        self._array = snapshot(self._devices, _METRICS, backend=backend)
+
+    def lines(self) -> List[str]:
+        """
+        Reads the devices and returns the lines of a frame.
+
+        Returns:
+            list: The text lines.
+        """
+        backend = get_backend()
+        array = snapshot(self._devices, _METRICS, out=self._array, backend=backend)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        lines = [f'igpu {igpu.__version__}  |  Driver {self._driver_version}  |  {now}', '',
+                 _HEADER]
+        for row, name in zip(array.tolist(), self._names):
+            (index, total, used, gpu, memory, fan, temperature, clock, draw, limit) = row
+            lines.append(
+                f'{index:>3d}  {name:<20s}  {_number(temperature, 4, "C")}  '
+                f'{_number(fan, 4, "%")}  {_number(clock, 6)}  '
+                f'{_number(draw, 5)} / {_number(limit, 3)}  '
+                f'{_number(used, 6)} / {_number(total, 6)}  {_bar(gpu)}  {_number(memory, 4, "%")}')
+        if self._processes:
+            lines.extend(('', _PROCESS_HEADER))
+            process_cache = get_process_cache()
+            for device_index in self._devices:
+                processes = backend.compute_processes(device_index) or list()
+                for process in process_cache.lookup(processes):
+                    lines.append(
+                        f'{device_index:>3d}  {process["pid"]:>7d}  '
+                        f'{_clean(process["user"], 12):<12s}  '
+                        f'{process["gpu_memory"]:>6.0f} MiB  {_clean(process["name"], 40)}')
+        return lines
+
+
+class Screen(object):
+    """
+    A terminal screen redrawn by differences: each frame is compared with the previous one, and
+    only the changed span of each changed line is written, with ANSI cursor movements, in a
+    single write. The whole screen is only redrawn when the terminal is resized.
+
+    Args:
+        stream (file): The terminal stream.
+    """
+
+    def __init__(self, stream: TextIO = sys.stdout) -> None:
+        self._stream = stream
+        self._previous: List[str] = list()
+        self._size: Optional[os.terminal_size] = None
+
+    def __enter__(self) -> 'Screen':
+        # The alternate screen buffer, without the cursor.
+        self._stream.write('\x1b[?1049h\x1b[?25l')
+        self._stream.flush()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stream.write('\x1b[?25h\x1b[?1049l')
+        self._stream.flush()
+
+    def draw(self, lines: Sequence[str]) -> int:
+        """
+        Draws a frame.
+
+        Args:
+            lines (list): The text lines of the frame.
+
+        Returns:
+            int: The number of characters written, including the escape sequences.
+        """
+        size = shutil.get_terminal_size()
+        out = list()
+        if size != self._size:
+            self._size = size
+            self._previous = list()
+            out.append('\x1b[2J')
+        lines = [line[:size.columns] for line in lines[:size.lines]]
+        previous = self._previous
+        for row, line in enumerate(lines):
+            old = previous[row] if row < len(previous) else ''
+            if line == old:
+                continue
+            start = len(os.path.commonprefix((line, old)))
+            if len(line) == len(old):
+                end = len(line)
+                while end > start and line[end - 1] == old[end - 1]:
+                    end -= 1
+                out.append(f'\x1b[{row + 1};{start + 1}H{line[start:end]}')
+            else:
+                out.append(f'\x1b[{row + 1};{start + 1}H{line[start:]}\x1b[K')
+        for row in range(len(lines), len(previous)):
+            out.append(f'\x1b[{row + 1};1H\x1b[K')
+        self._previous = lines
+        text = ''.join(out)
+        if text:
+            self._stream.write(text)
+            self._stream.flush()
+        return len(text)
+
+
+def _devices_argument(value: str) -> List[int]:
+    try:
+        return [int(device_index) for device_index in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid device list: {value!r}')
+
+
+def _wait() -> None:
+    """Waits for Ctrl-C."""
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+def _top(args: argparse.Namespace) -> int:
+    if args.json:
+        fields = parser.check_fields(args.fields.split(',') if args.fields else None)
+        backend = get_backend()
+        devices = args.devices
+        if devices is None:
+            device_dicts = backend.query_all(fields)
+        else:
+            device_dicts = [backend.query(device_index, fields) for device_index in devices]
+            if None in device_dicts:
+                raise ValueError(f'Invalid device index: {devices[device_dicts.index(None)]}')
+        json.dump(igpu_metrics.json_safe({
+            'driver_version': backend.driver_version(),
+            'timestamp': time.time(),
+            'devices': device_dicts,
+        }), sys.stdout, indent=args.indent)
+        sys.stdout.write('\n')
+        return 0
+    view = TopView(args.devices, processes=not args.no_processes)
+    if args.once:
+        sys.stdout.write('\n'.join(view.lines()) + '\n')
+        return 0
+    with Screen() as screen:
+        next_time = time.monotonic()
+        try:
+            while True:
+                screen.draw(view.lines())
+                next_time += args.interval
+                now = time.monotonic()
+                if next_time < now:
+                    next_time = now
+                time.sleep(next_time - now)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def _agent(args: argparse.Namespace) -> int:
+    from igpu import cluster #pylint: disable=import-outside-toplevel
+    agent = cluster.start_agent(args.port, args.address, args.unix_socket, args.max_age)
+    target = args.unix_socket or f'{args.address or "0.0.0.0"}:{agent.port}'
+    print(f'igpu agent listening on {target} (Ctrl-C to stop)', file=sys.stderr)
+    _wait()
+    agent.stop()
+    return 0
+
+
+def _publish(args: argparse.Namespace) -> int:
+    from igpu import shm #pylint: disable=import-outside-toplevel
+    fields = args.fields.split(',') if args.fields else None
+    publisher = shm.publish(args.name, args.interval, fields)
+    print(f'igpu publishing to shared memory "{args.name}" (Ctrl-C to stop)', file=sys.stderr)
+    _wait()
+    publisher.close()
+    return 0
+
+
+def _interval_argument(value: str) -> float:
+    try:
+        interval = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid interval: {value!r}')
+    if interval < MIN_INTERVAL:
+        raise argparse.ArgumentTypeError(f'the interval must be at least {MIN_INTERVAL} seconds')
+    return interval
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns the argument parser of the `igpu` command.
+
+    Returns:
+        ArgumentParser: The parser.
+    """
+    main_parser = argparse.ArgumentParser(
+        prog='igpu', description='Shows the NVIDIA GPUs and their processes.')
+    main_parser.add_argument('--version', action='version', version=f'igpu {igpu.__version__}')
+    commands = main_parser.add_subparsers(dest='command')
+
+    top_parser = commands.add_parser(
+        'top', help='shows the devices, refreshing the screen (the default command)')
+    top_parser.add_argument('-n', '--interval', type=_interval_argument, default=1.0,
+                            help=f'the refresh interval, in seconds (at least {MIN_INTERVAL})')
+    top_parser.add_argument('-d', '--devices', type=_devices_argument, default=None,
+                            help='the comma-separated device indexes (default: all)')
+    top_parser.add_argument('--no-processes', action='store_true',
+                            help='does not list the compute processes')
+    top_parser.add_argument('--once', action='store_true',
+                            help='prints the devices once and exits')
+    top_parser.add_argument('--json', action='store_true',
+                            help='prints the parsed device dicts once, as JSON, and exits')
+    top_parser.add_argument('--fields', default=None,
+                            help=f'the comma-separated sections of --json (default: all of '
+                                 f'{",".join(parser.FIELDS)})')
+    top_parser.add_argument('--indent', type=int, default=None,
+                            help='the indentation of --json (default: compact)')
+    top_parser.set_defaults(func=_top)
+
+    agent_parser = commands.add_parser(
+        'agent', help='serves the devices to an igpu.cluster.Cluster')
+    agent_parser.add_argument('-p', '--port', type=int, default=9836)
+    agent_parser.add_argument('-a', '--address', default='')
+    agent_parser.add_argument('-u', '--unix-socket', default=None)
+    agent_parser.add_argument('--max-age', type=float, default=0.5)
+    agent_parser.set_defaults(func=_agent)
+
+    publish_parser = commands.add_parser(
+        'publish', help='publishes the devices to a shared memory segment')
+    publish_parser.add_argument('--name', default='igpu')
+    publish_parser.add_argument('-n', '--interval', type=float, default=0.5)
+    publish_parser.add_argument('--fields', default=None)
+    publish_parser.set_defaults(func=_publish)
+    return main_parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Runs the `igpu` command.
+
+    Args:
+        argv (list): The command line arguments. If None, `sys.argv[1:]`.
+
+    Returns:
+        int: The exit status.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    main_parser = build_parser()
+    if not argv or argv[0].startswith('-') and argv[0] not in ('-h', '--help', '--version'):
+        argv.insert(0, 'top')
+    args = main_parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as err: #pylint: disable=broad-except
+        # E.g. an invalid device index, or NVML (or the driver) not available.
+        print(f'igpu: {err}', file=sys.stderr)
+        return 1
@@ -0,0 +1,552 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu multi-host aggregation
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import json
+import math
+import time
+import socket
+import struct
+import threading
+import socketserver
+import http.client
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, List, Optional, Any, Iterable, NamedTuple, Tuple, Callable
+import numpy as np
+from igpu import parser
+from igpu import metrics as igpu_metrics
+from igpu.backend import Backend, get_backend
+from igpu.cache import _Flight
+from igpu.columnar import snapshot, snapshot_dtype
+
+DEFAULT_PORT = 9836
+JSON_CONTENT_TYPE = 'application/json'
+BINARY_CONTENT_TYPE = 'application/x-igpu-snapshot'
+
+# A binary snapshot is the length of a JSON header, the header and the rows of the snapshot
+# array, with the little-endian snapshot dtype.
+_LENGTH = struct.Struct('<I')
+
+
+def _wire_dtype(metrics: Iterable[str]) -> np.dtype:
+    return snapshot_dtype(metrics).newbyteorder('<')
+
+
+def encode_snapshot(array: np.ndarray, metrics: Iterable[str], host: str,
+                    timestamp: float) -> bytes:
+    """
+    Encodes a snapshot array (see `igpu.snapshot`) in the binary format of the agent.
+
+    Args:
+        array (ndarray): The snapshot array.
+        metrics (list): The metric names of the snapshot.
+        host (str): The host name.
+        timestamp (float): The snapshot time, in seconds since the epoch.
+
+    Returns:
+        bytes: The encoded snapshot.
+    """
+    metrics = list(metrics)
+    header = json.dumps({'host': host, 'timestamp': timestamp, 'metrics': metrics}).encode()
+    return _LENGTH.pack(len(header)) + header + array.astype(_wire_dtype(metrics)).tobytes()
+
+
+def decode_snapshot(data: bytes) -> Tuple[Dict, np.ndarray]:
+    """
+    Decodes a binary snapshot (see `encode_snapshot`).
+
+    Args:
+        data (bytes): The encoded snapshot.
+
+    Returns:
+        tuple: The header dict (host, timestamp and metrics) and the snapshot array.
+    """
+    length = _LENGTH.unpack_from(data)[0]
+    header = json.loads(data[_LENGTH.size:_LENGTH.size + length].decode())
+    array = np.frombuffer(data, dtype=_wire_dtype(header['metrics']),
+                          offset=_LENGTH.size + length)
+    return header, array.astype(snapshot_dtype(header['metrics']), copy=False)
+
+
+class _UnixHTTPServer(ThreadingHTTPServer):
+    """HTTP server bound to a Unix socket."""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self) -> None:
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class Agent(object):
+    """
+    A small HTTP server exposing the GPU state of the host to a `Cluster`, over TCP or a Unix
+    socket. The endpoints are:
+
+    * `/devices?fields=memory,processes` - The parsed device dicts of all devices (see
+      `Backend.query_all`), as JSON, with the missing values as null.
+    * `/snapshot?metrics=memory.used,power.draw` - The columnar snapshot of all devices (see
+      `igpu.snapshot`), in the compact binary format of `encode_snapshot`, or as JSON with
+      `format=json`.
+
+    Each response is kept for `max_age` seconds, so the concurrent requests of many clients
+    share a single query of the devices. The connections are kept alive between requests.
+
+    Args:
+        port (int): The TCP port. If 0, an ephemeral port is chosen (see `port`).
+        address (str): The address to bind. If empty, all interfaces.
+        unix_socket (str): If given, the path of a Unix socket which is bound instead of the
+            TCP port.
+        max_age (float): The maximum age of a response, in seconds.
+        backend (Backend): The queried backend. If None, the current backend.
+        host (str): The host name reported to the clients. If None, the name of the machine.
+    """
+
+    def __init__(self, port: int = DEFAULT_PORT, address: str = '',
+                 unix_socket: Optional[str] = None, max_age: float = 0.5,
+                 backend: Optional[Backend] = None, host: Optional[str] = None) -> None:
+        if max_age < 0:
+            raise ValueError(f'Invalid max age: {max_age}')
+        self._address = (address, port)
+        self._unix_socket = unix_socket
+        self._max_age = max_age
+        self._backend = backend
+        self._host = socket.gethostname() if host is None else host
+        self._lock = threading.Lock()
+        self._responses: Dict[Tuple, Tuple[float, str, bytes]] = dict()
+        self._inflight: Dict[Tuple, _Flight] = dict()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """int: Returns the TCP port the server is bound to (0 for a Unix socket)."""
+        if self._server is None:
+            return 0 if self._unix_socket else self._address[1]
+        return self._server.server_port
+
+    @property
+    def unix_socket(self) -> Optional[str]:
+        """str: Returns the path of the Unix socket, or None for a TCP server."""
+        return self._unix_socket
+
+    @property
+    def running(self) -> bool:
+        """bool: Returns True if the server is running."""
+        return self._server is not None
+
+    def respond(self, path: str) -> Tuple[str, bytes]:
+        """
+        Returns the response to a request, from the responses kept for `max_age` seconds.
+
+        The responses are kept by request (endpoint, sections or metrics in their canonical
+        order, and format), not by path, so the same request with another query string shares
+        the response, and the expired responses are dropped when a new one is kept. Concurrent
+        requests for the same expired response share a single query of the devices
+        (single-flight, as in `igpu.cache.CachedBackend`), while the other requests are served
+        meanwhile.
+
+        Args:
+            path (str): The request path, with its query string.
+
+        Returns:
+            tuple: The content type and the body of the response.
+        """
+        request = self._parse(path)
+        with self._lock:
+            response = self._responses.get(request)
+            if response is not None and time.monotonic() - response[0] <= self._max_age:
+                return response[1], response[2]
+            flight = self._inflight.get(request)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[request] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            timestamp = time.monotonic()
+            flight.result = self._render(request)
+            with self._lock:
+                now = time.monotonic()
+                self._responses = {key: value for key, value in self._responses.items()
+                                   if now - value[0] <= self._max_age}
+                self._responses[request] = (timestamp,) + flight.result
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[request]
+            flight.done.set()
+        return flight.result
+
+    @staticmethod
+    def _parse(path: str) -> Tuple[str, Tuple[str, ...], str]:
+        """
+        Returns the validated (endpoint, sections or metrics, format) of a request. Without a
+        `fields` or `metrics` parameter, all sections or metrics are returned; an empty one
+        means none.
+        """
+        url = urlsplit(path)
+        query = {key: values[-1]
+                 for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+        if url.path == '/devices':
+            fields = query.get('fields')
+            if fields is not None:
+                fields = [field for field in fields.split(',') if field]
+            return url.path, parser.check_fields(fields), 'json'
+        if url.path == '/snapshot':
+            metrics = query.get('metrics')
+            if metrics is not None:
+                metrics = [metric for metric in metrics.split(',') if metric]
+            response_format = 'binary' if query.get('format', 'binary') == 'binary' else 'json'
+            return url.path, igpu_metrics.check_metrics(metrics), response_format
+        raise LookupError(url.path)
+
+    def _render(self, request: Tuple[str, Tuple[str, ...], str]) -> Tuple[str, bytes]:
+        endpoint, names, response_format = request
+        backend = get_backend() if self._backend is None else self._backend
+        timestamp = time.time()
+        if endpoint == '/devices':
+            body = {'host': self._host, 'timestamp': timestamp,
+                    'devices': igpu_metrics.json_safe(backend.query_all(names))}
+            return JSON_CONTENT_TYPE, json.dumps(body).encode()
+        array = snapshot(metrics=names, backend=backend)
+        if response_format == 'binary':
+            return BINARY_CONTENT_TYPE, encode_snapshot(array, names, self._host, timestamp)
+        body = {
+            'host': self._host, 'timestamp': timestamp, 'metrics': list(names),
+            'devices': array['index'].tolist(),
+            'values': [[None if math.isnan(value) else value for value in row]
+                       for row in array[list(names)].tolist()],
+        }
+        return JSON_CONTENT_TYPE, json.dumps(body).encode()
+
+    def start(self) -> 'Agent':
+        """
+        Starts the HTTP server.
+
+        Returns:
+            Agent: The agent itself.
+        """
+        if self.running:
+            return self
+        if self._unix_socket:
+            if os.path.exists(self._unix_socket):
+                os.unlink(self._unix_socket)
+            self._server = _UnixHTTPServer(self._unix_socket, _handler(self))
+        else:
+            self._server = ThreadingHTTPServer(self._address, _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='igpu-agent',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the HTTP server.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if self._unix_socket and os.path.exists(self._unix_socket):
+                os.unlink(self._unix_socket)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'Agent':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+def _handler(agent: Agent) -> type:
+    """Returns the request handler class serving the agent responses."""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Serves the agent endpoints."""
+
+        protocol_version = 'HTTP/1.1'
+        # The headers and the body are sent by separate writes, which must not wait for the
+        # delayed acknowledgement of the client on a kept-alive connection.
+        disable_nagle_algorithm = agent.unix_socket is None
+
+        def do_GET(self) -> None: #pylint: disable=invalid-name
+            """Handles a GET request."""
+            try:
+                content_type, body = agent.respond(self.path)
+                status = 200
+            except LookupError:
+                content_type, body, status = 'text/plain', b'Not Found', 404
+            except ValueError as err:
+                content_type, body, status = 'text/plain', str(err).encode(), 400
+            except Exception as err: #pylint: disable=broad-except
+                content_type, body, status = 'text/plain', repr(err).encode(), 500
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self) -> str:
+            return str(self.client_address[0]) if self.client_address else 'unix'
+
+        def log_message(self, *args) -> None: #pylint: disable=arguments-differ
+            pass
+
+    return Handler
+
+
+def start_agent(port: int = DEFAULT_PORT, address: str = '', unix_socket: Optional[str] = None,
+                max_age: float = 0.5, backend: Optional[Backend] = None,
+                host: Optional[str] = None) -> Agent:
+    """
+    Creates and starts an Agent. See `Agent` for the arguments.
+
+    Returns:
+        Agent: The running agent.
+    """
+    return Agent(port, address, unix_socket, max_age, backend, host).start()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path: str, timeout: float) -> None:
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class HostResult(NamedTuple):
+    """
+    The result of a host.
+
+    Attributes:
+        host (str): The host, as given to the Cluster.
+        value: The decoded response: the list of parsed device dicts for `Cluster.devices`, or
+            the snapshot array for `Cluster.snapshot`. None if the request failed.
+        error (str): The error message, or None if the request succeeded.
+        latency (float): The duration of the request, in seconds.
+        timestamp (float): The time of the query on the host, in seconds since the epoch.
+    """
+    host: str
+    value: Any = None
+    error: Optional[str] = None
+    latency: float = float('NaN')
+    timestamp: float = float('NaN')
+
+    @property
+    def ok(self) -> bool: #pylint: disable=invalid-name
+        """bool: Returns True if the request succeeded."""
+        return self.error is None
+
+
+class Cluster(object):
+    """
+    Client collecting the GPU state of many hosts, each running an `Agent`.
+
+    The hosts are queried in parallel by a pool of threads, over persistent (keep-alive)
+    connections reused between collects. Each collect waits at most `timeout` seconds: the
+    hosts which did not answer in time, or failed, are reported in their `HostResult.error`,
+    and the results of the other hosts are returned anyway.
+
+    The device dicts are the ones of the remote hosts; building a GPUInfo from them is not
+    supported, since a GPUInfo loads its missing sections from the local backend.
+
+    Args:
+        hosts (list): The hosts, as 'name', 'name:port' or '[ipv6]:port' for TCP agents (the
+            default port is `DEFAULT_PORT`), or as 'unix:/path' or '/path' for Unix socket
+            agents.
+        timeout (float): The timeout of each collect, in seconds.
+        max_workers (int): The maximum number of hosts queried at the same time.
+    """
+
+    def __init__(self, hosts: Iterable[str], timeout: float = 2.0, max_workers: int = 64) -> None:
+        if timeout <= 0:
+            raise ValueError(f'Invalid timeout: {timeout}')
+        self._hosts = list(hosts)
+        self._addresses = {host: self._parse(host) for host in self._hosts}
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(self._hosts))),
+            thread_name_prefix='igpu-cluster')
+        self._lock = threading.Lock()
+        self._connections: Dict[str, List[http.client.HTTPConnection]] = dict()
+
+    @staticmethod
+    def _parse(host: str) -> Tuple[Optional[str], Any]:
+        if host.startswith('unix:'):
+            return None, host[len('unix:'):]
+        if host.startswith('/'):
+            return None, host
+        url = urlsplit(f'//{host}')
+        if not url.hostname:
+            raise ValueError(f'Invalid host: {host}')
+        return url.hostname, url.port or DEFAULT_PORT
+
+    @property
+    def hosts(self) -> List[str]:
+        """list: Returns the hosts."""
+        return list(self._hosts)
+
+    @property
+    def timeout(self) -> float:
+        """float: Returns the timeout of each collect, in seconds."""
+        return self._timeout
+
+    def _connect(self, host: str) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            connections = self._connections.get(host)
+            if connections:
+                return connections.pop(), True
+        hostname, address = self._addresses[host]
+        if hostname is None:
+            return _UnixHTTPConnection(address, self._timeout), False
+        return http.client.HTTPConnection(hostname, address, timeout=self._timeout), False
+
+    def _release(self, host: str, connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._connections.setdefault(host, list()).append(connection)
+
+    def _get(self, host: str, path: str) -> Tuple[str, bytes]:
+        while True:
+            connection, reused = self._connect(host)
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                # A kept-alive connection closed by the agent is retried on a new connection.
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(host, connection)
+            if response.status != 200:
+                raise ValueError(f'HTTP {response.status}: {body.decode(errors="replace")}')
+            return response.getheader('Content-Type', ''), body
+
+    def _fetch(self, host: str, path: str, decode: Callable[[str, bytes], Tuple[float, Any]],
+               start: float) -> HostResult:
+        try:
+            content_type, body = self._get(host, path)
+            timestamp, value = decode(content_type, body)
+        except Exception as err: #pylint: disable=broad-except
+            return HostResult(host, error=f'{type(err).__name__}: {err}',
+                              latency=time.monotonic() - start)
+        return HostResult(host, value, latency=time.monotonic() - start, timestamp=timestamp)
+
+    def _collect(self, path: str,
+                 decode: Callable[[str, bytes], Tuple[float, Any]]) -> Dict[str, HostResult]:
+        start = time.monotonic()
+        futures = {host: self._executor.submit(self._fetch, host, path, decode, start)
+                   for host in self._hosts}
+        wait(futures.values(), timeout=self._timeout)
+        ret = dict()
+        for host, future in futures.items():
+            if future.done():
+                ret[host] = future.result()
+            else:
+                future.cancel()
+                ret[host] = HostResult(host, error=f'Timeout after {self._timeout}s',
+                                       latency=time.monotonic() - start)
+        return ret
+
+    def devices(self, fields: Optional[Iterable[str]] = None) -> Dict[str, HostResult]:
+        """
+        Collects the parsed device dicts of all hosts.
+
+        Args:
+            fields (list): The desired sections, a subset of `parser.FIELDS`. If None, all
+                sections are queried; if empty, only the identification attributes.
+
+        Returns:
+            dict: The HostResult of each host, whose value is the list of device dicts.
+        """
+        path = '/devices'
+        if fields is not None:
+            path += f'?fields={",".join(parser.check_fields(fields))}'
+
+        def decode(_, body: bytes) -> Tuple[float, Any]:
+            data = json.loads(body.decode())
+            return data['timestamp'], [igpu_metrics.normalize(device_dict)
+                                       for device_dict in data['devices']]
+
+        return self._collect(path, decode)
+
+    def snapshot(self, metrics: Optional[Iterable[str]] = None,
+                 encoding: str = 'binary') -> Dict[str, HostResult]:
+        """
+        Collects the columnar snapshot of all hosts (see `igpu.snapshot`).
+
+        Args:
+            metrics (list): The metric names (see `igpu.metrics.METRIC_NAMES`). If None, all
+                metrics.
+            encoding (str): The transfer encoding, 'binary' (compact) or 'json'.
+
+        Returns:
+            dict: The HostResult of each host, whose value is the snapshot array.
+        """
+        if encoding not in ('binary', 'json'):
+            raise ValueError(f'Invalid encoding: {encoding}')
+        path = f'/snapshot?format={encoding}'
+        if metrics is not None:
+            path += f'&metrics={",".join(igpu_metrics.check_metrics(metrics))}'
+
+        def decode(content_type: str, body: bytes) -> Tuple[float, Any]:
+            if content_type.startswith(BINARY_CONTENT_TYPE):
+                header, array = decode_snapshot(body)
+                return header['timestamp'], array
+            data = json.loads(body.decode())
+            array = np.empty(len(data['devices']), dtype=snapshot_dtype(data['metrics']))
+            array['index'] = data['devices']
+            for column, name in enumerate(data['metrics']):
+                array[name] = [float('NaN') if row[column] is None else row[column]
+                               for row in data['values']]
+            return data['timestamp'], array
+
+        return self._collect(path, decode)
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections and stops the worker threads.
+        """
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            for connections in self._connections.values():
+                for connection in connections:
+                    connection.close()
+            self._connections = dict()
+
+    def __enter__(self) -> 'Cluster':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
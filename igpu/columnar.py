@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu columnar snapshots
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+from typing import Optional, Iterable
+import numpy as np
+from igpu import metrics as igpu_metrics
+from igpu.backend import Backend, get_backend
+
+
+def snapshot_dtype(metrics: Optional[Iterable[str]] = None) -> np.dtype:
+    """
+    Returns the structured dtype of a snapshot: an int32 'index' column followed by one float64
+    column per metric.
+
+    Args:
+        metrics (list): The metric names (see `igpu.metrics.METRIC_NAMES`). If None, all metrics.
+
+    Returns:
+        dtype: The snapshot dtype.
+    """
+    metrics = igpu_metrics.check_metrics(metrics)
+    return np.dtype([('index', np.int32)] + [(name, np.float64) for name in metrics])
+
+
+def snapshot(devices: Optional[Iterable[int]] = None, metrics: Optional[Iterable[str]] = None,
+             out: Optional[np.ndarray] = None,
+             backend: Optional[Backend] = None) -> np.ndarray:
+    """
+    Returns the numeric metrics of the devices as a structured NumPy array, with one row per
+    device and one typed column per metric (see `snapshot_dtype`). The values are read by the
+    backend straight into the array, without building GPUInfo objects. Missing values are NaN.
+
+    Args:
+        devices (list): The device indexes. If None, all available devices.
+        metrics (list): The metric names (see `igpu.metrics.METRIC_NAMES`). If None, all metrics.
+        out (ndarray): An array, with the snapshot dtype and one row per device, where the
+            snapshot is written. Reusing the same array avoids the allocation on each call.
+        backend (Backend): The queried backend. If None, the current backend.
+
+    Returns:
+        ndarray: The snapshot array.
+    """
+    if backend is None:
+        backend = get_backend()
+    metrics = igpu_metrics.check_metrics(metrics)
+    if devices is None:
+        devices = range(backend.device_count())
+    devices = list(devices)
+
+    dtype = snapshot_dtype(metrics)
+    if out is None:
+        out = np.empty(len(devices), dtype=dtype)
+    elif out.dtype != dtype or out.shape != (len(devices),):
+        raise ValueError(f'Invalid output array: expected shape {(len(devices),)} and dtype '
+                         f'{dtype}, got shape {out.shape} and dtype {out.dtype}')
+
+    values = np.empty((len(devices), len(metrics)))
+    for row, device_index in enumerate(devices):
+        if not backend.read_metrics(device_index, metrics, values[row]):
+            raise ValueError(f'Invalid device index: {device_index}')
+    out['index'] = devices
+    for column, name in enumerate(metrics):
+        out[name] = values[:, column]
+    return out
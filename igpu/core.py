@@ -8,11 +8,13 @@ Implementation of igpu core
 """
 
 import os
-from typing import Tuple, List, Optional
-from pynvml.smi import nvidia_smi as smi
-from igpu import parser
+from typing import Tuple, List, Optional, Iterable, Union
+from igpu.backend import get_backend
 from igpu.gpu_info import GPUInfo
 
+# The length of a device UUID, e.g. 'GPU-2b8d3a4c-5f29-bd3a-ac4f-d9bc1ae0c1c7'.
+_UUID_LENGTH = 40
+
 def count_devices() -> int:
     """
     Returns the number of available GPU devices installed on the host.
@@ -20,10 +22,7 @@ def count_devices() -> int:
     Returns:
         int: The number of available devices.
     """
-    query = smi.getInstance().DeviceQuery('count')
-    if query:
-        return int(query['count'])
-    return 0
+    return get_backend().device_count()
 
 
 def count_visible_devices() -> int:
@@ -44,24 +43,74 @@ def devices_index() -> List[int]:
     Returns:
         list: A list with all available devices index.
     """
-    query = smi.getInstance().DeviceQuery('index')
-    if query:
-        return list(range(len(query['gpu'])))
-    return list()
+    return list(range(get_backend().device_count()))
+
+
+def resolve_visible_devices(value: Optional[str]) -> List[int]:
+    """
+    Resolves a CUDA_VISIBLE_DEVICES value into device indexes, as the CUDA runtime does.
+
+    The value is a comma-separated list of device indexes, device UUIDs (e.g.
+    'GPU-2b8d3a4c-...'), unique prefixes of device UUIDs (e.g. 'GPU-2b8d') or MIG devices (e.g.
+    'MIG-7a5b2e2c-...' or 'MIG-GPU-2b8d3a4c-.../1/0'), which resolve to their parent device. The
+    list ends at the first invalid or repeated entry. If the value is None (the variable is
+    unset), all devices are visible; if it is empty, none is.
+
+    The UUIDs are resolved through the UUID cache of the NVML session, and the prefixes through
+    the identification attributes cached by the backend, so only the devices themselves are
+    read, once. The indexes are the NVML indexes, i.e. in PCI bus order, which the CUDA runtime
+    uses with CUDA_DEVICE_ORDER=PCI_BUS_ID.
+
+    Args:
+        value (str): The CUDA_VISIBLE_DEVICES value.
+
+    Returns:
+        list: The indexes of the visible devices, in the order of the CUDA device numbers.
+    """
+    backend = get_backend()
+    if value is None:
+        return list(range(backend.device_count()))
+    ret: List[int] = list()
+    device_count = None
+    uuid_index = None
+    for entry in value.split(','):
+        entry = entry.strip()
+        device_index = None
+        if entry.isdigit():
+            if device_count is None:
+                device_count = backend.device_count()
+            if int(entry) < device_count:
+                device_index = int(entry)
+        elif entry.startswith('MIG-GPU-'):
+            device_index = backend.index_from_uuid(entry[len('MIG-'):].split('/')[0])
+        elif entry.startswith('MIG-'):
+            device_index = backend.index_from_uuid(entry)
+        elif entry.startswith('GPU-'):
+            if len(entry) == _UUID_LENGTH:
+                device_index = backend.index_from_uuid(entry)
+            if device_index is None:
+                if uuid_index is None:
+                    uuid_index = {device_dict['uuid']: device_dict['index']
+                                  for device_dict in backend.query_all(fields=tuple())}
+                matches = [index for uuid, index in uuid_index.items() if uuid.startswith(entry)]
+                if len(matches) == 1:
+                    device_index = matches[0]
+        if device_index is None or device_index in ret:
+            break
+        ret.append(device_index)
+    return ret
 
 
 def visible_devices_index() -> List[int]:
     """
     Returns an index list, containing the device index for each visible GPU defined by the
-    CUDA_VISIBLE_DEVICES environmnt variable.
+    CUDA_VISIBLE_DEVICES environmnt variable (see `resolve_visible_devices`). If the variable is
+    not set, all devices are visible.
 
     Returns:
         list: A list with all visible devices index.
     """
-    visible_devices_env = os.environ.get('CUDA_VISIBLE_DEVICES', None)
-    if visible_devices_env is None:
-        return list()
-    return [int(index) for index in visible_devices_env.split(sep=',')]
+    return resolve_visible_devices(os.environ.get('CUDA_VISIBLE_DEVICES', None))
 
 
 def nvidia_driver_version() -> Tuple[Optional[int], Optional[int]]:
@@ -71,61 +120,74 @@ def nvidia_driver_version() -> Tuple[Optional[int], Optional[int]]:
     Returns:
         tuple: A tuple with major and minor driver version.
     """
-    query = smi.getInstance().DeviceQuery('driver_version')
-    if query:
-        _version = query['driver_version'].split('.')
+    driver_version = get_backend().driver_version()
+    if driver_version:
+        _version = driver_version.split('.')
         return int(_version[0]), int(_version[1])
     return None, None
 
 
-def get_device(device_index: int) -> GPUInfo:
+def get_device(device_index: Union[int, str],
+               fields: Optional[Iterable[str]] = None) -> GPUInfo:
     """
-    Given a device index, returns a GpuInfo object containing the device properties and stats.
+    Given a device index or UUID, returns a GpuInfo object containing the device properties and
+    stats. Only the desired device is queried.
 
     Args:
-        device_index (int): The index of the desired device.
+        device_index (int or str): The index or the UUID (e.g. 'GPU-2b8d3a4c-...') of the
+            desired device.
+        fields (list): The GPUInfo sections to query ('memory', 'utilization', 'pci', 'clocks',
+            'power' and 'processes'). The sections not listed are only queried on their first
+            access. If None, all sections are queried.
 
     Returns:
         GpuInfo: A GpuInfo object containing the device properties and stats.
     """
-    if count_devices() == 0:
-        raise ValueError(f'There are no devices available')
+    backend = get_backend()
+    device_dict = None
+    if isinstance(device_index, str):
+        uuid_index = backend.index_from_uuid(device_index)
+        if uuid_index is not None:
+            device_dict = backend.query(uuid_index, fields)
+    else:
+        device_dict = backend.query(device_index, fields)
 
-    device_dict = parser.parser_query_dict(device_index, parser.get_all_info())
     if device_dict is None:
+        if count_devices() == 0:
+            raise ValueError(f'There are no devices available')
         raise ValueError(f'Invalid device index: {device_index}. Valid: {devices_index()}')
     return GPUInfo(device_dict)
 
 
-def devices() -> List[GPUInfo]:
+def devices(fields: Optional[Iterable[str]] = None) -> List[GPUInfo]:
     """
     Returns a GpuInfo list containing all available devices.
 
+    Args:
+        fields (list): The GPUInfo sections to query. If None, all sections are queried.
+            See `get_device`.
 
     Returns:
         list: A list of GpuInfo objects.
     """
-    all_info = parser.get_all_info()
-    ret_devices = list()
-    for device_index in devices_index():
-        device_dict = parser.parser_query_dict(device_index, all_info)
-        if device_dict is None:
-            raise ValueError(f'Invalid device index: {device_index}')
-        ret_devices.append(GPUInfo(device_dict))
-    return ret_devices
+    return [GPUInfo(device_dict) for device_dict in get_backend().query_all(fields)]
 
-def visible_devices() -> List[GPUInfo]:
+def visible_devices(fields: Optional[Iterable[str]] = None) -> List[GPUInfo]:
     """
     Returns a GpuInfo list containing all available devices defined by the
     CUDA_VISIBLE_DEVICES environmnt variable.
 
+    Args:
+        fields (list): The GPUInfo sections to query. If None, all sections are queried.
+            See `get_device`.
+
     Returns:
         list: A list of GpuInfo objects.
     """
-    all_info = parser.get_all_info()
+    backend = get_backend()
     ret_devices = list()
     for device_index in visible_devices_index():
-        device_dict = parser.parser_query_dict(device_index, all_info)
+        device_dict = backend.query(device_index, fields)
         if device_dict is None:
             raise ValueError(f'Invalid device index: {device_index}')
         ret_devices.append(GPUInfo(device_dict))
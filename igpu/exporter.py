@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu Prometheus/OpenMetrics exporter
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import math
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Iterable, Tuple
+from igpu.backend import get_backend
+from igpu.columnar import snapshot
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_MIB = 1024.0 * 1024.0
+
+# The exported metric families, as (metric name, family name, unit, scale, help).
+FAMILIES: Tuple[Tuple[str, str, str, float, str], ...] = (
+    ('memory.total', 'igpu_memory_total_bytes', 'bytes', _MIB, 'Total installed GPU memory.'),
+    ('memory.used', 'igpu_memory_used_bytes', 'bytes', _MIB, 'Allocated GPU memory.'),
+    ('memory.free', 'igpu_memory_free_bytes', 'bytes', _MIB, 'Free GPU memory.'),
+    ('utilization.gpu', 'igpu_utilization_gpu_percent', 'percent', 1.0,
+     'Percent of time over the past sample period during which one or more kernels was '
+     'executing on the GPU.'),
+    ('utilization.memory', 'igpu_utilization_memory_percent', 'percent', 1.0,
+     'Percent of time over the past sample period during which global (device) memory was '
+     'being read or written.'),
+    ('utilization.fan', 'igpu_fan_speed_percent', 'percent', 1.0,
+     'Fan speed, as a percent of its maximum speed.'),
+    ('utilization.temperature', 'igpu_temperature_celsius', 'celsius', 1.0,
+     'Core GPU temperature.'),
+    ('clocks.graphics', 'igpu_clocks_graphics_hertz', 'hertz', 1e6,
+     'Current frequency of the graphics clock.'),
+    ('clocks.sm', 'igpu_clocks_sm_hertz', 'hertz', 1e6,
+     'Current frequency of the SM (Streaming Multiprocessor) clock.'),
+    ('clocks.memory', 'igpu_clocks_memory_hertz', 'hertz', 1e6,
+     'Current frequency of the memory clock.'),
+    ('power.draw', 'igpu_power_draw_watts', 'watts', 1.0,
+     'Power draw of the board.'),
+    ('power.limit', 'igpu_power_limit_watts', 'watts', 1.0,
+     'Power management limit of the board.'),
+)
+
+
+def escape_label(value: object) -> str:
+    """
+    Escapes a label value, as defined by the OpenMetrics text format.
+
+    Args:
+        value: The label value.
+
+    Returns:
+        str: The escaped value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _header(name: str, metric_type: str, help_text: str, unit: Optional[str] = None,
+            openmetrics: bool = True) -> str:
+    """
+    Returns the metadata lines of a metric family. The Prometheus text format (0.0.4) has no
+    units, and names a counter by its sample (with the '_total' suffix), while OpenMetrics
+    names the family without it.
+    """
+    if not openmetrics:
+        if metric_type == 'counter':
+            name += '_total'
+        return f'# HELP {name} {help_text}\n# TYPE {name} {metric_type}\n'
+    ret = f'# TYPE {name} {metric_type}\n'
+    if unit is not None:
+        ret += f'# UNIT {name} {unit}\n'
+    return ret + f'# HELP {name} {help_text}\n'
+
+
+class Exporter(object):
+    """
+    A small HTTP server exposing the GPU metrics in the OpenMetrics text format, or in the
+    Prometheus text format (0.0.4) to the scrapers which do not accept OpenMetrics.
+
+    The devices are read by a background thread at a fixed interval, through a columnar
+    snapshot (see `igpu.snapshot`), and the texts are rendered once per interval. Scrapes only
+    write the last rendered text, so any number of Prometheus replicas can scrape the exporter
+    without adding NVML queries. The label strings of the devices are built once, when the
+    exporter starts.
+
+    Args:
+        port (int): The TCP port. If 0, an ephemeral port is chosen (see `port`).
+        address (str): The address to bind. If empty, all interfaces.
+        interval (float): The collect interval, in seconds.
+        devices (list): The indexes of the exported devices. If None, all available devices.
+        processes (bool): If True, also exports the GPU memory used by each compute process.
+    """
+
+    def __init__(self, port: int = 9835, address: str = '', interval: float = 5.0,
+                 devices: Optional[Iterable[int]] = None, processes: bool = True) -> None:
+        if interval <= 0:
+            raise ValueError(f'Invalid interval: {interval}')
+        self._address = (address, port)
+        self._interval = interval
+        self._devices = None if devices is None else list(devices)
+        self._processes = processes
+        self._metrics = tuple(family[0] for family in FAMILIES)
+        self._snapshot = None
+        self._labels: List[str] = list()
+        self._headers = {
+            openmetrics: [_header(name, 'gauge', help_text, unit, openmetrics)
+                          for _, name, unit, _, help_text in FAMILIES]
+            for openmetrics in (True, False)
+        }
+        self._info = ''
+        self._process_labels: Dict[Tuple, str] = dict()
+        self._process_lines = ''
+        self._bodies = {True: b'# EOF\n', False: b''}
+        self._collect_count = 0
+        self._error_count = 0
+        self._last_collect = float('NaN')
+        self._collect_duration = float('NaN')
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = list()
+        self._stop_event = threading.Event()
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def port(self) -> int:
+        """int: Returns the TCP port the server is bound to."""
+        if self._server is None:
+            return self._address[1]
+        return self._server.server_address[1]
+
+    @property
+    def interval(self) -> float:
+        """float: Returns the collect interval, in seconds."""
+        return self._interval
+
+    @property
+    def running(self) -> bool:
+        """bool: Returns True if the server is running."""
+        return self._server is not None
+
+    def body(self, openmetrics: bool = True) -> bytes:
+        """
+        Returns the last rendered text.
+
+        Args:
+            openmetrics (bool): If True, the OpenMetrics text; otherwise, the Prometheus text
+                format (0.0.4).
+
+        Returns:
+            bytes: The UTF-8 encoded text.
+        """
+        return self._bodies[openmetrics]
+
+    def collect(self) -> None:
+        """
+        Reads the devices and renders the texts. Called by the collector thread at each
+        interval; it can also be called directly when the exporter is not running.
+        """
+        start = time.monotonic()
+        try:
+            self._collect()
+        except Exception: #pylint: disable=broad-except
+            self._error_count += 1
+            raise
+        finally:
+            self._collect_count += 1
+            self._last_collect = time.time()
+            self._collect_duration = time.monotonic() - start
+            self._bodies = {openmetrics: self._render(openmetrics)
+                            for openmetrics in (True, False)}
+
+    def _collect(self) -> None:
+        backend = get_backend()
+        if not self._labels:
+            devices = self._devices
+            if devices is None:
+                devices = range(backend.device_count())
+            self._devices = list(devices)
+            labels, info = list(), list()
+            for device_index in self._devices:
+                device_dict = backend.query(device_index, tuple())
+                if device_dict is None:
+                    raise ValueError(f'Invalid device index: {device_index}')
+                label = f'gpu="{device_index}",uuid="{escape_label(device_dict["uuid"])}"'
+                labels.append(label)
+                name = escape_label(device_dict['name'])
+                info.append(f'igpu_gpu_info{{{label},name="{name}"}} 1\n')
+            self._info = ''.join(info)
+            self._labels = labels
+        self._snapshot = snapshot(self._devices, self._metrics, out=self._snapshot)
+        if self._processes:
+            process_labels = dict()
+            lines = list()
+            for device_index, label in zip(self._devices, self._labels):
+                device_dict = backend.query(device_index, ('processes',))
+                for process in (device_dict or dict()).get('processes') or list():
+                    key = (label, process['pid'], process['name'], process['user'])
+                    process_label = self._process_labels.get(key)
+                    if process_label is None:
+                        process_label = (f'{label},pid="{process["pid"]}",'
+                                         f'name="{escape_label(process["name"])}",'
+                                         f'user="{escape_label(process["user"])}"')
+                    process_labels[key] = process_label
+                    lines.append(f'igpu_process_memory_used_bytes{{{process_label}}} '
+                                 f'{process["gpu_memory"] * _MIB!r}\n')
+            self._process_labels = process_labels
+            self._process_lines = ''.join(lines)
+
+    def _render(self, openmetrics: bool) -> bytes:
+        def header(name: str, metric_type: str, help_text: str,
+                   unit: Optional[str] = None) -> str:
+            return _header(name, metric_type, help_text, unit, openmetrics)
+
+        ret = list()
+        if self._labels:
+            ret.append(header('igpu_gpu_info', 'gauge', 'Information about the GPU board.'))
+            ret.append(self._info)
+        if self._snapshot is not None:
+            for family_header, (metric, name, _, scale, _) in zip(self._headers[openmetrics],
+                                                                   FAMILIES):
+                ret.append(family_header)
+                for label, value in zip(self._labels, self._snapshot[metric].tolist()):
+                    if not math.isnan(value):
+                        ret.append(f'{name}{{{label}}} {value * scale!r}\n')
+        if self._processes and self._snapshot is not None:
+            ret.append(header('igpu_process_memory_used_bytes', 'gauge',
+                              'GPU memory allocated by the compute process.', 'bytes'))
+            ret.append(self._process_lines)
+        ret.append(header('igpu_exporter_collects', 'counter', 'Number of collects.'))
+        ret.append(f'igpu_exporter_collects_total {self._collect_count}\n')
+        ret.append(header('igpu_exporter_errors', 'counter', 'Number of failed collects.'))
+        ret.append(f'igpu_exporter_errors_total {self._error_count}\n')
+        ret.append(header('igpu_exporter_last_collect_timestamp_seconds', 'gauge',
+                          'Time of the last collect, in seconds since the epoch.', 'seconds'))
+        ret.append(f'igpu_exporter_last_collect_timestamp_seconds {self._last_collect!r}\n')
+        ret.append(header('igpu_exporter_collect_duration_seconds', 'gauge',
+                          'Duration of the last collect.', 'seconds'))
+        ret.append(f'igpu_exporter_collect_duration_seconds {self._collect_duration!r}\n')
+        if openmetrics:
+            ret.append('# EOF\n')
+        return ''.join(ret).encode('utf-8')
+
+    def _run(self) -> None:
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            next_time += self._interval
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            if self._stop_event.wait(next_time - now):
+                break
+            try:
+                self.collect()
+            except Exception as err: #pylint: disable=broad-except
+                self.last_error = err
+
+    def start(self) -> 'Exporter':
+        """
+        Takes the first collect, then starts the HTTP server and the collector thread.
+
+        Returns:
+            Exporter: The exporter itself.
+        """
+        if self.running:
+            return self
+        try:
+            self.collect()
+        except Exception as err: #pylint: disable=broad-except
+            self.last_error = err
+        self._server = ThreadingHTTPServer(self._address, _handler(self))
+        self._server.daemon_threads = True
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name='igpu-exporter',
+                             daemon=True),
+            threading.Thread(target=self._run, name='igpu-exporter-collector', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the HTTP server and the collector thread.
+        """
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = list()
+
+    def __enter__(self) -> 'Exporter':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+def _handler(exporter: Exporter) -> type:
+    """Returns the request handler class serving the exporter text."""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Serves the last rendered text on /metrics."""
+
+        def do_GET(self) -> None: #pylint: disable=invalid-name
+            """Handles a GET request."""
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+            body = exporter.body(openmetrics)
+            content_type = CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None: #pylint: disable=arguments-differ
+            pass
+
+    return Handler
+
+
+def start_http_server(port: int = 9835, address: str = '', interval: float = 5.0,
+                      devices: Optional[Iterable[int]] = None,
+                      processes: bool = True) -> Exporter:
+    """
+    Creates and starts an Exporter. See `Exporter` for the arguments.
+
+    Returns:
+        Exporter: The running exporter.
+    """
+    return Exporter(port, address, interval, devices, processes).start()
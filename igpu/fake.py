@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of an in-process fake NVML library
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import time
+import types
+import functools
+from typing import Dict, List, Optional, Any
+
+
+NVML_SUCCESS = 0
+NVML_ERROR_UNINITIALIZED = 1
+NVML_ERROR_INVALID_ARGUMENT = 2
+NVML_ERROR_NOT_SUPPORTED = 3
+NVML_ERROR_NOT_FOUND = 6
+NVML_ERROR_GPU_IS_LOST = 15
+
+NVML_TEMPERATURE_GPU = 0
+
+NVML_CLOCK_GRAPHICS = 0
+NVML_CLOCK_SM = 1
+NVML_CLOCK_MEM = 2
+
+NVML_TOPOLOGY_INTERNAL = 0
+NVML_TOPOLOGY_SINGLE = 10
+NVML_TOPOLOGY_MULTIPLE = 20
+NVML_TOPOLOGY_HOSTBRIDGE = 30
+NVML_TOPOLOGY_NODE = 40
+NVML_TOPOLOGY_SYSTEM = 50
+
+_ERROR_STRINGS = {
+    NVML_ERROR_UNINITIALIZED: 'Uninitialized',
+    NVML_ERROR_INVALID_ARGUMENT: 'Invalid Argument',
+    NVML_ERROR_NOT_SUPPORTED: 'Not Supported',
+    NVML_ERROR_NOT_FOUND: 'Not Found',
+    NVML_ERROR_GPU_IS_LOST: 'GPU is lost',
+}
+
+_MIB = 1024 * 1024
+
+
+class NVMLError(Exception):
+    """
+    Error raised by the fake NVML functions. It mirrors the `pynvml.nvml.NVMLError` interface,
+    exposing the NVML return code in the `value` attribute.
+    """
+
+    def __init__(self, value: int) -> None:
+        Exception.__init__(self, value)
+        self.value = value
+
+    def __str__(self) -> str:
+        return _ERROR_STRINGS.get(self.value, f'Unknown Error ({self.value})')
+
+
+class FakeProcess(object):
+    """
+    A process with compute context on a fake device.
+    """
+
+    def __init__(self, pid: Optional[int] = None, used_memory: int = 512 * _MIB,
+                 sm_util: int = 0, memory_util: int = 0) -> None:
+        self.pid = os.getpid() if pid is None else pid
+        self.used_memory = used_memory
+        self.sm_util = sm_util
+        self.memory_util = memory_util
+
+
+class FakeMigDevice(object):
+    """
+    A MIG (Multi-Instance GPU) device of a fake device.
+    """
+
+    def __init__(self, parent: 'FakeDevice', uuid: str) -> None:
+        self.parent = parent
+        self.uuid = uuid
+
+
+class FakeDevice(object):
+    """
+    The state of a fake GPU board. All attributes are public and can be changed at any time to
+    simulate the device behaviour; values use the same units returned by NVML (bytes, MHz and
+    milliwatts).
+    """
+
+    def __init__(self, index: int, processes: Optional[List[FakeProcess]] = None) -> None:
+        self.index = index
+        self.name = 'GeForce GTX 1080 Ti'
+        self.serial = f'03230170{index:05d}'
+        self.uuid = f'GPU-{index:08x}-0000-0000-0000-{index:012x}'
+        self.vbios = '86.02.39.00.01'
+        self.memory_total = 11264 * _MIB
+        self.memory_used = 0
+        self.gpu_util = 0
+        self.memory_util = 0
+        self.fan = 23
+        self.temperature = 35
+        self.pstate = 8
+        self.pci_bus = 0x04 + index
+        self.pci_device = 0x00
+        self.pci_domain = 0x0000
+        self.pci_device_id = 0x1B0610DE
+        self.pci_sub_system_id = 0x120F10DE
+        self.link_gen = 1
+        self.max_link_gen = 3
+        self.link_width = 16
+        self.max_link_width = 16
+        self.clocks = {NVML_CLOCK_GRAPHICS: 139, NVML_CLOCK_SM: 139, NVML_CLOCK_MEM: 405}
+        self.max_clocks = {NVML_CLOCK_GRAPHICS: 1911, NVML_CLOCK_SM: 1911, NVML_CLOCK_MEM: 5505}
+        self.power_management = 1
+        self.power_draw = 9013
+        self.power_limit = 250000
+        self.power_constraints = (125000, 300000)
+        self.processes = list() if processes is None else processes
+        self.mig_devices: List[FakeMigDevice] = list()
+        # By default, the devices are paired under PCIe switches, with 4 devices per NUMA node.
+        self.pci_switch = index // 2
+        self.numa_node = index // 4
+        self.unsupported: set = set()
+
+    def add_mig_device(self) -> FakeMigDevice:
+        """Creates a MIG device on the device, returning it."""
+        number = len(self.mig_devices)
+        mig_device = FakeMigDevice(self, f'MIG-{self.index:08x}-{number:04x}-0000-0000-'
+                                         f'{self.index:012x}')
+        self.mig_devices.append(mig_device)
+        return mig_device
+
+    @property
+    def bus_id(self) -> str:
+        """str: Returns the PCI bus id as "domain:bus:device.function", in hex."""
+        return f'{self.pci_domain:08X}:{self.pci_bus:02X}:{self.pci_device:02X}.0'
+
+
+def _nvml_call(method):
+    """Decorates a FakeNVML method, counting the call and checking the library state."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.calls[method.__name__] = self.calls.get(method.__name__, 0) + 1
+        if not self.initialized:
+            raise self.NVMLError(NVML_ERROR_UNINITIALIZED)
+        if args and isinstance(args[0], FakeDevice) and method.__name__ in args[0].unsupported:
+            raise self.NVMLError(NVML_ERROR_NOT_SUPPORTED)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class FakeNVML(object):
+    """
+    An in-process fake of the `pynvml.nvml` module, allowing igpu to run on hosts with no GPU.
+
+    A FakeNVML instance exposes the subset of the NVML functions and constants used by igpu, with
+    the same names and return types, so it can be passed wherever the NVML module is expected.
+    Every call is counted in the `calls` dictionary, which helps to measure the NVML traffic of
+    each igpu operation.
+
+    Args:
+        device_count (int): The number of fake devices.
+        process_count (int): The number of compute processes running on each device. The
+            processes share the current process PID, so their metadata can be resolved.
+        driver_version (str): The driver version reported by the library.
+    """
+
+    NVMLError = NVMLError
+
+    NVML_SUCCESS = NVML_SUCCESS
+    NVML_ERROR_UNINITIALIZED = NVML_ERROR_UNINITIALIZED
+    NVML_ERROR_INVALID_ARGUMENT = NVML_ERROR_INVALID_ARGUMENT
+    NVML_ERROR_NOT_SUPPORTED = NVML_ERROR_NOT_SUPPORTED
+    NVML_ERROR_NOT_FOUND = NVML_ERROR_NOT_FOUND
+    NVML_ERROR_GPU_IS_LOST = NVML_ERROR_GPU_IS_LOST
+    NVML_TEMPERATURE_GPU = NVML_TEMPERATURE_GPU
+    NVML_CLOCK_GRAPHICS = NVML_CLOCK_GRAPHICS
+    NVML_CLOCK_SM = NVML_CLOCK_SM
+    NVML_CLOCK_MEM = NVML_CLOCK_MEM
+    NVML_TOPOLOGY_INTERNAL = NVML_TOPOLOGY_INTERNAL
+    NVML_TOPOLOGY_SINGLE = NVML_TOPOLOGY_SINGLE
+    NVML_TOPOLOGY_MULTIPLE = NVML_TOPOLOGY_MULTIPLE
+    NVML_TOPOLOGY_HOSTBRIDGE = NVML_TOPOLOGY_HOSTBRIDGE
+    NVML_TOPOLOGY_NODE = NVML_TOPOLOGY_NODE
+    NVML_TOPOLOGY_SYSTEM = NVML_TOPOLOGY_SYSTEM
+
+    def __init__(self, device_count: int = 1, process_count: int = 0,
+                 driver_version: str = '430.34') -> None:
+        self.devices = [
+            FakeDevice(index, [FakeProcess() for _ in range(process_count)])
+            for index in range(device_count)
+        ]
+        self.driver_version = driver_version
+        self.initialized = False
+        self.calls: Dict[str, int] = dict()
+
+    def simulate_reset(self) -> None:
+        """Simulates a driver reload: the library becomes uninitialized until the next nvmlInit
+        call."""
+        self.initialized = False
+
+    def reset_calls(self) -> None:
+        """Clears the NVML call counters."""
+        self.calls.clear()
+
+    def total_calls(self) -> int:
+        """Returns the total number of NVML calls made since the last reset."""
+        return sum(self.calls.values())
+
+    def nvmlInit(self) -> None: #pylint: disable=invalid-name
+        """Initializes the fake library."""
+        self.calls['nvmlInit'] = self.calls.get('nvmlInit', 0) + 1
+        self.initialized = True
+
+    #pylint: disable=invalid-name,missing-docstring
+
+    @_nvml_call
+    def nvmlShutdown(self) -> None:
+        self.initialized = False
+
+    @_nvml_call
+    def nvmlSystemGetDriverVersion(self) -> bytes:
+        return self.driver_version.encode()
+
+    @_nvml_call
+    def nvmlDeviceGetCount(self) -> int:
+        return len(self.devices)
+
+    @_nvml_call
+    def nvmlDeviceGetHandleByIndex(self, index: int) -> FakeDevice:
+        if not 0 <= index < len(self.devices):
+            raise self.NVMLError(NVML_ERROR_INVALID_ARGUMENT)
+        return self.devices[index]
+
+    @_nvml_call
+    def nvmlDeviceGetHandleByUUID(self, uuid: Any) -> FakeDevice:
+        uuid = uuid.decode() if isinstance(uuid, bytes) else uuid
+        for device in self.devices:
+            if device.uuid == uuid:
+                return device
+            for mig_device in device.mig_devices:
+                if mig_device.uuid == uuid:
+                    return mig_device
+        raise self.NVMLError(NVML_ERROR_NOT_FOUND)
+
+    @_nvml_call
+    def nvmlDeviceIsMigDeviceHandle(self, handle: Any) -> bool:
+        return isinstance(handle, FakeMigDevice)
+
+    @_nvml_call
+    def nvmlDeviceGetDeviceHandleFromMigDeviceHandle(self, handle: Any) -> FakeDevice:
+        if not isinstance(handle, FakeMigDevice):
+            raise self.NVMLError(NVML_ERROR_INVALID_ARGUMENT)
+        return handle.parent
+
+    @_nvml_call
+    def nvmlDeviceGetIndex(self, handle: FakeDevice) -> int:
+        return handle.index
+
+    @_nvml_call
+    def nvmlDeviceGetName(self, handle: FakeDevice) -> bytes:
+        return handle.name.encode()
+
+    @_nvml_call
+    def nvmlDeviceGetSerial(self, handle: FakeDevice) -> bytes:
+        return handle.serial.encode()
+
+    @_nvml_call
+    def nvmlDeviceGetUUID(self, handle: FakeDevice) -> bytes:
+        return handle.uuid.encode()
+
+    @_nvml_call
+    def nvmlDeviceGetVbiosVersion(self, handle: FakeDevice) -> bytes:
+        return handle.vbios.encode()
+
+    @_nvml_call
+    def nvmlDeviceGetMemoryInfo(self, handle: FakeDevice) -> types.SimpleNamespace:
+        return types.SimpleNamespace(
+            total=handle.memory_total,
+            used=handle.memory_used,
+            free=handle.memory_total - handle.memory_used,
+        )
+
+    @_nvml_call
+    def nvmlDeviceGetUtilizationRates(self, handle: FakeDevice) -> types.SimpleNamespace:
+        return types.SimpleNamespace(gpu=handle.gpu_util, memory=handle.memory_util)
+
+    @_nvml_call
+    def nvmlDeviceGetFanSpeed(self, handle: FakeDevice) -> int:
+        return handle.fan
+
+    @_nvml_call
+    def nvmlDeviceGetPowerState(self, handle: FakeDevice) -> int:
+        return handle.pstate
+
+    @_nvml_call
+    def nvmlDeviceGetTemperature(self, handle: FakeDevice, sensor: int) -> int:
+        if sensor != NVML_TEMPERATURE_GPU:
+            raise self.NVMLError(NVML_ERROR_INVALID_ARGUMENT)
+        return handle.temperature
+
+    @_nvml_call
+    def nvmlDeviceGetPciInfo(self, handle: FakeDevice) -> types.SimpleNamespace:
+        return types.SimpleNamespace(
+            busId=handle.bus_id.encode(),
+            domain=handle.pci_domain,
+            bus=handle.pci_bus,
+            device=handle.pci_device,
+            pciDeviceId=handle.pci_device_id,
+            pciSubSystemId=handle.pci_sub_system_id,
+        )
+
+    @_nvml_call
+    def nvmlDeviceGetCurrPcieLinkGeneration(self, handle: FakeDevice) -> int:
+        return handle.link_gen
+
+    @_nvml_call
+    def nvmlDeviceGetMaxPcieLinkGeneration(self, handle: FakeDevice) -> int:
+        return handle.max_link_gen
+
+    @_nvml_call
+    def nvmlDeviceGetCurrPcieLinkWidth(self, handle: FakeDevice) -> int:
+        return handle.link_width
+
+    @_nvml_call
+    def nvmlDeviceGetMaxPcieLinkWidth(self, handle: FakeDevice) -> int:
+        return handle.max_link_width
+
+    @_nvml_call
+    def nvmlDeviceGetClockInfo(self, handle: FakeDevice, clock_type: int) -> int:
+        return handle.clocks[clock_type]
+
+    @_nvml_call
+    def nvmlDeviceGetMaxClockInfo(self, handle: FakeDevice, clock_type: int) -> int:
+        return handle.max_clocks[clock_type]
+
+    @_nvml_call
+    def nvmlDeviceGetPowerManagementMode(self, handle: FakeDevice) -> int:
+        return handle.power_management
+
+    @_nvml_call
+    def nvmlDeviceGetPowerUsage(self, handle: FakeDevice) -> int:
+        return handle.power_draw
+
+    @_nvml_call
+    def nvmlDeviceGetPowerManagementLimit(self, handle: FakeDevice) -> int:
+        return handle.power_limit
+
+    @_nvml_call
+    def nvmlDeviceGetPowerManagementLimitConstraints(self, handle: FakeDevice) -> List[int]:
+        return list(handle.power_constraints)
+
+    @_nvml_call
+    def nvmlDeviceGetComputeRunningProcesses(self, handle: FakeDevice) -> List:
+        return [
+            types.SimpleNamespace(pid=process.pid, usedGpuMemory=process.used_memory)
+            for process in handle.processes
+        ]
+
+    @_nvml_call
+    def nvmlDeviceGetProcessUtilization(self, handle: FakeDevice, timestamp: int) -> List:
+        # The driver keeps one sample per process, taken at the call time.
+        now = int(time.time() * 1e6)
+        if not handle.processes or now <= timestamp:
+            raise self.NVMLError(NVML_ERROR_NOT_FOUND)
+        return [
+            types.SimpleNamespace(pid=process.pid, timeStamp=now, smUtil=process.sm_util,
+                                  memUtil=process.memory_util, encUtil=0, decUtil=0)
+            for process in handle.processes
+        ]
+
+    @_nvml_call
+    def nvmlDeviceGetTopologyCommonAncestor(self, handle: FakeDevice,
+                                            other: FakeDevice) -> int:
+        if handle is other:
+            return NVML_TOPOLOGY_INTERNAL
+        if handle.pci_switch == other.pci_switch:
+            return NVML_TOPOLOGY_SINGLE
+        if handle.numa_node == other.numa_node:
+            return NVML_TOPOLOGY_HOSTBRIDGE
+        return NVML_TOPOLOGY_SYSTEM
+
+    @_nvml_call
+    def nvmlSystemGetProcessName(self, pid: int) -> bytes:
+        for device in self.devices:
+            for process in device.processes:
+                if process.pid == pid:
+                    return b'python'
+        raise self.NVMLError(NVML_ERROR_NOT_FOUND)
+
+    #pylint: enable=invalid-name,missing-docstring
+
+
+class FakeSMI(object):
+    """
+    An in-process fake of the `pynvml.smi.nvidia_smi` singleton, built on a FakeNVML.
+
+    `DeviceQuery` returns the same dict structure as nvidia_smi (in MiB, MHz and W), built from
+    the state of the FakeNVML devices. Like nvidia_smi, only the groups of the given filters
+    are included. The calls are counted in the `calls` dictionary of the FakeNVML, under
+    'DeviceQuery'.
+
+    Args:
+        nvml (FakeNVML): The fake library holding the devices state.
+    """
+
+    def __init__(self, nvml: FakeNVML) -> None:
+        self.nvml = nvml
+
+    def DeviceQuery(self, filters: str = '') -> Dict: #pylint: disable=invalid-name
+        """
+        Returns the nvidia-smi like dict for the given comma separated filters.
+
+        Args:
+            filters (str): The query filters (e.g. 'memory.used, utilization.gpu').
+
+        Returns:
+            dict: The query dict.
+        """
+        nvml = self.nvml
+        nvml.calls['DeviceQuery'] = nvml.calls.get('DeviceQuery', 0) + 1
+        filters = {query_filter.strip() for query_filter in filters.split(',')}
+        if filters == {'count'}:
+            return {'count': len(nvml.devices)}
+        if filters == {'driver_version'}:
+            return {'driver_version': nvml.driver_version}
+        groups = {query_filter.split('.')[0] for query_filter in filters}
+        ret: Dict[str, Any] = {'driver_version': nvml.driver_version,
+                               'count': len(nvml.devices)}
+        ret['gpu'] = [self._device_dict(device, filters, groups) for device in nvml.devices]
+        return ret
+
+    @staticmethod
+    def _device_dict(device: FakeDevice, filters: set, groups: set) -> Dict:
+        #pylint: disable=too-many-branches
+        ret: Dict[str, Any] = dict()
+        if 'name' in filters:
+            ret['product_name'] = device.name
+        if 'serial' in filters:
+            ret['serial'] = device.serial
+        if 'uuid' in filters:
+            ret['uuid'] = device.uuid
+        if 'vbios_version' in filters:
+            ret['vbios_version'] = device.vbios
+        if 'memory' in groups:
+            ret['fb_memory_usage'] = {
+                'total': device.memory_total / _MIB,
+                'used': device.memory_used / _MIB,
+                'free': (device.memory_total - device.memory_used) / _MIB,
+                'unit': 'MiB',
+            }
+        if 'utilization' in groups:
+            ret['utilization'] = {
+                'gpu_util': device.gpu_util, 'memory_util': device.memory_util, 'unit': '%',
+            }
+        if 'fan' in groups:
+            ret['fan_speed'] = device.fan
+        if 'pstate' in groups:
+            ret['performance_state'] = f'P{device.pstate}'
+        if 'temperature' in groups:
+            ret['temperature'] = {'gpu_temp': device.temperature, 'unit': 'C'}
+        if 'pci' in groups or 'pcie' in groups:
+            ret['pci'] = {
+                'pci_bus': f'{device.pci_bus:02X}',
+                'pci_bus_id': device.bus_id,
+                'pci_device': f'{device.pci_device:02X}',
+                'pci_device_id': f'{device.pci_device_id:08X}',
+                'pci_sub_system_id': f'{device.pci_sub_system_id:08X}',
+                'pci_gpu_link_info': {
+                    'pcie_gen': {
+                        'current_link_gen': str(device.link_gen),
+                        'max_link_gen': str(device.max_link_gen),
+                    },
+                    'link_widths': {
+                        'current_link_width': f'{device.link_width}x',
+                        'max_link_width': f'{device.max_link_width}x',
+                    },
+                },
+            }
+        if 'clocks' in groups:
+            ret['clocks'] = {
+                'graphics_clock': device.clocks[NVML_CLOCK_GRAPHICS],
+                'sm_clock': device.clocks[NVML_CLOCK_SM],
+                'mem_clock': device.clocks[NVML_CLOCK_MEM],
+                'unit': 'MHz',
+            }
+            ret['max_clocks'] = {
+                'graphics_clock': device.max_clocks[NVML_CLOCK_GRAPHICS],
+                'sm_clock': device.max_clocks[NVML_CLOCK_SM],
+                'mem_clock': device.max_clocks[NVML_CLOCK_MEM],
+                'unit': 'MHz',
+            }
+        if 'power' in groups:
+            ret['power_readings'] = {
+                'power_management': 'Supported' if device.power_management else 'N/A',
+                'power_draw': device.power_draw / 1000.0,
+                'power_limit': device.power_limit / 1000.0,
+                'min_power_limit': device.power_constraints[0] / 1000.0,
+                'max_power_limit': device.power_constraints[1] / 1000.0,
+                'unit': 'W',
+            }
+        if 'compute-apps' in filters:
+            ret['processes'] = [
+                {
+                    'pid': process.pid,
+                    'process_name': 'python',
+                    'used_memory': int(process.used_memory / _MIB),
+                    'unit': 'MiB',
+                }
+                for process in device.processes
+            ] or None
+        return ret
@@ -8,10 +8,14 @@ Implementation of igpu GPUInfo class
 
 import textwrap
 import math
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime
+from igpu import backend
 from igpu import parser
 
+# The info objects are updated in place by their `update` method, also called by `__init__`.
+#pylint: disable=attribute-defined-outside-init
+
 
 class GPUMemoryInfo(object):
     """
@@ -23,17 +27,23 @@ class GPUMemoryInfo(object):
     even without active work on the GPU. These attributes are available for all products.
     """
 
+    __slots__ = ('_total', '_used', '_free', '_unit')
+
     def __init__(self, memory_dict: Dict) -> None:
+        self.update(memory_dict)
+
+    def update(self, memory_dict: Dict) -> None:
+        """
+        Updates the attributes in place, from a parsed memory dict.
+
+        Args:
+            memory_dict (dict): The parsed section (see `parser.parser_query_dict`).
+        """
         self._total = memory_dict['total']
         self._used = memory_dict['used']
         self._free = memory_dict['free']
         self._unit = memory_dict['unit']
 
-        self._total = self._total if isinstance(self._total, float) else float('NaN')
-        self._used = self._used if isinstance(self._used, float) else float('NaN')
-        self._free = self._free if isinstance(self._free, float) else float('NaN')
-        self._unit = self._unit if isinstance(self._unit, str) else 'N/A'
-
     @property
     def total(self) -> float:
         """float: Returns the total installed GPU memory."""
@@ -71,19 +81,24 @@ class GPUUtilizationInfo(object):
     an application is using the GPUs in the system.
     """
 
+    __slots__ = ('_gpu', '_memory', '_fan', '_temp', '_perf')
+
     def __init__(self, utilization_dict: Dict) -> None:
+        self.update(utilization_dict)
+
+    def update(self, utilization_dict: Dict) -> None:
+        """
+        Updates the attributes in place, from a parsed utilization dict.
+
+        Args:
+            utilization_dict (dict): The parsed section (see `parser.parser_query_dict`).
+        """
         self._gpu = utilization_dict['gpu']
         self._memory = utilization_dict['memory']
         self._fan = utilization_dict['fan']
         self._temp = utilization_dict['temperature']
         self._perf = utilization_dict['performance']
 
-        self._gpu = float(self._gpu) if isinstance(self._gpu, int) else float('NaN')
-        self._memory = float(self._memory) if isinstance(self._memory, int) else float('NaN')
-        self._fan = float(self._fan) if isinstance(self._fan, int) else float('NaN')
-        self._temp = float(self._temp) if isinstance(self._temp, int) else float('NaN')
-        self._perf = self._perf if isinstance(self._perf, str) else 'N/A'
-
     @property
     def gpu(self) -> float:
         """float: Returns the percent of the time over the past sample period during which one or
@@ -152,7 +167,21 @@ class GPUPCIInfo(object):
     and bus width. These attributes are available for all products.
     """
 
+    __slots__ = (
+        '_bus', '_bus_id', '_device', '_device_id', '_sub_system_id', '_current_link_generation',
+        '_max_link_generation', '_current_link_width', '_max_link_width',
+    )
+
     def __init__(self, pci_dict: Dict) -> None:
+        self.update(pci_dict)
+
+    def update(self, pci_dict: Dict) -> None:
+        """
+        Updates the attributes in place, from a parsed PCI dict.
+
+        Args:
+            pci_dict (dict): The parsed section (see `parser.parser_query_dict`).
+        """
         self._bus = pci_dict['bus']
         self._bus_id = pci_dict['bus_id']
         self._device = pci_dict['device']
@@ -235,7 +264,18 @@ class GPUClockInfo(object):
     The current frequency at which parts of the GPU are running. All readings are in MHz.
     """
 
+    __slots__ = ('_gr', '_sm', '_memory', '_max_gr', '_max_sm', '_max_mem', '_unit')
+
     def __init__(self, clocks_dict: Dict) -> None:
+        self.update(clocks_dict)
+
+    def update(self, clocks_dict: Dict) -> None:
+        """
+        Updates the attributes in place, from a parsed clocks dict.
+
+        Args:
+            clocks_dict (dict): The parsed section (see `parser.parser_query_dict`).
+        """
         self._gr = clocks_dict['graphics']
         self._sm = clocks_dict['sm']
         self._memory = clocks_dict['memory']
@@ -244,14 +284,6 @@ class GPUClockInfo(object):
         self._max_mem = clocks_dict['max_memory']
         self._unit = clocks_dict['unit']
 
-        self._gr = float(self._gr) if isinstance(self._gr, int) else float('NaN')
-        self._sm = float(self._sm) if isinstance(self._sm, int) else float('NaN')
-        self._memory = float(self._memory) if isinstance(self._memory, int) else float('NaN')
-        self._max_gr = float(self._max_gr) if isinstance(self._max_gr, int) else float('NaN')
-        self._max_sm = float(self._max_sm) if isinstance(self._max_sm, int) else float('NaN')
-        self._max_mem = float(self._max_mem) if isinstance(self._max_mem, int) else float('NaN')
-        self._unit = self._unit if isinstance(self._unit, str) else 'N/A'
-
     @property
     def graphics(self) -> float:
         """float: Returns the current frequency of graphics (shader) clock."""
@@ -308,7 +340,18 @@ class GPUPowerInfo(object):
     See below for limits of availability.
     """
 
+    __slots__ = ('_management', '_draw', '_limit', '_min_lim', '_max_lim', '_unit')
+
     def __init__(self, power_dict: Dict) -> None:
+        self.update(power_dict)
+
+    def update(self, power_dict: Dict) -> None:
+        """
+        Updates the attributes in place, from a parsed power dict.
+
+        Args:
+            power_dict (dict): The parsed section (see `parser.parser_query_dict`).
+        """
         self._management = power_dict['management']
         self._draw = power_dict['draw']
         self._limit = power_dict['limit']
@@ -316,14 +359,6 @@ class GPUPowerInfo(object):
         self._max_lim = power_dict['max_limit']
         self._unit = power_dict['unit']
 
-        self._management = self._management if isinstance(self._management, str) else 'N/A'
-        self._draw = self._draw if isinstance(self._draw, float) else float('NaN')
-        self._limit = self._limit if isinstance(self._limit, float) else float('NaN')
-        self._min_lim = self._min_lim if isinstance(self._min_lim, float) else float('NaN')
-        self._max_lim = self._max_lim if isinstance(self._max_lim, float) else float('NaN')
-        self._unit = self._unit if isinstance(self._unit, str) else 'N/A'
-
-
     @property
     def management(self) -> str:
         """int: Returns a flag that indicates whether power management is enabled.
@@ -380,15 +415,30 @@ class GPUProcessInfo(object):
     """
     Helper class that handles each process which has compute context on the GPU.
     """
+
+    __slots__ = (
+        '_pid', '_name', '_user', '_parent_id', '_parent_name', '_create_timestamp',
+        '_create_time', '_gpu_memory',
+    )
+
     def __init__(self, process_dict: Dict) -> None:
+        self.update(process_dict)
+
+    def update(self, process_dict: Dict) -> None:
+        """
+        Updates the attributes in place, from a parsed process dict.
+
+        Args:
+            process_dict (dict): The parsed process (see `parser.processes_info`).
+        """
         self._pid = process_dict['pid']
         self._name = process_dict['name']
         self._user = process_dict['user']
         self._parent_id = process_dict['parent_id']
         self._parent_name = process_dict['parent_name']
-        self._create_time = process_dict['create_time']
-        self._create_time = datetime.fromtimestamp(int(self._create_time))
-        self._create_time = self._create_time.strftime('%Y-%m-%d %H:%M:%S')
+        if getattr(self, '_create_timestamp', None) != process_dict['create_time']:
+            self._create_timestamp = process_dict['create_time']
+            self._create_time = None
         self._gpu_memory = process_dict['gpu_memory']
 
     @property
@@ -418,10 +468,22 @@ class GPUProcessInfo(object):
 
     @property
     def create_time(self) -> str:
-        """str: Returns the process creation time as a floating point number expressed in seconds
-        since the epoch, in UTC."""
+        """str: Returns the process creation time, formatted as "YYYY-MM-DD HH:MM:SS" in the
+        local time, or 'N/A' if it cannot be read. The string is only formatted on the first
+        access."""
+        if isinstance(self._create_timestamp, str):
+            return self._create_timestamp
+        if self._create_time is None:
+            self._create_time = datetime.fromtimestamp(int(self._create_timestamp)).strftime(
+                '%Y-%m-%d %H:%M:%S')
         return self._create_time
 
+    @property
+    def create_timestamp(self) -> float:
+        """float: Returns the process creation time as a floating point number expressed in
+        seconds since the epoch, in UTC, or 'N/A' if it cannot be read."""
+        return self._create_timestamp
+
     @property
     def gpu_memory(self) -> int:
         """int: Returns the amount of GPU memory allocated by the process."""
@@ -445,30 +507,69 @@ class GPUProcessesInfo(list):
     List of processes having compute context on the device.
     """
 
+    __slots__ = ()
+
     def __init__(self, processes_list: List) -> None:
         list.__init__(self)
+        self.update(processes_list)
+
+    def update(self, processes_list: List) -> None:
+        """
+        Updates the list in place, from a list of parsed process dicts. The GPUProcessInfo
+        objects of the processes still running are kept and updated.
+
+        Args:
+            processes_list (list): The parsed processes (see `parser.processes_info`).
+        """
+        current = dict()
+        for process in reversed(self):
+            current[(process.pid, process.create_timestamp)] = process
+        processes = list()
         for process_dict in processes_list:
-            self.append(GPUProcessInfo(process_dict))
+            process = current.pop((process_dict['pid'], process_dict['create_time']), None)
+            if process is None:
+                process = GPUProcessInfo(process_dict)
+            else:
+                process.update(process_dict)
+            processes.append(process)
+        self[:] = processes
+
+    # The table header, formatted once.
+    __HEADER = '    ' + ' | '.join((
+        f'{"PID":6s}', f'{"NAME":20s}', f'{"USER":20s}', f'{"PARENT":8s}',
+        f'{"CREATION TIME":20s}', f'{"GPU MEM":6s}',
+    ))
 
     def __str__(self):
-        ret = [
-            f'{"PID":6s}',
-            f'{"NAME":20s}',
-            f'{"USER":20s}',
-            f'{"PARENT":8s}',
-            f'{"CREATION TIME":20s}',
-            f'{"GPU MEM":6s}',
-        ]
-        ret = 'PROCESSES\n' + '    ' + ' | '.join(ret) + '\n'
-        for process in self:
-            ret += '    ' + str(process) + '\n'
-        return ret
+        lines = ['PROCESSES', self.__HEADER]
+        lines.extend(f'    {process}' for process in self)
+        lines.append('')
+        return '\n'.join(lines)
 
 class GPUInfo(object):
     """
     Helper class that handles the attributes of each GPU
+
+    The identification attributes are read on the object creation. Each section (memory,
+    utilization, pci, clocks, power and processes) not present in the device dict is loaded from
+    the current backend on the first access of its property. On `update`, the section objects
+    are updated in place, so references to them see the new values.
     """
 
+    __slots__ = (
+        '_index', '_name', '_serial', '_uuid', '_bios', '_loaded', '_memory_info',
+        '_utilization_info', '_pci_info', '_clocks_info', '_power_info', '_processes_info',
+    )
+
+    # The sections, as (field, attribute, class).
+    __SECTIONS = (
+        ('memory', '_memory_info', GPUMemoryInfo),
+        ('utilization', '_utilization_info', GPUUtilizationInfo),
+        ('pci', '_pci_info', GPUPCIInfo),
+        ('clocks', '_clocks_info', GPUClockInfo),
+        ('power', '_power_info', GPUPowerInfo),
+        ('processes', '_processes_info', GPUProcessesInfo),
+    )
 
     def __init__(self, device_dict: Dict) -> None:
         self._index = device_dict['index']
@@ -477,20 +578,28 @@ class GPUInfo(object):
         self._uuid = device_dict['uuid']
         self._bios = device_dict['bios']
 
-        self._name = self._name if isinstance(self._name, str) else 'N/A'
-        self._serial = self._serial if isinstance(self._serial, str) else 'N/A'
-        self._uuid = self._uuid if isinstance(self._uuid, str) else 'N/A'
-        self._bios = self._bios if isinstance(self._bios, str) else 'N/A'
-
-        self._memory_info: GPUMemoryInfo = GPUMemoryInfo(device_dict['memory'])
-        self._utilization_info = GPUUtilizationInfo(device_dict['utilization'])
-        self._pci_info = GPUPCIInfo(device_dict['pci'])
-        self._clocks_info = GPUClockInfo(device_dict['clocks'])
-        self._power_info = GPUPowerInfo(device_dict['power'])
-        if device_dict['processes'] is None:
-            self._processes_info = None
-        else:
-            self._processes_info = GPUProcessesInfo(device_dict['processes'])
+        self._loaded: Set[str] = set()
+        self._memory_info: Optional[GPUMemoryInfo] = None
+        self._utilization_info: Optional[GPUUtilizationInfo] = None
+        self._pci_info: Optional[GPUPCIInfo] = None
+        self._clocks_info: Optional[GPUClockInfo] = None
+        self._power_info: Optional[GPUPowerInfo] = None
+        self._processes_info: Optional[GPUProcessesInfo] = None
+        self._set_sections(device_dict)
+
+    def _set_sections(self, device_dict: Dict) -> None:
+        self._loaded.update(field for field in parser.FIELDS if field in device_dict)
+        for field, attribute, info_class in self.__SECTIONS:
+            if field not in device_dict:
+                continue
+            section_dict = device_dict[field]
+            info = getattr(self, attribute)
+            if section_dict is None:
+                setattr(self, attribute, None)
+            elif info is None:
+                setattr(self, attribute, info_class(section_dict))
+            else:
+                info.update(section_dict)
 
     @property
     def index(self) -> int:
@@ -520,77 +629,79 @@ class GPUInfo(object):
         """str: Returns the BIOS version of the GPU board."""
         return self._bios
 
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        "tuple: Returns the sections already loaded for this device (see `parser.FIELDS`)."
+        return parser.check_fields(self._loaded)
+
     @property
     def memory(self) -> GPUMemoryInfo:
         "GPUMemoryInfo: Returns the GPU board memory info."
+        self._load('memory')
         return self._memory_info
 
     @property
     def utilization(self) -> GPUUtilizationInfo:
         "GPUUtilizationInfo: Returns the GPU board utilization info."
+        self._load('utilization')
         return self._utilization_info
 
     @property
     def pci(self) -> GPUPCIInfo:
         "GPUPCIInfo: Returns the GPU board PCI info."
+        self._load('pci')
         return self._pci_info
 
     @property
     def clocks(self) -> GPUClockInfo:
         "GPUClockInfo: Returns the GPU board clocks info."
+        self._load('clocks')
         return self._clocks_info
 
     @property
     def power(self) -> GPUPowerInfo:
         "GPUPowerInfo: Returns the GPU board power info."
+        self._load('power')
         return self._power_info
 
     @property
-    def processes(self) -> GPUProcessesInfo:
-        "GPUProcessesInfo: Returns the GPU board clocks info."
+    def processes(self) -> Optional[GPUProcessesInfo]:
+        "GPUProcessesInfo: Returns the GPU board processes info, or None if there are none."
+        self._load('processes')
         return self._processes_info
 
+    def _load(self, field: str) -> None:
+        if field in self._loaded:
+            return
+        device_dict = backend.get_backend().query(self.index, [field])
+        if device_dict is None:
+            raise ValueError(f'Invalid device index: {self.index}.')
+        self._set_sections(device_dict)
+
     def update(self) -> None:
         """
-        Updates the GPU attributes.
+        Updates the GPU attributes. Only the sections already loaded are updated; the others are
+        loaded on their first access. The immutable attributes are cached by the backend, so only
+        the dynamic counters are queried.
         """
 
-        device_dict = parser.parser_query_dict(self.index, parser.get_all_info())
+        device_dict = backend.get_backend().query(self.index, self.fields)
 
         if device_dict is None:
             raise ValueError(f'Invalid device index: {self.index}.')
 
-        self._index = device_dict['index']
-        self._name = device_dict['name']
-        self._serial = device_dict['serial']
-        self._uuid = device_dict['uuid']
-        self._bios = device_dict['bios']
-
-        self._memory_info = GPUMemoryInfo(device_dict['memory'])
-        self._utilization_info = GPUUtilizationInfo(device_dict['utilization'])
-        self._pci_info = GPUPCIInfo(device_dict['pci'])
-        self._clocks_info = GPUClockInfo(device_dict['clocks'])
-        self._power_info = GPUPowerInfo(device_dict['power'])
-        self._processes_info = GPUProcessesInfo(device_dict['processes'])
-
+        self._set_sections(device_dict)
 
     def __str__(self):
-        ret = f'''{"INDEX":13s}: {self.index}
-{"BOARD NAME":13s}: {self.name}
-{"SERIAL":13s}: {self.serial}
-{"UUID":13s}: {self.uuid}
-{"BIOS VERSION":13s}: {self.bios}
-
-{str(self.memory)}
-
-{str(self.utilization)}
-
-{str(self.pci)}
-
-{str(self.clocks)}
-
-{str(self.power)}
-
-{str(self.processes)}
-'''
-        return textwrap.dedent(ret)
+        lines = [
+            f'{"INDEX":13s}: {self.index}',
+            f'{"BOARD NAME":13s}: {self.name}',
+            f'{"SERIAL":13s}: {self.serial}',
+            f'{"UUID":13s}: {self.uuid}',
+            f'{"BIOS VERSION":13s}: {self.bios}',
+        ]
+        for section in (self.memory, self.utilization, self.pci, self.clocks, self.power,
+                        self.processes):
+            lines.extend(('', str(section)))
+        lines.append('')
+        return '\n'.join(lines)
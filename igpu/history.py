@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu rolling statistics
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Iterable, Sequence, Tuple, Union
+import numpy as np
+
+AGGREGATIONS = ('count', 'mean', 'std', 'min', 'max')
+
+_UNITS = {'s': 1.0, 'm': 60.0, 'h': 3600.0, 'd': 86400.0}
+
+# The range of the values counted by the quantile sketches; smaller values are counted as 0 and
+# larger ones as the maximum.
+_SKETCH_MIN = 1e-2
+_SKETCH_MAX = 1e6
+
+
+def parse_window(window: Union[str, float]) -> float:
+    """
+    Returns the length of a window, in seconds.
+
+    Args:
+        window (str or float): The window length, in seconds, or as a string with a unit suffix
+            ('s', 'm', 'h' or 'd'), e.g. '30s' or '5m'.
+
+    Returns:
+        float: The window length, in seconds.
+    """
+    try:
+        if isinstance(window, str) and window[-1:] in _UNITS:
+            seconds = float(window[:-1]) * _UNITS[window[-1]]
+        else:
+            seconds = float(window)
+    except ValueError:
+        seconds = float('NaN')
+    if not seconds > 0:
+        raise ValueError(f'Invalid window: {window!r}')
+    return seconds
+
+
+def _quantile(aggregation: str) -> Optional[float]:
+    """Returns the quantile of a 'pNN' aggregation (e.g. 0.95 for 'p95'), or None."""
+    if aggregation[:1] != 'p':
+        return None
+    try:
+        quantile = float(aggregation[1:]) / 100.0
+    except ValueError:
+        return None
+    return quantile if 0.0 <= quantile <= 1.0 else None
+
+
+class _Window(object):
+    """The rolling state of a window: the aggregates of the samples since `tail`."""
+
+    def __init__(self, seconds: float, shape: Tuple[int, int], bins: int, start: int) -> None:
+        self.seconds = seconds
+        self.tail = start
+        self.recomputed = start
+        self.count = np.zeros(shape, dtype=np.int64)
+        # The mean and the sum of the squared differences from the mean (Welford's algorithm),
+        # recomputed from the samples of the window once per sampler capacity.
+        self.mean = np.zeros(shape)
+        self.squares = np.zeros(shape)
+        self.min = np.full(shape, np.nan)
+        self.max = np.full(shape, np.nan)
+        # Monotonic queues of (sample, value): the first item is the extreme of the window.
+        cells = shape[0] * shape[1]
+        self.min_queues: List[deque] = [deque() for _ in range(cells)]
+        self.max_queues: List[deque] = [deque() for _ in range(cells)]
+        self.sketch = np.zeros(shape + (bins,), dtype=np.int32) if bins else None
+
+
+class History(object):
+    """
+    Rolling statistics of the metrics sampled by a `Sampler`, over sliding time windows.
+
+    The statistics are updated incrementally by the sampler, at each sample: the new values are
+    added to each window and the values which left it are removed, so a query does not scan the
+    samples. The count, mean and standard deviation are kept with Welford's updates, and the
+    mean and deviation are recomputed from the window samples once per sampler capacity, so the
+    rounding errors of the removals do not accumulate (e.g. the deviation of a constant metric
+    stays 0). The minimum and maximum are kept as monotonic queues (amortized O(1) per sample).
+    The quantiles (e.g. 'p95') are read from a sketch per window, a histogram with logarithmic
+    bins (as in DDSketch) whose counts are also updated as the samples enter and leave the
+    window; the returned quantiles are within `relative_accuracy` of the exact ones. Missing
+    values (NaN) are skipped.
+
+    Only the samples taken after the history creation are counted, and the windows are limited
+    to the samples kept by the sampler. Created by `Sampler.add_history`.
+
+    Args:
+        windows (list): The window lengths, in seconds or as strings (see `parse_window`).
+        metrics (list): The metrics of the statistics, a subset of the sampled metrics.
+        devices (list): The sampled devices.
+        relative_accuracy (float): The relative accuracy of the quantiles. If None, the
+            quantiles are not available, which saves the memory of the sketches (one counter per
+            bin, about 900 bins for 1%, per device, metric and window).
+    """
+
+    def __init__(self, windows: Iterable[Union[str, float]], metrics: Sequence[str],
+                 devices: Sequence[int], relative_accuracy: Optional[float] = 0.01,
+                 start: int = 0) -> None:
+        self._windows = {window: parse_window(window) for window in windows}
+        if not self._windows:
+            raise ValueError('At least one window is required')
+        self._metrics = tuple(metrics)
+        self._columns = {name: column for column, name in enumerate(self._metrics)}
+        self._devices = list(devices)
+        self._rows = {device_index: row for row, device_index in enumerate(self._devices)}
+        bins = 0
+        if relative_accuracy is not None:
+            if not 0 < relative_accuracy < 1:
+                raise ValueError(f'Invalid relative accuracy: {relative_accuracy}')
+            self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+            self._offset = math.ceil(math.log(_SKETCH_MIN) / self._log_gamma) - 1
+            bins = math.ceil(math.log(_SKETCH_MAX) / self._log_gamma) - self._offset + 1
+            # The value of each bin: 0 for the first one, which counts the smaller values.
+            gamma = math.exp(self._log_gamma)
+            self._bin_values = 2 * np.exp(
+                (np.arange(bins) + self._offset) * self._log_gamma) / (gamma + 1)
+            self._bin_values[0] = 0.0
+        self._relative_accuracy = relative_accuracy
+        self._bins = bins
+        shape = (len(self._devices), len(self._metrics))
+        self._states = {seconds: _Window(seconds, shape, bins, start)
+                        for seconds in set(self._windows.values())}
+        self._lock = threading.Lock()
+
+    @property
+    def windows(self) -> Tuple[Union[str, float], ...]:
+        """tuple: Returns the windows, as given."""
+        return tuple(self._windows)
+
+    @property
+    def metrics(self) -> Tuple[str, ...]:
+        """tuple: Returns the metrics of the statistics."""
+        return self._metrics
+
+    @property
+    def relative_accuracy(self) -> Optional[float]:
+        """float: Returns the relative accuracy of the quantiles, or None if not available."""
+        return self._relative_accuracy
+
+    def _bin(self, values: np.ndarray) -> np.ndarray:
+        """Returns the sketch bins of the (non-NaN) values."""
+        clipped = np.clip(values, _SKETCH_MIN, _SKETCH_MAX)
+        bins = np.ceil(np.log(clipped) / self._log_gamma).astype(np.int64) - self._offset
+        bins[values < _SKETCH_MIN] = 0
+        return np.clip(bins, 0, self._bins - 1)
+
+    def update(self, values: np.ndarray, timestamp: float, sample: int,
+               buffers: Dict[str, np.ndarray], timestamps: np.ndarray) -> None:
+        """
+        Adds a sample to the windows, removing the samples which left them. Called by the
+        sampler before the sample is written into its ring buffers, which still hold the
+        samples to remove.
+
+        Args:
+            values (ndarray): The sample values of the history metrics, one row per device.
+            timestamp (float): The sample timestamp.
+            sample (int): The sample number.
+            buffers (dict): The ring buffers of the sampler, for each metric.
+            timestamps (ndarray): The timestamps ring buffer of the sampler.
+        """
+        capacity = len(timestamps)
+        with self._lock:
+            for state in self._states.values():
+                while state.tail < sample and (
+                        state.tail <= sample - capacity or
+                        timestamps[state.tail % capacity] <= timestamp - state.seconds):
+                    slot = state.tail % capacity
+                    old = np.stack([buffers[name][:, slot] for name in self._metrics], axis=1)
+                    self._add(state, old, -1)
+                    state.tail += 1
+                self._add(state, values, 1)
+                if sample - state.recomputed >= capacity:
+                    self._recompute(state, values, sample, buffers, capacity)
+                self._update_extremes(state, values, sample)
+
+    def _add(self, state: _Window, values: np.ndarray, sign: int) -> None:
+        valid = ~np.isnan(values)
+        state.count += sign * valid
+        delta = np.where(valid, values - state.mean, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.where(valid & (state.count > 0), delta / state.count, 0.0)
+        state.mean += sign * step
+        state.squares += sign * delta * np.where(valid, values - state.mean, 0.0)
+        # An empty window restarts from exact zeros, a single value has no deviation, and the
+        # rounding never makes the squares negative.
+        state.mean[state.count == 0] = 0.0
+        np.maximum(state.squares, 0.0, out=state.squares)
+        state.squares[state.count <= 1] = 0.0
+        if state.sketch is not None and valid.any():
+            rows, columns = np.nonzero(valid)
+            # Each (row, column) appears once, so the fancy-indexed update is exact.
+            state.sketch[rows, columns, self._bin(values[rows, columns])] += sign
+
+    def _recompute(self, state: _Window, values: np.ndarray, sample: int,
+                   buffers: Dict[str, np.ndarray], capacity: int) -> None:
+        """Recomputes the mean and the squared differences of the samples since `tail`."""
+        slots = np.arange(state.tail, sample) % capacity
+        window = np.stack([buffers[name][:, slots] for name in self._metrics], axis=2)
+        window = np.concatenate((window, values[:, None, :]), axis=1)
+        valid = ~np.isnan(window)
+        # Shifted by the new values, so the mean of a constant metric is exact.
+        shift = np.where(np.isnan(values), 0.0, values)
+        shifted = np.where(valid, window - shift[:, None, :], 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = shift + shifted.sum(axis=1) / state.count
+        state.mean = np.where(state.count > 0, mean, 0.0)
+        deviations = np.where(valid, window - state.mean[:, None, :], 0.0)
+        state.squares = (deviations * deviations).sum(axis=1)
+        state.recomputed = sample
+
+    def _update_extremes(self, state: _Window, values: np.ndarray, sample: int) -> None:
+        columns = len(self._metrics)
+        for cell, value in enumerate(values.ravel().tolist()):
+            row, column = divmod(cell, columns)
+            for queue, extremes, better in ((state.max_queues[cell], state.max, float.__ge__),
+                                            (state.min_queues[cell], state.min, float.__le__)):
+                while queue and queue[0][0] < state.tail:
+                    queue.popleft()
+                if value == value:
+                    while queue and better(value, queue[-1][1]):
+                        queue.pop()
+                    queue.append((sample, value))
+                extremes[row, column] = queue[0][1] if queue else np.nan
+
+    def stats(self, metric: str, window: Union[str, float],
+              aggs: Iterable[str] = ('mean', 'max'),
+              devices: Optional[Iterable[int]] = None) -> Dict[str, np.ndarray]:
+        """
+        Returns rolling statistics of a metric over a window.
+
+        Args:
+            metric (str): The metric name (e.g. 'utilization.gpu').
+            window (str or float): One of the history windows, in seconds or as a string (e.g.
+                '5m').
+            aggs (list): The aggregations: 'count', 'mean', 'std', 'min', 'max', or a
+                quantile as 'p' followed by the percentile (e.g. 'p50', 'p95' or 'p99.9').
+            devices (list): The device indexes. If None, all sampled devices.
+
+        Returns:
+            dict: For each aggregation, an array with one value per device, NaN if the window
+            has no value.
+        """
+        column = self._columns.get(metric)
+        if column is None:
+            raise ValueError(f'Metric not in history: {metric}. Available: {list(self._metrics)}')
+        state = self._states.get(parse_window(window))
+        if state is None:
+            raise ValueError(f'Window not in history: {window}. Available: {list(self._windows)}')
+        if isinstance(aggs, str):
+            aggs = [aggs]
+        aggs = list(aggs)
+        for aggregation in aggs:
+            if aggregation not in AGGREGATIONS and _quantile(aggregation) is None:
+                raise ValueError(f'Invalid aggregation: {aggregation}. Valid: '
+                                 f'{list(AGGREGATIONS)} and quantiles, e.g. p95')
+            if _quantile(aggregation) is not None and state.sketch is None:
+                raise ValueError('The quantiles are not available: no relative accuracy')
+        rows: Union[slice, List[int]] = slice(None)
+        if devices is not None:
+            try:
+                rows = [self._rows[device_index] for device_index in devices]
+            except KeyError as err:
+                raise ValueError(f'Device not sampled: {err.args[0]}. '
+                                 f'Sampled: {self._devices}')
+
+        ret = dict()
+        with self._lock:
+            count = state.count[rows, column].astype(np.float64)
+            empty = count == 0
+            mean = np.where(empty, np.nan, state.mean[rows, column])
+            for aggregation in aggs:
+                if aggregation == 'count':
+                    ret[aggregation] = count
+                elif aggregation == 'mean':
+                    ret[aggregation] = mean
+                elif aggregation == 'std':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        variance = state.squares[rows, column] / count
+                    ret[aggregation] = np.sqrt(variance)
+                elif aggregation in ('min', 'max'):
+                    extremes = state.min if aggregation == 'min' else state.max
+                    ret[aggregation] = extremes[rows, column].copy()
+                else:
+                    ret[aggregation] = self._quantiles(
+                        state.sketch[rows, column], count, _quantile(aggregation))
+        return ret
+
+    def _quantiles(self, sketch: np.ndarray, count: np.ndarray,
+                   quantile: float) -> np.ndarray:
+        cumulative = np.cumsum(sketch, axis=-1)
+        rank = np.floor(quantile * np.maximum(count - 1, 0))
+        bins = np.argmax(cumulative > rank[:, None], axis=-1)
+        return np.where(count == 0, np.nan, self._bin_values[bins])
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of the igpu numeric metrics
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+from typing import Any, Dict, List, Optional, Iterable, NamedTuple, Tuple
+from igpu import parser
+
+
+class Attribute(NamedTuple):
+    """
+    The schema of a parsed device dict attribute.
+
+    Attributes:
+        dtype (type): The type of the value, `float` or `str`.
+        unit (str): The unit of measurement, for the numeric attributes.
+        missing: The value of an attribute which is not available: NaN for the numeric
+            attributes and 'N/A' for the strings.
+    """
+    dtype: type
+    unit: Optional[str] = None
+    missing: Any = 'N/A'
+
+
+def _number(unit: str) -> Attribute:
+    return Attribute(float, unit, float('NaN'))
+
+
+_TEXT = Attribute(str)
+
+# The schema of the parsed device dicts: the identification attributes ('identity') and the
+# attributes of each GPUInfo section. The units are fixed, so they do not depend on the backend.
+SCHEMA: Dict[str, Dict[str, Attribute]] = {
+    'identity': {'name': _TEXT, 'serial': _TEXT, 'uuid': _TEXT, 'bios': _TEXT},
+    'memory': {'total': _number('MiB'), 'used': _number('MiB'), 'free': _number('MiB')},
+    'utilization': {
+        'gpu': _number('%'), 'memory': _number('%'), 'fan': _number('%'),
+        'temperature': _number('C'), 'performance': _TEXT,
+    },
+    'pci': {
+        'bus': _TEXT, 'bus_id': _TEXT, 'device': _TEXT, 'device_id': _TEXT,
+        'sub_system_id': _TEXT, 'current_link_generation': _TEXT, 'max_link_generation': _TEXT,
+        'current_link_width': _TEXT, 'max_link_width': _TEXT,
+    },
+    'clocks': {
+        'graphics': _number('MHz'), 'sm': _number('MHz'), 'memory': _number('MHz'),
+        'max_graphics': _number('MHz'), 'max_sm': _number('MHz'), 'max_memory': _number('MHz'),
+    },
+    'power': {
+        'management': _TEXT, 'draw': _number('W'), 'limit': _number('W'),
+        'min_limit': _number('W'), 'max_limit': _number('W'),
+    },
+}
+
+# The unit of the sections whose numeric attributes share a single unit, reported in the 'unit'
+# key of the parsed section.
+SECTION_UNITS = {'memory': 'MiB', 'clocks': 'MHz', 'power': 'W'}
+
+
+def _normalize_section(section: Dict, schema: Dict[str, Attribute]) -> None:
+    for key, value in section.items():
+        attribute = schema.get(key)
+        if attribute is None:
+            continue
+        if attribute.dtype is float:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                section[key] = float(value)
+            else:
+                section[key] = attribute.missing
+        elif not isinstance(value, str):
+            section[key] = attribute.missing
+
+
+def normalize(device_dict: Dict) -> Dict:
+    """
+    Normalizes a parsed device dict in place, following the `SCHEMA`: the numeric attributes
+    become floats, in the units of the schema, and the attributes which are not available
+    ("N/A", "Not Supported" or an NVML error string) become NaN; the string attributes which
+    are not available become 'N/A'. The sections with a single unit get it in their 'unit' key.
+    Only the attributes present in the dict are normalized, and the processes are kept as is.
+
+    After the normalization, the values can be used without checking their types, e.g. NaN
+    propagates through sums and ratios, and comparisons with NaN are False.
+
+    Args:
+        device_dict (dict): The parsed device dict (see `parser.parser_query_dict`).
+
+    Returns:
+        dict: The same device dict.
+    """
+    _normalize_section(device_dict, SCHEMA['identity'])
+    for field, schema in SCHEMA.items():
+        section = device_dict.get(field)
+        if field == 'identity' or section is None:
+            continue
+        _normalize_section(section, schema)
+        if field in SECTION_UNITS:
+            section['unit'] = SECTION_UNITS[field]
+    return device_dict
+
+
+def json_safe(value: Any) -> Any:
+    """
+    Returns a copy of the parsed device dicts (or of any JSON-like value) with the NaN values
+    replaced by None, so they can be encoded as standard JSON. `normalize` turns them back into
+    NaN.
+
+    Args:
+        value: The value, e.g. a list of parsed device dicts.
+
+    Returns:
+        The value without NaN.
+    """
+    if isinstance(value, float):
+        return None if value != value else value
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_safe(item) for item in value]
+    return value
+
+
+# The numeric metrics which can be sampled, as (metric name, GPUInfo section, parsed dict key).
+# The metric names follow the GPUInfo attribute path, e.g. `gpu.utilization.gpu`.
+METRICS: Tuple[Tuple[str, str, str], ...] = (
+    ('memory.total', 'memory', 'total'),
+    ('memory.used', 'memory', 'used'),
+    ('memory.free', 'memory', 'free'),
+    ('utilization.gpu', 'utilization', 'gpu'),
+    ('utilization.memory', 'utilization', 'memory'),
+    ('utilization.fan', 'utilization', 'fan'),
+    ('utilization.temperature', 'utilization', 'temperature'),
+    ('clocks.graphics', 'clocks', 'graphics'),
+    ('clocks.sm', 'clocks', 'sm'),
+    ('clocks.memory', 'clocks', 'memory'),
+    ('power.draw', 'power', 'draw'),
+    ('power.limit', 'power', 'limit'),
+)
+
+METRIC_NAMES = tuple(name for name, _, _ in METRICS)
+
+# The GPUInfo sections which have numeric metrics.
+METRIC_FIELDS = tuple(field for field in parser.FIELDS if any(m[1] == field for m in METRICS))
+
+__METRICS_BY_NAME: Dict[str, Tuple[str, str, str]] = {metric[0]: metric for metric in METRICS}
+
+
+def check_metrics(metrics: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """
+    Validates a list of metric names, returning them in the canonical order.
+
+    Args:
+        metrics (list): The desired metrics, a subset of `METRIC_NAMES`. If None, all metrics.
+
+    Returns:
+        tuple: The valid metric names.
+    """
+    if metrics is None:
+        return METRIC_NAMES
+    if isinstance(metrics, str):
+        metrics = [metrics]
+    metrics = set(metrics)
+    invalid = metrics.difference(METRIC_NAMES)
+    if invalid:
+        raise ValueError(f'Invalid metrics: {sorted(invalid)}. Valid: {list(METRIC_NAMES)}')
+    return tuple(name for name in METRIC_NAMES if name in metrics)
+
+
+def metrics_of(fields: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """
+    Returns the metric names of the given GPUInfo sections.
+
+    Args:
+        fields (list): The GPUInfo sections. If None, all sections with numeric metrics.
+
+    Returns:
+        tuple: The metric names.
+    """
+    fields = METRIC_FIELDS if fields is None else parser.check_fields(fields)
+    return tuple(name for name, field, _ in METRICS if field in fields)
+
+
+def fields_of(metrics: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Returns the GPUInfo sections needed to read the given metrics.
+
+    Args:
+        metrics (list): The metric names.
+
+    Returns:
+        tuple: The GPUInfo sections.
+    """
+    return parser.check_fields({__METRICS_BY_NAME[name][1] for name in check_metrics(metrics)})
+
+
+def metric_values(device_dict: Dict, metrics: Iterable[str]) -> List[float]:
+    """
+    Reads the given metrics from a normalized device dict (see `normalize`), where the values
+    which are not available are already NaN.
+
+    Args:
+        device_dict (dict): The normalized device dict.
+        metrics (list): The metric names.
+
+    Returns:
+        list: The metric values, as floats.
+    """
+    return [device_dict[field][key] for _, field, key in map(__METRICS_BY_NAME.get, metrics)]
+
+
+def unit_of(metric: str) -> str:
+    """
+    Returns the unit of measurement of a metric.
+
+    Args:
+        metric (str): The metric name.
+
+    Returns:
+        str: The unit, as in the `SCHEMA`.
+    """
+    _, field, key = __METRICS_BY_NAME[check_metrics([metric])[0]]
+    return SCHEMA[field][key].unit
@@ -7,42 +7,160 @@ Implementation of auxiliary parser functions
 @url http://github.com/acnazarejr/igpu
 """
 
-from typing import Dict, List, Optional, Any
-import psutil
-from pynvml.smi import nvidia_smi as smi
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+from igpu.process import get_process_cache
+
+# DeviceQuery filters of the attributes that can change over time, for each GPUInfo section.
+__FIELDS_FILTER = {
+    'memory': ["memory.total", "memory.used", "memory.free"],
+    'utilization': [
+        "fan.speed", "utilization.gpu", "utilization.memory", "pstate", "temperature.gpu",
+    ],
+    'pci': ["pcie.link.gen.current", "pcie.link.width.current"],
+    'clocks': ["clocks.gr", "clocks.sm", "clocks.mem"],
+    'power': ["power.management", "power.draw", "power.limit"],
+    'processes': ["compute-apps"],
+}
+
+# DeviceQuery filters of the immutable attributes: the device identification and, for each
+# GPUInfo section, the attributes which cannot change while the process is running.
+__STATIC_FILTER = {
+    'identity': ["index", "name", "serial", "uuid", "vbios_version"],
+    'pci': [
+        "pci.bus_id", "pci.bus", "pci.device", "pci.device_id", "pci.sub_device_id",
+        "pcie.link.gen.max", "pcie.link.width.max",
+    ],
+    'clocks': ["clocks.max.gr", "clocks.max.sm", "clocks.max.mem"],
+    'power': ["power.min_limit", "power.max_limit"],
+}
+
+# Parsed dict keys of the immutable attributes, for the identification ('identity') and for each
+# GPUInfo section.
+STATIC_ATTRIBUTES = {
+    'identity': ('name', 'serial', 'uuid', 'bios'),
+    'pci': (
+        'bus', 'bus_id', 'device', 'device_id', 'sub_system_id', 'max_link_generation',
+        'max_link_width',
+    ),
+    'clocks': ('max_graphics', 'max_sm', 'max_memory'),
+    'power': ('min_limit', 'max_limit'),
+}
+
+FIELDS = tuple(__FIELDS_FILTER)
 
 __COMPLET_INFO_FILTER = [
-    # Device Identification
-    "index", "name", "serial", "uuid", "vbios_version",
-    # Memory Info
-    "memory.total", "memory.used", "memory.free",
-    # Utilization
-    "fan.speed", "utilization.gpu", "utilization.memory", "pstate",
-    # Temperature
-    "temperature.gpu",
-    # PCI Info
-    "pci.bus_id", "pci.bus", "pci.device", "pci.device_id", "pci.sub_device_id",
-    "pcie.link.gen.current", "pcie.link.gen.max", "pcie.link.width.current", "pcie.link.width.max",
-    # Clocks info
-    "clocks.gr", "clocks.sm", "clocks.mem", "clocks.max.gr", "clocks.max.sm", "clocks.max.mem",
-    # Power info
-    "power.management", "power.draw", "power.limit", "enforced.power.limit", "power.default_limit",
-    "power.min_limit", "power.max_limit",
-    # Processes info
-    "compute-apps",
+    query_filter
+    for filters in (__STATIC_FILTER['identity'], *__FIELDS_FILTER.values(),
+                    __STATIC_FILTER['pci'], __STATIC_FILTER['clocks'], __STATIC_FILTER['power'])
+    for query_filter in filters
 ]
 
 
-def get_query_dict(filters: List[str]) -> Dict:
+def check_fields(fields: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """
+    Validates a list of GPUInfo sections, returning them in the canonical order.
+
+    Args:
+        fields (list): The desired sections, a subset of `FIELDS`. If None, all sections.
+
+    Returns:
+        tuple: The valid sections.
+    """
+    if fields is None:
+        return FIELDS
+    if isinstance(fields, str):
+        fields = [fields]
+    fields = set(fields)
+    invalid = fields.difference(FIELDS)
+    if invalid:
+        raise ValueError(f'Invalid fields: {sorted(invalid)}. Valid: {list(FIELDS)}')
+    return tuple(field for field in FIELDS if field in fields)
+
+
+def query_filters(fields: Optional[Iterable[str]] = None,
+                  static_fields: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Returns the minimal DeviceQuery filter list needed to fill the given GPUInfo sections.
+
+    Args:
+        fields (list): The desired sections, a subset of `FIELDS`. If None, all sections.
+        static_fields (list): The sections, including the device identification ('identity'),
+            whose immutable attributes are also queried. If None, all of them.
+
+    Returns:
+        list: The DeviceQuery filters.
+    """
+    fields = check_fields(fields)
+    static_fields = STATIC_ATTRIBUTES if static_fields is None else static_fields
+    ret = list()
+    if 'identity' in static_fields:
+        ret.extend(__STATIC_FILTER['identity'])
+    for field in fields:
+        ret.extend(__FIELDS_FILTER[field])
+        if field in static_fields and field in __STATIC_FILTER:
+            ret.extend(__STATIC_FILTER[field])
+    return ret
+
+
+def processes_info(processes: Iterable[Tuple[int, int]]) -> List[Dict]:
+    """
+    Given a list of (pid, gpu memory) pairs, returns the parsed dicts with the process metadata
+    and GPU memory usage. The metadata is read through the process cache (see
+    `process.get_process_cache`), and processes which no longer exist are skipped.
+
+    Args:
+        processes (list): The (pid, gpu memory in MiB) pairs.
+
+    Returns:
+        list: A list of dicts with the process attributes, as expected by GPUProcessInfo.
+    """
+    return get_process_cache().lookup(processes)
+
+def process_info(pid: int, gpu_memory: int) -> Optional[Dict]:
+    """
+    Given a PID, returns a parsed dict with the process metadata and its GPU memory usage.
+
+    Args:
+        pid (int): The process PID.
+        gpu_memory (int): The amount of GPU memory allocated by the process, in MiB.
+
+    Returns:
+        dict: A dict with the process attributes, as expected by GPUProcessInfo, or None if the
+        process does not exist.
+    """
+    ret = processes_info([(pid, gpu_memory)])
+    return ret[0] if ret else None
+
+def get_query_dict(filters: List[str], smi_instance: Any = None) -> Dict:
     """get_query_dict"""
-    return smi.getInstance().DeviceQuery(', '.join(filters))
+    if smi_instance is None:
+        from pynvml.smi import nvidia_smi #pylint: disable=import-outside-toplevel
+        smi_instance = nvidia_smi.getInstance()
+    return smi_instance.DeviceQuery(', '.join(filters))
 
-def get_all_info() -> Dict:
+def get_all_info(smi_instance: Any = None) -> Dict:
     """get_all_info"""
-    return get_query_dict(__COMPLET_INFO_FILTER)
+    return get_query_dict(__COMPLET_INFO_FILTER, smi_instance)
 
-def parser_query_dict(device_index: int, query_dict: Dict) -> Optional[Dict]:
-    """parser_query_dict"""
+def parser_query_dict(device_index: int, query_dict: Dict,
+                      fields: Optional[Iterable[str]] = None,
+                      static_fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    """
+    Given a device index, parses the DeviceQuery dict of the device.
+
+    Args:
+        device_index (int): The index of the desired device.
+        query_dict (dict): The DeviceQuery dict.
+        fields (list): The sections to parse, a subset of `FIELDS`. If None, all sections.
+        static_fields (list): The sections, including the device identification ('identity'),
+            whose immutable attributes (see `STATIC_ATTRIBUTES`) are parsed. If None, all of them.
+
+    Returns:
+        dict: The parsed device dict, or None if the index is invalid.
+    """
+
+    fields = check_fields(fields)
+    static_fields = STATIC_ATTRIBUTES if static_fields is None else static_fields
 
     for index, device_dict in enumerate(query_dict['gpu']):
 
@@ -52,69 +170,76 @@ def parser_query_dict(device_index: int, query_dict: Dict) -> Optional[Dict]:
         parsed_dict: Dict[str, Any] = dict()
 
         parsed_dict['index'] = index
-        parsed_dict['name'] = device_dict['product_name']
-        parsed_dict['serial'] = device_dict['serial']
-        parsed_dict['uuid'] = device_dict['uuid']
-        parsed_dict['bios'] = device_dict['vbios_version']
-
-        parsed_dict['memory'] = dict()
-        parsed_dict['memory']['total'] = device_dict['fb_memory_usage']['total']
-        parsed_dict['memory']['used'] = device_dict['fb_memory_usage']['used']
-        parsed_dict['memory']['free'] = device_dict['fb_memory_usage']['free']
-        parsed_dict['memory']['unit'] = device_dict['fb_memory_usage']['unit']
-
-        parsed_dict['utilization'] = dict()
-        parsed_dict['utilization']['gpu'] = device_dict['utilization']['gpu_util']
-        parsed_dict['utilization']['memory'] = device_dict['utilization']['memory_util']
-        parsed_dict['utilization']['fan'] = device_dict['fan_speed']
-        parsed_dict['utilization']['performance'] = device_dict['performance_state']
-        parsed_dict['utilization']['temperature'] = device_dict['temperature']['gpu_temp']
-
-
-        parsed_dict['pci'] = dict()
-        parsed_dict['pci']['bus'] = device_dict['pci']['pci_bus']
-        parsed_dict['pci']['bus_id'] = device_dict['pci']['pci_bus_id']
-        parsed_dict['pci']['device'] = device_dict['pci']['pci_device']
-        parsed_dict['pci']['device_id'] = device_dict['pci']['pci_device_id']
-        parsed_dict['pci']['sub_system_id'] = device_dict['pci']['pci_sub_system_id']
-        __aux_dict = device_dict['pci']['pci_gpu_link_info']
-        parsed_dict['pci']['current_link_generation'] = __aux_dict['pcie_gen']['current_link_gen']
-        parsed_dict['pci']['max_link_generation'] = __aux_dict['pcie_gen']['max_link_gen']
-        parsed_dict['pci']['current_link_width'] = __aux_dict['link_widths']['current_link_width']
-        parsed_dict['pci']['max_link_width'] = __aux_dict['link_widths']['max_link_width']
-
-        parsed_dict['clocks'] = dict()
-        parsed_dict['clocks']['graphics'] = device_dict['clocks']['graphics_clock']
-        parsed_dict['clocks']['sm'] = device_dict['clocks']['sm_clock']
-        parsed_dict['clocks']['memory'] = device_dict['clocks']['mem_clock']
-        parsed_dict['clocks']['max_graphics'] = device_dict['max_clocks']['graphics_clock']
-        parsed_dict['clocks']['max_sm'] = device_dict['max_clocks']['sm_clock']
-        parsed_dict['clocks']['max_memory'] = device_dict['max_clocks']['mem_clock']
-        parsed_dict['clocks']['unit'] = device_dict['clocks']['unit']
-
-        parsed_dict['power'] = dict()
-        parsed_dict['power']['management'] = device_dict['power_readings']['power_management']
-        parsed_dict['power']['draw'] = device_dict['power_readings']['power_draw']
-        parsed_dict['power']['limit'] = device_dict['power_readings']['power_limit']
-        parsed_dict['power']['min_limit'] = device_dict['power_readings']['min_power_limit']
-        parsed_dict['power']['max_limit'] = device_dict['power_readings']['max_power_limit']
-        parsed_dict['power']['unit'] = device_dict['power_readings']['unit']
-
-        parsed_dict['processes'] = None
-        if device_dict['processes'] is not None and device_dict['processes'] != 'N/A':
-            parsed_dict['processes'] = list()
-            for process_dict in device_dict['processes']:
-                _pid = psutil.Process(process_dict['pid'])
-                with _pid.oneshot():
-                    parsed_dict['processes'].append({
-                        'pid': _pid.pid,
-                        'name': _pid.name(),
-                        'user': _pid.username(),
-                        'parent_id': _pid.ppid(),
-                        'parent_name': _pid.parent().name(),
-                        'create_time': _pid.create_time(),
-                        'gpu_memory': process_dict['used_memory'],
-                    })
+        if 'identity' in static_fields:
+            parsed_dict['name'] = device_dict['product_name']
+            parsed_dict['serial'] = device_dict['serial']
+            parsed_dict['uuid'] = device_dict['uuid']
+            parsed_dict['bios'] = device_dict['vbios_version']
+
+        if 'memory' in fields:
+            parsed_dict['memory'] = dict()
+            parsed_dict['memory']['total'] = device_dict['fb_memory_usage']['total']
+            parsed_dict['memory']['used'] = device_dict['fb_memory_usage']['used']
+            parsed_dict['memory']['free'] = device_dict['fb_memory_usage']['free']
+            parsed_dict['memory']['unit'] = device_dict['fb_memory_usage']['unit']
+
+        if 'utilization' in fields:
+            parsed_dict['utilization'] = dict()
+            parsed_dict['utilization']['gpu'] = device_dict['utilization']['gpu_util']
+            parsed_dict['utilization']['memory'] = device_dict['utilization']['memory_util']
+            parsed_dict['utilization']['fan'] = device_dict['fan_speed']
+            parsed_dict['utilization']['performance'] = device_dict['performance_state']
+            parsed_dict['utilization']['temperature'] = device_dict['temperature']['gpu_temp']
+
+        if 'pci' in fields:
+            parsed_dict['pci'] = dict()
+            __aux_dict = device_dict['pci']['pci_gpu_link_info']
+            parsed_dict['pci']['current_link_generation'] = \
+                __aux_dict['pcie_gen']['current_link_gen']
+            parsed_dict['pci']['current_link_width'] = \
+                __aux_dict['link_widths']['current_link_width']
+            if 'pci' in static_fields:
+                parsed_dict['pci']['bus'] = device_dict['pci']['pci_bus']
+                parsed_dict['pci']['bus_id'] = device_dict['pci']['pci_bus_id']
+                parsed_dict['pci']['device'] = device_dict['pci']['pci_device']
+                parsed_dict['pci']['device_id'] = device_dict['pci']['pci_device_id']
+                parsed_dict['pci']['sub_system_id'] = device_dict['pci']['pci_sub_system_id']
+                parsed_dict['pci']['max_link_generation'] = \
+                    __aux_dict['pcie_gen']['max_link_gen']
+                parsed_dict['pci']['max_link_width'] = \
+                    __aux_dict['link_widths']['max_link_width']
+
+        if 'clocks' in fields:
+            parsed_dict['clocks'] = dict()
+            parsed_dict['clocks']['graphics'] = device_dict['clocks']['graphics_clock']
+            parsed_dict['clocks']['sm'] = device_dict['clocks']['sm_clock']
+            parsed_dict['clocks']['memory'] = device_dict['clocks']['mem_clock']
+            parsed_dict['clocks']['unit'] = device_dict['clocks']['unit']
+            if 'clocks' in static_fields:
+                parsed_dict['clocks']['max_graphics'] = device_dict['max_clocks']['graphics_clock']
+                parsed_dict['clocks']['max_sm'] = device_dict['max_clocks']['sm_clock']
+                parsed_dict['clocks']['max_memory'] = device_dict['max_clocks']['mem_clock']
+
+        if 'power' in fields:
+            parsed_dict['power'] = dict()
+            parsed_dict['power']['management'] = \
+                device_dict['power_readings']['power_management']
+            parsed_dict['power']['draw'] = device_dict['power_readings']['power_draw']
+            parsed_dict['power']['limit'] = device_dict['power_readings']['power_limit']
+            parsed_dict['power']['unit'] = device_dict['power_readings']['unit']
+            if 'power' in static_fields:
+                parsed_dict['power']['min_limit'] = \
+                    device_dict['power_readings']['min_power_limit']
+                parsed_dict['power']['max_limit'] = \
+                    device_dict['power_readings']['max_power_limit']
+
+        if 'processes' in fields:
+            parsed_dict['processes'] = None
+            if device_dict['processes'] is not None and device_dict['processes'] != 'N/A':
+                parsed_dict['processes'] = processes_info(
+                    (process_dict['pid'], process_dict['used_memory'])
+                    for process_dict in device_dict['processes']
+                ) or None
 
         return parsed_dict
 
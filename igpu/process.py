@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu process metadata cache
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+
+class ProcessCache(object):
+    """
+    Cache of the process metadata (name, user and creation time) used to attribute the GPU
+    compute processes.
+
+    The metadata of a process never changes, so it is resolved with psutil only once and cached
+    by (pid, start time), which also tells apart a reused PID. On Linux, each lookup reads a
+    single /proc/<pid>/stat file per process, which gives both the cache key and the parent
+    PID; on other platforms the key is read with psutil. Processes which exit during the lookup
+    are skipped. The metadata the current user is not allowed to read (e.g. processes of other
+    users on macOS and Windows, or a restricted procfs) is 'N/A', and such processes are not
+    cached. The least recently used entries are evicted when the cache is full.
+
+    Args:
+        max_size (int): The maximum number of cached processes.
+        proc_path (str): The procfs mount point. If it does not exist, psutil is used instead.
+    """
+
+    def __init__(self, max_size: int = 4096, proc_path: str = '/proc') -> None:
+        if max_size <= 0:
+            raise ValueError(f'Invalid max size: {max_size}')
+        self._max_size = max_size
+        self._proc_path = proc_path if os.path.isdir(proc_path) else None
+        self._entries: 'OrderedDict[Tuple[int, Any], Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self) -> int:
+        """int: Returns the maximum number of cached processes."""
+        return self._max_size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Clears all cached processes."""
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, processes: Iterable[Tuple[int, int]]) -> List[Dict]:
+        """
+        Given a list of (pid, gpu memory) pairs, returns the parsed process dicts, as expected
+        by GPUProcessInfo. Processes which no longer exist are not returned.
+
+        Args:
+            processes (list): The (pid, gpu memory in MiB) pairs.
+
+        Returns:
+            list: A list of dicts with the process attributes.
+        """
+        ret = list()
+        for pid, gpu_memory in processes:
+            stat = self._stat(pid)
+            if stat is None:
+                continue
+            start, ppid = stat
+            entry = self._resolve(pid, start)
+            if entry is None:
+                continue
+            parent_name = 'N/A'
+            parent_stat = self._stat(ppid) if ppid > 0 else None
+            if parent_stat is not None:
+                parent = self._resolve(ppid, parent_stat[0])
+                if parent is not None:
+                    parent_name = parent['name']
+            ret.append({
+                'pid': pid,
+                'name': entry['name'],
+                'user': entry['user'],
+                'parent_id': ppid,
+                'parent_name': parent_name,
+                'create_time': entry['create_time'],
+                'gpu_memory': gpu_memory,
+            })
+        return ret
+
+    def _stat(self, pid: int) -> Optional[Tuple[Any, int]]:
+        """
+        Returns the (start time, parent pid) of a process, or None if it does not exist. If it
+        cannot be read, returns (None, 0): the process is not cached and has no parent.
+        """
+        if self._proc_path is None:
+            import psutil #pylint: disable=import-outside-toplevel
+            try:
+                process = psutil.Process(pid)
+                with process.oneshot():
+                    return process.create_time(), process.ppid()
+            except psutil.NoSuchProcess:
+                return None
+            except (psutil.AccessDenied, PermissionError):
+                return None, 0
+        try:
+            with open(f'{self._proc_path}/{pid}/stat', 'rb') as stat_file:
+                data = stat_file.read()
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+        except PermissionError:
+            return None, 0
+        # The process name may contain spaces and parentheses, so split after the last ')'.
+        # The remaining fields start at the 3rd field: state, ppid, ..., starttime (22nd).
+        values = data[data.rfind(b')') + 2:].split()
+        return int(values[19]), int(values[1])
+
+    def _resolve(self, pid: int, start: Any) -> Optional[Dict]:
+        key = (pid, start)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        import psutil #pylint: disable=import-outside-toplevel
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                entry = {
+                    'name': self._attribute(process.name),
+                    'user': self._attribute(process.username),
+                    'create_time': self._attribute(process.create_time),
+                }
+        except psutil.NoSuchProcess:
+            return None
+        except (psutil.AccessDenied, PermissionError):
+            entry = {'name': 'N/A', 'user': 'N/A', 'create_time': 'N/A'}
+        if start is None or 'N/A' in entry.values():
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _attribute(getter) -> Any:
+        """Returns a process attribute, or 'N/A' if the current user cannot read it."""
+        import psutil #pylint: disable=import-outside-toplevel
+        try:
+            return getter()
+        except (psutil.AccessDenied, PermissionError):
+            return 'N/A'
+
+
+__PROCESS_CACHE: Optional[ProcessCache] = None
+
+
+def get_process_cache() -> ProcessCache:
+    """
+    Returns the process metadata cache used by the backends, creating it on the first call.
+
+    Returns:
+        ProcessCache: The process metadata cache.
+    """
+    global __PROCESS_CACHE #pylint: disable=global-statement
+    if __PROCESS_CACHE is None:
+        __PROCESS_CACHE = ProcessCache()
+    return __PROCESS_CACHE
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu binary telemetry recorder
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import json
+import time
+import struct
+from typing import Dict, List, Optional, Iterable, Tuple, Any
+import numpy as np
+from igpu import metrics as igpu_metrics
+from igpu.backend import get_backend
+
+MAGIC = b'IGPUREC\x00'
+VERSION = 1
+
+# The header is padded so the records start at a multiple of this size.
+_ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sI')
+
+
+def record_dtype(devices: int, metrics: Iterable[str], value_dtype: Any = 'f4') -> np.dtype:
+    """
+    Returns the dtype of a record: a float64 'timestamp' followed by one field per metric, with
+    one value per device.
+
+    Args:
+        devices (int): The number of recorded devices.
+        metrics (list): The metric names (see `igpu.metrics.METRIC_NAMES`).
+        value_dtype (dtype): The floating point type of the values.
+
+    Returns:
+        dtype: The record dtype.
+    """
+    value_dtype = np.dtype(value_dtype).newbyteorder('<')
+    return np.dtype(
+        [('timestamp', '<f8')] + [(name, value_dtype, (devices,)) for name in metrics]
+    )
+
+
+def read_header(path: str) -> Tuple[Dict, int]:
+    """
+    Reads the header of a recording file.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        tuple: The header dict and the offset of the first record, in bytes.
+    """
+    with open(path, 'rb') as rec_file:
+        prefix = rec_file.read(_PREFIX.size)
+        if len(prefix) != _PREFIX.size:
+            raise ValueError(f'Invalid recording file: {path}')
+        magic, length = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError(f'Invalid recording file: {path}')
+        header = json.loads(rec_file.read(length).decode('utf-8'))
+    if header.get('version') != VERSION:
+        raise ValueError(f'Unsupported recording version: {header.get("version")}')
+    return header, _header_size(length)
+
+
+def _header_size(length: int) -> int:
+    size = _PREFIX.size + length
+    return size + (-size) % _ALIGNMENT
+
+
+class Recorder(object):
+    """
+    Appends GPU telemetry samples to a binary file of fixed-size records.
+
+    The file starts with a small JSON header (devices, metrics and value type), padded to a
+    64-byte boundary, followed by one record per sample (see `record_dtype`). Each sample is
+    packed into a preallocated record and written with a single call, so recording allocates
+    nothing per sample. Opening an existing file appends to it when the header matches; a
+    partially written record left by an interrupted writer is discarded.
+
+    Missing values are stored as NaN. By default, the values are stored as float32 (48 bytes
+    per device per sample with all metrics).
+
+    Args:
+        path (str): The file path.
+        devices (list): The indexes of the recorded devices. If None, all available devices.
+        metrics (list): The metric names (see `igpu.metrics.METRIC_NAMES`). If None, all
+            metrics.
+        value_dtype (dtype): The floating point type of the values.
+    """
+
+    def __init__(self, path: str, devices: Optional[Iterable[int]] = None,
+                 metrics: Optional[Iterable[str]] = None, value_dtype: Any = 'f4') -> None:
+        if devices is None:
+            devices = range(get_backend().device_count())
+        self._path = path
+        self._devices = list(devices)
+        self._metrics = igpu_metrics.check_metrics(metrics)
+        if not self._metrics:
+            raise ValueError('No metrics to record')
+        self._dtype = record_dtype(len(self._devices), self._metrics, value_dtype)
+        self._record = np.zeros(1, dtype=self._dtype)
+        # The metric fields are contiguous after the timestamp, so a sample is packed with a
+        # single copy into this (metrics, devices) view of the record.
+        self._block = self._record.view(np.uint8)[8:].view(self._dtype[1].base).reshape(
+            len(self._metrics), len(self._devices))
+        self._values = np.empty((len(self._devices), len(self._metrics)))
+        header = {
+            'version': VERSION,
+            'devices': self._devices,
+            'metrics': list(self._metrics),
+            'value_dtype': np.dtype(value_dtype).newbyteorder('<').str,
+            'created': time.time(),
+        }
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._file = self._open_append(header)
+        else:
+            self._file = open(path, 'wb')
+            data = json.dumps(header).encode('utf-8')
+            self._file.write(_PREFIX.pack(MAGIC, len(data)) + data)
+            self._file.write(b'\x00' * (_header_size(len(data)) - _PREFIX.size - len(data)))
+            self._file.flush()
+
+    def _open_append(self, header: Dict) -> Any:
+        current, offset = read_header(self._path)
+        for key in ('devices', 'metrics', 'value_dtype'):
+            if current[key] != header[key]:
+                raise ValueError(f'The recording {self._path} has different {key}: '
+                                 f'{current[key]} (expected {header[key]})')
+        size = os.path.getsize(self._path)
+        complete = offset + (size - offset) // self._dtype.itemsize * self._dtype.itemsize
+        rec_file = open(self._path, 'r+b')
+        rec_file.truncate(complete)
+        rec_file.seek(complete)
+        return rec_file
+
+    @property
+    def path(self) -> str:
+        """str: Returns the file path."""
+        return self._path
+
+    @property
+    def devices(self) -> List[int]:
+        """list: Returns the indexes of the recorded devices."""
+        return list(self._devices)
+
+    @property
+    def metrics(self) -> Tuple[str, ...]:
+        """tuple: Returns the names of the recorded metrics."""
+        return self._metrics
+
+    @property
+    def dtype(self) -> np.dtype:
+        """dtype: Returns the record dtype."""
+        return self._dtype
+
+    def write(self, values: np.ndarray, timestamp: Optional[float] = None) -> None:
+        """
+        Appends a sample.
+
+        Args:
+            values (ndarray): The sample values, with shape (devices, metrics).
+            timestamp (float): The sample time, in seconds since the epoch. If None, now.
+        """
+        self._record['timestamp'] = time.time() if timestamp is None else timestamp
+        self._block[:] = values.T
+        self._file.write(self._record.data)
+
+    def record(self) -> None:
+        """
+        Reads the devices and appends the sample.
+        """
+        backend = get_backend()
+        timestamp = time.time()
+        for row, device_index in enumerate(self._devices):
+            if not backend.read_metrics(device_index, self._metrics, self._values[row]):
+                raise ValueError(f'Invalid device index: {device_index}')
+        self.write(self._values, timestamp)
+
+    def flush(self) -> None:
+        """Flushes the written samples to the file."""
+        self._file.flush()
+
+    def close(self) -> None:
+        """Flushes and closes the file."""
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class Recording(object):
+    """
+    Read-only view of a recording file, mapped in memory.
+
+    The records are exposed as NumPy arrays backed by the file (np.memmap), so opening a
+    recording does not read it and slicing a metric does not copy it. Samples appended after
+    the recording was opened are not visible; open it again to see them.
+
+    Args:
+        path (str): The file path.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._header, offset = read_header(path)
+        self._path = path
+        self._devices = list(self._header['devices'])
+        self._metrics = tuple(self._header['metrics'])
+        self._rows = {device_index: row for row, device_index in enumerate(self._devices)}
+        dtype = record_dtype(len(self._devices), self._metrics, self._header['value_dtype'])
+        count = (os.path.getsize(path) - offset) // dtype.itemsize
+        if count > 0:
+            self._records = np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                                      shape=(count,))
+        else:
+            self._records = np.zeros(0, dtype=dtype)
+
+    @property
+    def path(self) -> str:
+        """str: Returns the file path."""
+        return self._path
+
+    @property
+    def header(self) -> Dict:
+        """dict: Returns the file header."""
+        return dict(self._header)
+
+    @property
+    def devices(self) -> List[int]:
+        """list: Returns the indexes of the recorded devices."""
+        return list(self._devices)
+
+    @property
+    def metrics(self) -> Tuple[str, ...]:
+        """tuple: Returns the names of the recorded metrics."""
+        return self._metrics
+
+    @property
+    def records(self) -> np.ndarray:
+        """ndarray: Returns the structured array of all records."""
+        return self._records
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """ndarray: Returns the sample timestamps, in seconds since the epoch."""
+        return self._records['timestamp']
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, metric: str) -> np.ndarray:
+        """
+        Returns the values of a metric for all devices, with shape (samples, devices).
+        """
+        if metric not in self._metrics:
+            raise ValueError(f'Metric not recorded: {metric}. Recorded: {list(self._metrics)}')
+        return self._records[metric]
+
+    def values(self, metric: str, device: int) -> np.ndarray:
+        """
+        Returns the values of a metric for a device, as a view of the file.
+
+        Args:
+            metric (str): The metric name (e.g. 'memory.used').
+            device (int): The device index.
+
+        Returns:
+            ndarray: The metric values, one per sample.
+        """
+        try:
+            row = self._rows[device]
+        except KeyError:
+            raise ValueError(f'Device not recorded: {device}. Recorded: {self._devices}')
+        return self[metric][:, row]
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu replay backend
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import math
+import time
+import functools
+from typing import Dict, List, Optional, Any, Tuple, Sequence
+import numpy as np
+from igpu import metrics as igpu_metrics
+from igpu.backend import Backend, set_backend
+from igpu.recorder import Recording
+
+
+class ReplayClock(object):
+    """
+    The clock of a replay. A manual clock (the default) only moves when `advance` or `set` are
+    called, which makes the replay deterministic and as fast as the code under test. With a
+    `speed`, the clock follows the monotonic clock, scaled by the given factor.
+
+    Args:
+        start (float): The initial time, in seconds.
+        speed (float): If given, the clock runs `speed` times faster than the real time.
+    """
+
+    def __init__(self, start: float = 0.0, speed: Optional[float] = None) -> None:
+        if speed is not None and speed <= 0:
+            raise ValueError(f'Invalid speed: {speed}')
+        self._start = start
+        self._speed = speed
+        self._origin = time.monotonic()
+
+    def time(self) -> float:
+        """
+        Returns the current time of the replay.
+
+        Returns:
+            float: The time, in seconds.
+        """
+        if self._speed is None:
+            return self._start
+        return self._start + (time.monotonic() - self._origin) * self._speed
+
+    def set(self, value: float) -> None:
+        """
+        Sets the current time of the replay.
+
+        Args:
+            value (float): The time, in seconds.
+        """
+        self._start = value
+        self._origin = time.monotonic()
+
+    def advance(self, seconds: float) -> float:
+        """
+        Moves the clock forward.
+
+        Args:
+            seconds (float): The time step, in seconds.
+
+        Returns:
+            float: The new time.
+        """
+        self.set(self.time() + seconds)
+        return self._start
+
+
+class RecordingTrace(object):
+    """
+    A trace read from a recording file (see `igpu.recorder.Recording`). The values at a given
+    time are the ones of the last sample taken at or before it (the first sample before the
+    start of the recording).
+
+    Args:
+        recording (Recording or str): The recording, or the path of a recording file.
+        loop (bool): If True, the trace repeats itself after its last sample.
+    """
+
+    def __init__(self, recording: Any, loop: bool = False) -> None:
+        if isinstance(recording, str):
+            recording = Recording(recording)
+        if len(recording) == 0:
+            raise ValueError(f'Empty recording: {recording.path}')
+        self._recording = recording
+        self._timestamps = np.asarray(recording.timestamps)
+        self._loop = loop
+        self._values = np.empty((len(recording.devices), len(recording.metrics)))
+        self._row = -1
+
+    @property
+    def devices(self) -> List[int]:
+        """list: Returns the device indexes."""
+        return self._recording.devices
+
+    @property
+    def metrics(self) -> Tuple[str, ...]:
+        """tuple: Returns the metric names."""
+        return self._recording.metrics
+
+    @property
+    def start(self) -> float:
+        """float: Returns the time of the first sample."""
+        return float(self._timestamps[0])
+
+    def values_at(self, when: float) -> np.ndarray:
+        """
+        Returns the values at the given time.
+
+        Args:
+            when (float): The time, in seconds since the epoch.
+
+        Returns:
+            ndarray: The values, with shape (devices, metrics). The array is reused by the next
+            call.
+        """
+        timestamps = self._timestamps
+        if self._loop and len(timestamps) > 1:
+            duration = timestamps[-1] - timestamps[0]
+            if duration > 0:
+                when = timestamps[0] + (when - timestamps[0]) % duration
+        row = max(int(np.searchsorted(timestamps, when, side='right')) - 1, 0)
+        if row != self._row:
+            records = self._recording.records
+            for column, name in enumerate(self._recording.metrics):
+                self._values[:, column] = records[name][row]
+            self._row = row
+        return self._values
+
+
+class SyntheticTrace(object):
+    """
+    A deterministic synthetic trace, for any number of devices. Each device follows smooth
+    periodic load curves, with a phase and a period drawn from `seed`: the GPU utilization
+    drives the memory utilization, the fan, the temperature, the clocks and the power draw.
+
+    Args:
+        device_count (int): The number of devices.
+        seed (int): The seed of the device phases and periods.
+        period (float): The mean period of the load curves, in seconds.
+        memory_total (float): The total memory of each device, in MiB.
+        power_limit (float): The power limit of each device, in W.
+    """
+
+    def __init__(self, device_count: int = 1, seed: int = 0, period: float = 60.0,
+                 memory_total: float = 16384.0, power_limit: float = 250.0) -> None:
+        if device_count <= 0:
+            raise ValueError(f'Invalid device count: {device_count}')
+        rng = np.random.RandomState(seed)
+        self._phases = rng.uniform(0, 2 * math.pi, (2, device_count))
+        self._periods = period * rng.uniform(0.5, 1.5, (2, device_count))
+        self._memory_total = memory_total
+        self._power_limit = power_limit
+        self._values = np.empty((device_count, len(igpu_metrics.METRIC_NAMES)))
+        self._when: Optional[float] = None
+
+    @property
+    def devices(self) -> List[int]:
+        """list: Returns the device indexes."""
+        return list(range(len(self._values)))
+
+    @property
+    def metrics(self) -> Tuple[str, ...]:
+        """tuple: Returns the metric names."""
+        return igpu_metrics.METRIC_NAMES
+
+    @property
+    def start(self) -> float:
+        """float: Returns the start time of the trace."""
+        return 0.0
+
+    def values_at(self, when: float) -> np.ndarray:
+        """
+        Returns the values at the given time.
+
+        Args:
+            when (float): The time, in seconds.
+
+        Returns:
+            ndarray: The values, with shape (devices, metrics). The array is reused by the next
+            call.
+        """
+        if when == self._when:
+            return self._values
+        load = 0.5 + 0.5 * np.sin(2 * math.pi * when / self._periods + self._phases)
+        gpu = np.rint(100 * load[0])
+        used = np.rint(self._memory_total * (0.05 + 0.9 * load[1]))
+        columns = {
+            'memory.total': self._memory_total,
+            'memory.used': used,
+            'memory.free': self._memory_total - used,
+            'utilization.gpu': gpu,
+            'utilization.memory': np.rint(0.6 * gpu),
+            'utilization.fan': np.rint(25 + 0.6 * gpu),
+            'utilization.temperature': np.rint(35 + 0.5 * gpu),
+            'clocks.graphics': np.rint(300 + 16 * gpu),
+            'clocks.sm': np.rint(300 + 16 * gpu),
+            'clocks.memory': np.where(gpu > 0, 5505.0, 405.0),
+            'power.draw': np.round(20 + (self._power_limit - 40) * load[0], 2),
+            'power.limit': self._power_limit,
+        }
+        for column, name in enumerate(igpu_metrics.METRIC_NAMES):
+            self._values[:, column] = columns[name]
+        self._when = when
+        return self._values
+
+
+class ReplayBackend(Backend):
+    """
+    Backend that replays a trace instead of querying the devices, so igpu, and everything built
+    on it, can run on hosts with no GPU and faster than the real time.
+
+    A trace is any object with `devices`, `metrics`, `start` and `values_at(time)` (see
+    `RecordingTrace` and `SyntheticTrace`). The values returned by the queries are the ones of
+    the trace at the current time of the replay clock. The attributes which are not in the
+    trace (identification, PCI, maximum clocks, etc.) are filled with fixed values; there are no
+    processes. The devices of the trace are replayed as the devices 0 to n-1, in their order in
+    the trace, so a recording of the devices 2 and 3 is replayed as the devices 0 and 1 (as
+    CUDA_VISIBLE_DEVICES renumbers the visible devices).
+
+    Args:
+        trace: The replayed trace. A Recording or a recording path is replayed with a
+            RecordingTrace.
+        clock (ReplayClock): The replay clock. If None, a manual clock starting at the start
+            of the trace.
+        name (str): The board name of the replayed devices.
+        driver_version (str): The reported driver version.
+    """
+
+    def __init__(self, trace: Any, clock: Optional[ReplayClock] = None,
+                 name: str = 'Replay GPU', driver_version: str = '0.0') -> None:
+        Backend.__init__(self)
+        if isinstance(trace, (str, Recording)):
+            trace = RecordingTrace(trace)
+        self._trace = trace
+        self.clock = ReplayClock(trace.start) if clock is None else clock
+        self._name = name
+        self._driver_version = driver_version
+        self._device_count = len(trace.devices)
+        self._columns = {name: column for column, name in enumerate(trace.metrics)}
+
+    @property
+    def trace(self) -> Any:
+        """Returns the replayed trace."""
+        return self._trace
+
+    def device_count(self) -> int:
+        return self._device_count
+
+    def driver_version(self) -> Optional[str]:
+        return self._driver_version
+
+    def read_metrics(self, device_index: int, metrics: Sequence[str], out: Any) -> bool:
+        if not 0 <= device_index < self._device_count:
+            return False
+        values = self._trace.values_at(self.clock.time())[device_index]
+        for position, name in enumerate(metrics):
+            column = self._columns.get(name)
+            out[position] = values[column] if column is not None else float('NaN')
+        return True
+
+    def _value(self, values: np.ndarray, metric: str, integer: bool = False) -> Any:
+        column = self._columns.get(metric)
+        if column is None or math.isnan(values[column]):
+            return 'N/A'
+        value = float(values[column])
+        return int(value) if integer else value
+
+    def _query(self, device_index: int, fields: Tuple[str, ...],
+               static_fields: Tuple[str, ...]) -> Optional[Dict]:
+        if not 0 <= device_index < self._device_count:
+            return None
+        values = self._trace.values_at(self.clock.time())[device_index]
+        value = functools.partial(self._value, values)
+        parsed_dict: Dict[str, Any] = {'index': device_index}
+        if 'identity' in static_fields:
+            parsed_dict.update({
+                'name': self._name,
+                'serial': f'{device_index:013d}',
+                'uuid': f'GPU-{device_index:08x}-0000-0000-0000-{device_index:012x}',
+                'bios': 'N/A',
+            })
+        if 'memory' in fields:
+            parsed_dict['memory'] = {
+                'total': value('memory.total'), 'used': value('memory.used'),
+                'free': value('memory.free'), 'unit': 'MiB',
+            }
+        if 'utilization' in fields:
+            gpu = value('utilization.gpu', True)
+            parsed_dict['utilization'] = {
+                'gpu': gpu, 'memory': value('utilization.memory', True),
+                'fan': value('utilization.fan', True),
+                'performance': 'P0' if isinstance(gpu, int) and gpu > 0 else 'P8',
+                'temperature': value('utilization.temperature', True),
+            }
+        if 'pci' in fields:
+            parsed_dict['pci'] = {'current_link_generation': '3', 'current_link_width': '16x'}
+            if 'pci' in static_fields:
+                parsed_dict['pci'].update({
+                    'bus': f'{device_index % 256:02X}',
+                    'bus_id': f'{device_index // 256:08X}:{device_index % 256:02X}:00.0',
+                    'device': '00', 'device_id': 'N/A', 'sub_system_id': 'N/A',
+                    'max_link_generation': '3', 'max_link_width': '16x',
+                })
+        if 'clocks' in fields:
+            parsed_dict['clocks'] = {
+                'graphics': value('clocks.graphics', True), 'sm': value('clocks.sm', True),
+                'memory': value('clocks.memory', True), 'unit': 'MHz',
+            }
+            if 'clocks' in static_fields:
+                parsed_dict['clocks'].update(
+                    {'max_graphics': 'N/A', 'max_sm': 'N/A', 'max_memory': 'N/A'})
+        if 'power' in fields:
+            parsed_dict['power'] = {
+                'management': 'Supported', 'draw': value('power.draw'),
+                'limit': value('power.limit'), 'unit': 'W',
+            }
+            if 'power' in static_fields:
+                parsed_dict['power'].update({'min_limit': 'N/A', 'max_limit': 'N/A'})
+        if 'processes' in fields:
+            parsed_dict['processes'] = None
+        return parsed_dict
+
+
+def replay(trace: Any, clock: Optional[ReplayClock] = None) -> ReplayBackend:
+    """
+    Creates a ReplayBackend and sets it as the current backend (see `backend.set_backend`).
+
+    Args:
+        trace: The replayed trace, a recording or a recording path.
+        clock (ReplayClock): The replay clock. If None, a manual clock starting at the start
+            of the trace.
+
+    Returns:
+        ReplayBackend: The new current backend.
+    """
+    backend = ReplayBackend(trace, clock)
+    set_backend(backend)
+    return backend
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu background sampler
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import time
+import threading
+from typing import List, Optional, Iterable, Union, Any
+import numpy as np
+from igpu import metrics as igpu_metrics
+from igpu.backend import get_backend
+
+
+class Sampler(object):
+    """
+    Polls the GPU metrics on a background thread, writing them into preallocated ring buffers.
+
+    Each metric of each device has a fixed-size float64 ring buffer, allocated on the sampler
+    creation, so sampling does not allocate a Python object per sample. The buffers are written
+    by a single thread and read without locks: a sample becomes visible to the readers only
+    after all its values are written. Missing values are stored as NaN.
+
+    Args:
+        interval (float): The sampling interval, in seconds.
+        devices (list): The indexes of the sampled devices. If None, all available devices.
+        fields (list): The GPUInfo sections to sample ('memory', 'utilization', 'clocks' and
+            'power'). If None, all of them. See `igpu.metrics.METRICS` for the metric names.
+        capacity (int): The number of samples kept in the ring buffers.
+        recorder (Recorder): A recorder (see `igpu.recorder.Recorder`) where each sample is also
+            appended. It must record the same devices and metrics as the sampler.
+    """
+
+    def __init__(self, interval: float = 1.0, devices: Optional[Iterable[int]] = None,
+                 fields: Optional[Iterable[str]] = None, capacity: int = 3600,
+                 recorder: Optional[Any] = None) -> None:
+        if interval <= 0:
+            raise ValueError(f'Invalid interval: {interval}')
+        if capacity <= 0:
+            raise ValueError(f'Invalid capacity: {capacity}')
+        self._interval = interval
+        self._capacity = capacity
+        if devices is None:
+            devices = range(get_backend().device_count())
+        self._devices = list(devices)
+        self._rows = {device_index: row for row, device_index in enumerate(self._devices)}
+        self._metrics = igpu_metrics.metrics_of(fields)
+        self._values = np.empty((len(self._devices), len(self._metrics)))
+        self._buffers = {
+            name: np.full((len(self._devices), capacity), np.nan) for name in self._metrics
+        }
+        self._timestamps = np.full(capacity, np.nan)
+        if recorder is not None and (recorder.devices != self._devices or
+                                     recorder.metrics != self._metrics):
+            raise ValueError(f'The recorder must record the sampled devices {self._devices} '
+                             f'and metrics {list(self._metrics)}')
+        self._recorder = recorder
+        self._histories: List[Any] = list()
+        self._count = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def interval(self) -> float:
+        """float: Returns the sampling interval, in seconds."""
+        return self._interval
+
+    @property
+    def capacity(self) -> int:
+        """int: Returns the number of samples kept in the ring buffers."""
+        return self._capacity
+
+    @property
+    def devices(self) -> List[int]:
+        """list: Returns the indexes of the sampled devices."""
+        return list(self._devices)
+
+    @property
+    def metrics(self) -> tuple:
+        """tuple: Returns the names of the sampled metrics."""
+        return self._metrics
+
+    @property
+    def count(self) -> int:
+        """int: Returns the total number of samples taken since the sampler creation."""
+        return self._count
+
+    @property
+    def running(self) -> bool:
+        """bool: Returns True if the sampling thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> 'Sampler':
+        """
+        Starts the sampling thread.
+
+        Returns:
+            Sampler: The sampler itself.
+        """
+        if self.running:
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='igpu-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops the sampling thread, waiting for the current sample to finish.
+
+        Args:
+            timeout (float): The maximum time to wait for the thread, in seconds.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def sample(self) -> None:
+        """
+        Takes one sample of all devices and writes it into the ring buffers. Called by the
+        sampling thread at each interval; it can also be called directly when the thread is not
+        running.
+        """
+        backend = get_backend()
+        values = self._values
+        for row, device_index in enumerate(self._devices):
+            if not backend.read_metrics(device_index, self._metrics, values[row]):
+                raise ValueError(f'Invalid device index: {device_index}')
+        timestamp = time.time()
+        for history, columns in self._histories:
+            history.update(values[:, columns], timestamp, self._count, self._buffers,
+                           self._timestamps)
+        slot = self._count % self._capacity
+        for column, name in enumerate(self._metrics):
+            self._buffers[name][:, slot] = values[:, column]
+        self._timestamps[slot] = timestamp
+        self._count += 1
+        if self._recorder is not None:
+            self._recorder.write(values, timestamp)
+
+    def add_history(self, windows: Iterable[Union[str, float]] = ('1m', '5m'),
+                    metrics: Optional[Iterable[str]] = None,
+                    relative_accuracy: Optional[float] = 0.01) -> Any:
+        """
+        Creates rolling statistics of the sampled metrics (see `igpu.history.History`), updated
+        by the sampler at each following sample.
+
+        Args:
+            windows (list): The window lengths, in seconds or as strings with a unit suffix
+                ('s', 'm', 'h' or 'd'), e.g. '5m'. Each window must fit in the samples kept by
+                the sampler (`capacity` * `interval` seconds).
+            metrics (list): The metrics of the statistics. If None, all sampled metrics.
+            relative_accuracy (float): The relative accuracy of the quantiles. If None, the
+                quantiles are not computed.
+
+        Returns:
+            History: The rolling statistics.
+        """
+        from igpu.history import History, parse_window #pylint: disable=import-outside-toplevel
+        windows = list(windows)
+        for window in windows:
+            if parse_window(window) > self._capacity * self._interval:
+                raise ValueError(f'The window {window} is longer than the samples kept by the '
+                                 f'sampler ({self._capacity * self._interval} seconds)')
+        metrics = self._metrics if metrics is None else igpu_metrics.check_metrics(metrics)
+        not_sampled = [name for name in metrics if name not in self._buffers]
+        if not_sampled:
+            raise ValueError(f'Metrics not sampled: {not_sampled}. Sampled: {list(self._metrics)}')
+        columns = [self._metrics.index(name) for name in metrics]
+        history = History(windows, metrics, self._devices, relative_accuracy, self._count)
+        self._histories.append((history, columns))
+        return history
+
+    def _run(self) -> None:
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as err: #pylint: disable=broad-except
+                self.last_error = err
+            next_time += self._interval
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            self._stop_event.wait(next_time - now)
+
+    def _row(self, device: int) -> int:
+        try:
+            return self._rows[device]
+        except KeyError:
+            raise ValueError(f'Device not sampled: {device}. Sampled: {self._devices}')
+
+    def _buffer(self, metric: str) -> np.ndarray:
+        try:
+            return self._buffers[metric]
+        except KeyError:
+            raise ValueError(f'Metric not sampled: {metric}. Sampled: {list(self._metrics)}')
+
+    def latest(self, metric: str, device: Optional[int] = None) -> Union[float, np.ndarray]:
+        """
+        Returns the latest value of a metric.
+
+        Args:
+            metric (str): The metric name (e.g. 'memory.used').
+            device (int): The device index. If None, the values of all sampled devices.
+
+        Returns:
+            float or ndarray: The latest value, or NaN if no sample was taken yet. If `device`
+            is None, an array with one value per sampled device.
+        """
+        buffer = self._buffer(metric)
+        count = self._count
+        if device is None:
+            if count == 0:
+                return np.full(len(self._devices), np.nan)
+            return buffer[:, (count - 1) % self._capacity].copy()
+        if count == 0:
+            return float('NaN')
+        return float(buffer[self._row(device), (count - 1) % self._capacity])
+
+    def window(self, metric: str, device: int, size: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the last `size` values of a metric, from the oldest to the newest.
+
+        When the window does not wrap around the end of the ring buffer, the returned array is a
+        read-only view of the buffer (no copy). Note that the values of a view are overwritten
+        once the sampler goes around the buffer; copy the array to keep it.
+
+        Args:
+            metric (str): The metric name (e.g. 'memory.used').
+            device (int): The device index.
+            size (int): The number of samples. If None, all samples kept in the buffer.
+
+        Returns:
+            ndarray: The metric values.
+        """
+        return self._window(self._buffer(metric)[self._row(device)], size)
+
+    def timestamps(self, size: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the timestamps (seconds since the epoch) of the last `size` samples, aligned
+        with `window`.
+
+        Args:
+            size (int): The number of samples. If None, all samples kept in the buffer.
+
+        Returns:
+            ndarray: The sample timestamps.
+        """
+        return self._window(self._timestamps, size)
+
+    def _window(self, buffer: np.ndarray, size: Optional[int]) -> np.ndarray:
+        count = self._count
+        available = min(count, self._capacity)
+        size = available if size is None else min(max(size, 0), available)
+        end = (count - 1) % self._capacity + 1 if count else 0
+        start = end - size
+        if start >= 0:
+            ret = buffer[start:end]
+            ret.flags.writeable = False
+            return ret
+        return np.concatenate((buffer[start:], buffer[:end]))
+
+    def __enter__(self) -> 'Sampler':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
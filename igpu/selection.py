@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu device selection
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import itertools
+from typing import List, Optional, Iterable, Union, Sequence
+import numpy as np
+from igpu.backend import Backend, get_backend
+from igpu.columnar import snapshot
+
+PREFERENCES = ('least_loaded', 'packed')
+
+# The metrics read by a selection, the only device reads besides the process counts.
+_METRICS = ('memory.free', 'utilization.gpu')
+
+
+def _rank(free: np.ndarray, util: np.ndarray, prefer: str) -> np.ndarray:
+    """Returns the candidate positions, from the best to the worst."""
+    if prefer == 'least_loaded':
+        # The least utilized first, then the one with more free memory.
+        return np.lexsort((-free, util))
+    # The one with less free memory first (best fit), then the most utilized.
+    return np.lexsort((-util, free))
+
+
+def _group(candidates: Sequence[int], count: int, backend: Backend) -> List[int]:
+    """
+    Returns the `count` candidates closest to each other in the system topology, preferring
+    the best ranked ones. Each candidate is tried as the seed of a group, which is grown with
+    the candidate closest to its members; the group with the lowest topology level wins, and
+    ties are broken by the rank of the worst member, then by the sum of the ranks.
+    """
+    levels = dict()
+    for device_a, device_b in itertools.combinations(candidates, 2):
+        level = backend.topology_level(device_a, device_b)
+        if level is None:
+            return list(candidates[:count])
+        levels[device_a, device_b] = levels[device_b, device_a] = level
+
+    best, best_cost = list(candidates[:count]), None
+    ranks = {device_index: rank for rank, device_index in enumerate(candidates)}
+    for seed in candidates:
+        group = [seed]
+        distance = {device_index: levels[seed, device_index]
+                    for device_index in candidates if device_index != seed}
+        while len(group) < count:
+            device_index = min(distance, key=lambda index: (distance[index], ranks[index]))
+            group.append(device_index)
+            del distance[device_index]
+            for other in distance:
+                distance[other] = max(distance[other], levels[device_index, other])
+        group_ranks = [ranks[device_index] for device_index in group]
+        cost = (max(levels[pair] for pair in itertools.combinations(group, 2)),
+                max(group_ranks), sum(group_ranks))
+        if best_cost is None or cost < best_cost:
+            best, best_cost = group, cost
+    return sorted(best, key=ranks.get)
+
+
+def select(count: int = 1, min_free_memory: Optional[float] = None,
+           max_util: Optional[float] = None, prefer: str = 'least_loaded',
+           exclude_busy_processes: bool = True, topology_aware: bool = True,
+           devices: Optional[Iterable[int]] = None, as_env: bool = False,
+           uuids: bool = True) -> Union[List[int], str]:
+    """
+    Selects the best devices to place a job, all or nothing.
+
+    The free memory and the utilization of the devices are read in a single columnar snapshot
+    (see `igpu.snapshot`), filtered and ranked on the arrays, without building GPUInfo objects.
+    The process counts are only read for the devices which pass the other filters, and the
+    topology levels (see `Backend.topology_level`) are read once and cached by the backend.
+
+    Args:
+        count (int): The number of devices.
+        min_free_memory (float): The minimum free memory of each device, in MiB.
+        max_util (float): The maximum GPU utilization of each device, in percent.
+        prefer (str): The ranking of the devices: 'least_loaded' prefers the least utilized
+            devices (then the ones with more free memory), spreading the jobs; 'packed' prefers
+            the devices with less free memory which fit the job (then the most utilized ones),
+            keeping other devices free for larger jobs.
+        exclude_busy_processes (bool): If True, the devices with any compute process are
+            excluded.
+        topology_aware (bool): If True and `count` > 1, the selected devices are the closest to
+            each other in the system topology (e.g. under the same PCIe switch), then the best
+            ranked ones.
+        devices (list): The indexes of the candidate devices. If None, all available devices.
+        as_env (bool): If True, returns the selection as a CUDA_VISIBLE_DEVICES value (see
+            `cuda_visible_devices`).
+        uuids (bool): If True, the CUDA_VISIBLE_DEVICES value lists the device UUIDs, which
+            select the same devices whatever the CUDA device order. The indexes follow the NVML
+            (PCI bus) order, while the CUDA runtime numbers the devices fastest first by
+            default, so an index value is only right with CUDA_DEVICE_ORDER=PCI_BUS_ID.
+
+    Returns:
+        list: The indexes of the selected devices, from the best to the worst ranked, or an
+        empty list (an empty string if `as_env` is True) if less than `count` devices qualify.
+    """
+    if count < 1:
+        raise ValueError(f'Invalid count: {count}')
+    if prefer not in PREFERENCES:
+        raise ValueError(f'Invalid preference: {prefer}. Valid: {list(PREFERENCES)}')
+    backend = get_backend()
+    array = snapshot(devices, _METRICS, backend=backend)
+    free, util = array['memory.free'], array['utilization.gpu']
+
+    mask = np.ones(len(array), dtype=bool)
+    if min_free_memory is not None:
+        mask &= free >= min_free_memory
+    if max_util is not None:
+        mask &= util <= max_util
+    positions = np.flatnonzero(mask)
+    if exclude_busy_processes:
+        positions = [position for position in positions
+                     if backend.process_count(int(array['index'][position])) == 0]
+    selected: List[int] = list()
+    if len(positions) >= count:
+        positions = np.asarray(positions, dtype=int)
+        order = positions[_rank(free[positions], util[positions], prefer)]
+        candidates = array['index'][order].tolist()
+        if topology_aware and 1 < count < len(candidates):
+            selected = _group(candidates, count, backend)
+        else:
+            selected = candidates[:count]
+    if as_env:
+        return cuda_visible_devices(selected, uuids)
+    return selected
+
+
+def cuda_visible_devices(devices: Iterable[int], uuids: bool = False) -> str:
+    """
+    Returns the CUDA_VISIBLE_DEVICES value which exposes the given devices.
+
+    Args:
+        devices (list): The device indexes.
+        uuids (bool): If True, the devices are listed by UUID instead of index, which is stable
+            across reboots and driver reloads and independent of the CUDA device order. The
+            indexes are the NVML ones, in PCI bus order, so an index list is only right with
+            CUDA_DEVICE_ORDER=PCI_BUS_ID (the CUDA runtime orders the devices fastest first by
+            default).
+
+    Returns:
+        str: The comma-separated device list.
+    """
+    if not uuids:
+        return ','.join(str(device_index) for device_index in devices)
+    backend = get_backend()
+    ret = list()
+    for device_index in devices:
+        device_dict = backend.query(device_index, tuple())
+        if device_dict is None:
+            raise ValueError(f'Invalid device index: {device_index}')
+        ret.append(device_dict['uuid'])
+    return ','.join(ret)
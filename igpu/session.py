@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu NVML session
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import time
+import threading
+from typing import Dict, Optional, Any
+
+
+class Session(object):
+    """
+    A persistent NVML session.
+
+    The session initializes NVML once and caches the device count and the device handles, so
+    long-running monitors only pay the handle lookup once. The whole initialization cost (the
+    `nvmlInit` call and the handle lookup of every device) is paid by `open()`, which is called
+    on the first use and can be called explicitly at startup; its duration is available in
+    `open_time`.
+
+    When NVML reports that it was reset (e.g. after a driver reload or a lost GPU), the NVML
+    backend calls `refresh()`, which re-initializes the library and rebuilds the handle cache.
+    Each refresh increments `generation`, so the backends know when their caches are stale.
+
+    The session can be used as a context manager: on enter, it is opened and becomes the current
+    session (see `get_session`) used by the igpu functions; on exit, the previous session is
+    restored and NVML is shut down.
+
+    Args:
+        nvml: The NVML module. If None, `pynvml.nvml` is used. Any object exposing the same
+            functions and constants can be used, e.g. `igpu.fake.FakeNVML`.
+    """
+
+    def __init__(self, nvml: Any = None) -> None:
+        if nvml is None:
+            from pynvml import nvml #pylint: disable=import-outside-toplevel
+        self._nvml = nvml
+        self._lock = threading.RLock()
+        self._opened = False
+        self._generation = 0
+        self._open_time: Optional[float] = None
+        self._handles: Dict[int, Any] = dict()
+        self._uuid_index: Dict[str, int] = dict()
+        self._previous: Optional['Session'] = None
+
+    @property
+    def nvml(self) -> Any:
+        """module: Returns the NVML module, opening the session if needed."""
+        if not self._opened:
+            self.open()
+        return self._nvml
+
+    @property
+    def is_open(self) -> bool:
+        """bool: Returns True if NVML is initialized by this session."""
+        return self._opened
+
+    @property
+    def generation(self) -> int:
+        """int: Returns the number of times the session was refreshed."""
+        return self._generation
+
+    @property
+    def open_time(self) -> Optional[float]:
+        """float: Returns the duration, in seconds, of the last `open()` call, or None if the
+        session was never opened."""
+        return self._open_time
+
+    def open(self) -> 'Session':
+        """
+        Initializes NVML and caches the handle of every device. Does nothing if the session is
+        already open.
+
+        Returns:
+            Session: The session itself.
+        """
+        with self._lock:
+            if self._opened:
+                return self
+            start = time.perf_counter()
+            self._nvml.nvmlInit()
+            handles = dict()
+            for device_index in range(self._nvml.nvmlDeviceGetCount()):
+                handles[device_index] = self._nvml.nvmlDeviceGetHandleByIndex(device_index)
+            self._handles = handles
+            self._uuid_index = dict()
+            self._opened = True
+            self._open_time = time.perf_counter() - start
+        return self
+
+    def close(self) -> None:
+        """
+        Shuts NVML down and clears the handle cache. Does nothing if the session is not open.
+        """
+        with self._lock:
+            if not self._opened:
+                return
+            self._opened = False
+            self._handles = dict()
+            self._uuid_index = dict()
+            try:
+                self._nvml.nvmlShutdown()
+            except self._nvml.NVMLError:
+                pass
+
+    def refresh(self) -> None:
+        """
+        Re-initializes NVML and rebuilds the handle cache.
+        """
+        with self._lock:
+            self.close()
+            self._generation += 1
+            self.open()
+
+    def is_reset_error(self, err: Exception) -> bool:
+        """
+        Returns True if the given NVML error means that the library or the device handles must
+        be re-initialized.
+
+        Args:
+            err (NVMLError): The NVML error.
+
+        Returns:
+            bool: Whether the session must be refreshed.
+        """
+        nvml = self._nvml
+        return getattr(err, 'value', None) in (
+            nvml.NVML_ERROR_UNINITIALIZED, nvml.NVML_ERROR_GPU_IS_LOST)
+
+    def device_count(self) -> int:
+        """
+        Returns the number of available GPU devices installed on the host.
+
+        Returns:
+            int: The number of available devices.
+        """
+        self.nvml # pylint: disable=pointless-statement
+        return len(self._handles)
+
+    def handle(self, device_index: int) -> Optional[Any]:
+        """
+        Given a device index, returns the cached NVML device handle.
+
+        Args:
+            device_index (int): The index of the desired device.
+
+        Returns:
+            handle: The NVML device handle, or None if the index is invalid.
+        """
+        self.nvml # pylint: disable=pointless-statement
+        return self._handles.get(device_index)
+
+    def index_from_uuid(self, uuid: str) -> Optional[int]:
+        """
+        Given a device UUID, returns the device index. The UUID of a MIG device (e.g.
+        'MIG-7a5b2e2c-...') gives the index of its parent device. The lookups are cached.
+
+        Args:
+            uuid (str): The device UUID (e.g. 'GPU-2b8d3a4c-...').
+
+        Returns:
+            int: The device index, or None if there is no device with the given UUID.
+        """
+        nvml = self.nvml
+        device_index = self._uuid_index.get(uuid)
+        if device_index is None:
+            try:
+                handle = nvml.nvmlDeviceGetHandleByUUID(uuid.encode())
+            except nvml.NVMLError as err:
+                if self.is_reset_error(err):
+                    raise
+                return None
+            try:
+                if nvml.nvmlDeviceIsMigDeviceHandle(handle):
+                    handle = nvml.nvmlDeviceGetDeviceHandleFromMigDeviceHandle(handle)
+            except AttributeError:
+                pass
+            except nvml.NVMLError as err:
+                if self.is_reset_error(err):
+                    raise
+            device_index = nvml.nvmlDeviceGetIndex(handle)
+            self._uuid_index[uuid] = device_index
+        return device_index
+
+    def __enter__(self) -> 'Session':
+        self.open()
+        self._previous = set_session(self)
+        return self
+
+    def __exit__(self, *args) -> None:
+        set_session(self._previous)
+        self._previous = None
+        self.close()
+
+
+__SESSION: Optional[Session] = None
+
+
+def get_session() -> Session:
+    """
+    Returns the current NVML session, used by the NVML backend when no session is given. If no
+    session has been set, a Session is created on the first call.
+
+    Returns:
+        Session: The current session.
+    """
+    global __SESSION #pylint: disable=global-statement
+    if __SESSION is None:
+        __SESSION = Session()
+    return __SESSION
+
+
+def set_session(session: Optional[Session]) -> Optional[Session]:
+    """
+    Sets the current NVML session.
+
+    Args:
+        session (Session): The new session. If None, a new Session is created on the next
+            `get_session` call.
+
+    Returns:
+        Session: The previous session.
+    """
+    global __SESSION #pylint: disable=global-statement
+    previous = __SESSION
+    __SESSION = session
+    return previous
@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu shared memory snapshots
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import json
+import time
+import struct
+import threading
+from typing import Dict, List, Optional, Any, Iterable, Sequence, Tuple
+import numpy as np
+from igpu import parser
+from igpu import metrics as igpu_metrics
+from igpu.backend import Backend, get_backend
+from igpu.columnar import snapshot_dtype
+
+DEFAULT_NAME = 'igpu'
+
+# The segment header: magic, sequence, timestamp, device count, array size, payload size and
+# publication interval. The sequence is odd while the publisher writes the segment (a seqlock).
+_MAGIC = b'IGPUSHM1'
+_HEADER = struct.Struct('<8sQdIIId')
+_SEQUENCE = struct.Struct('<Q')
+_SEQUENCE_OFFSET = 8
+_DATA_OFFSET = (_HEADER.size + 7) // 8 * 8
+
+# The number of attempts to read a consistent segment, while the publisher is writing it.
+_READ_ATTEMPTS = 1000
+
+# A segment published within this number of its intervals belongs to a running publisher.
+_LIVE_INTERVALS = 3
+
+# The segments created by the publishers of this process, which the resource tracker unlinks.
+_CREATED = set()
+
+
+def _attach(name: str) -> Any:
+    """Attaches to an existing segment, without letting this process unlink it on exit."""
+    from multiprocessing import shared_memory #pylint: disable=import-outside-toplevel
+    #pylint: disable=unexpected-keyword-arg,protected-access
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13, the attached segments are also tracked, and unlinked on exit.
+    segment = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix' and name not in _CREATED:
+        from multiprocessing import resource_tracker #pylint: disable=import-outside-toplevel
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+class Publisher(object):
+    """
+    Publishes the state of the devices into a shared memory segment, for the local processes
+    reading it with a `SharedMemoryBackend`. A single publisher per host queries the devices, so
+    any number of workers read them without being NVML clients.
+
+    Each publication writes the parsed device dicts (see `Backend.query_all`), as JSON, and
+    their numeric metrics, as a columnar snapshot (see `igpu.snapshot_dtype`), under a seqlock:
+    the sequence number in the header is odd while the segment is written, so readers retry
+    instead of reading a half-written state.
+
+    A segment with the same name left by a publisher which did not exit cleanly is replaced,
+    but creating a publisher of a segment published within the last 3 intervals of its
+    publisher raises a ValueError, so a running publisher is never replaced.
+
+    Args:
+        name (str): The shared memory segment name.
+        interval (float): The publication interval of the background thread, in seconds.
+        fields (list): The published GPUInfo sections (see `parser.FIELDS`). If None, all
+            sections.
+        size (int): The segment size, in bytes.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, interval: float = 0.5,
+                 fields: Optional[Iterable[str]] = None, size: int = 1 << 20) -> None:
+        if interval <= 0:
+            raise ValueError(f'Invalid interval: {interval}')
+        if size <= _DATA_OFFSET:
+            raise ValueError(f'Invalid size: {size}')
+        self._name = name
+        self._interval = interval
+        self._fields = parser.check_fields(fields)
+        # The metrics of the published sections; the other snapshot columns are NaN.
+        self._metrics = tuple(metric for metric, field, _ in igpu_metrics.METRICS
+                              if field in self._fields)
+        self._size = size
+        self._segment: Any = None
+        self._sequence = 0
+        self._dtype = snapshot_dtype(igpu_metrics.METRIC_NAMES)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def name(self) -> str:
+        """str: Returns the shared memory segment name."""
+        return self._name
+
+    @property
+    def interval(self) -> float:
+        """float: Returns the publication interval, in seconds."""
+        return self._interval
+
+    @property
+    def running(self) -> bool:
+        """bool: Returns True if the publication thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _create(self) -> Any:
+        from multiprocessing import shared_memory #pylint: disable=import-outside-toplevel
+        try:
+            return shared_memory.SharedMemory(name=self._name, create=True, size=self._size)
+        except FileExistsError:
+            pass
+        existing = _attach(self._name)
+        magic, timestamp, interval = bytes(len(_MAGIC)), 0.0, 0.0
+        if existing.size >= _HEADER.size:
+            magic, _, timestamp, _, _, _, interval = _HEADER.unpack_from(existing.buf, 0)
+        existing.close()
+        if magic not in (_MAGIC, bytes(len(_MAGIC))):
+            raise ValueError(f'The shared memory segment "{self._name}" is not an igpu segment')
+        if magic == _MAGIC and time.time() - timestamp <= _LIVE_INTERVALS * interval:
+            raise ValueError(f'The shared memory segment "{self._name}" is published by a running '
+                             f'publisher')
+        # Left by a publisher which did not exit cleanly; the readers attached to it see it as
+        # stale and attach again to the new segment.
+        stale = shared_memory.SharedMemory(name=self._name)
+        stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=self._name, create=True, size=self._size)
+
+    def publish(self) -> None:
+        """
+        Queries the devices and publishes their state. Called by the publication thread at each
+        interval; it can also be called directly when the thread is not running.
+        """
+        backend = get_backend()
+        device_dicts = backend.query_all(self._fields)
+        array = np.empty(len(device_dicts), dtype=self._dtype)
+        array['index'] = [device_dict['index'] for device_dict in device_dicts]
+        for metric in igpu_metrics.METRIC_NAMES:
+            array[metric] = np.nan
+        for row, device_dict in enumerate(device_dicts):
+            for metric, value in zip(self._metrics,
+                                     igpu_metrics.metric_values(device_dict, self._metrics)):
+                array[metric][row] = value
+        payload = json.dumps({
+            'driver_version': backend.driver_version(),
+            'fields': list(self._fields),
+            'devices': device_dicts,
+        }).encode()
+        data = array.tobytes()
+        if _DATA_OFFSET + len(data) + len(payload) > self._size:
+            raise ValueError(f'The state of the devices ({len(data) + len(payload)} bytes) does '
+                             f'not fit in the segment ({self._size} bytes)')
+        if self._segment is None:
+            self._segment = self._create()
+            _CREATED.add(self._name)
+        buf = self._segment.buf
+        _SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, self._sequence + 1)
+        buf[_DATA_OFFSET:_DATA_OFFSET + len(data)] = data
+        buf[_DATA_OFFSET + len(data):_DATA_OFFSET + len(data) + len(payload)] = payload
+        _HEADER.pack_into(buf, 0, _MAGIC, self._sequence + 1, time.time(), len(device_dicts),
+                          len(data), len(payload), self._interval)
+        self._sequence += 2
+        _SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, self._sequence)
+
+    def start(self) -> 'Publisher':
+        """
+        Publishes the current state and starts the publication thread.
+
+        Returns:
+            Publisher: The publisher itself.
+        """
+        if self.running:
+            return self
+        self.publish()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='igpu-publisher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops the publication thread. The segment is kept until `close`.
+
+        Args:
+            timeout (float): The maximum time to wait for the thread, in seconds.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self) -> None:
+        """Stops the publication thread and removes the segment."""
+        self.stop()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+            _CREATED.discard(self._name)
+
+    def _run(self) -> None:
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            next_time += self._interval
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            if self._stop_event.wait(next_time - now):
+                break
+            try:
+                self.publish()
+            except Exception as err: #pylint: disable=broad-except
+                self.last_error = err
+
+    def __enter__(self) -> 'Publisher':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class SharedMemoryBackend(Backend):
+    """
+    Backend that reads the devices from the shared memory segment of a `Publisher`, so the
+    process never calls NVML. Set it as the current backend (see `igpu.set_backend`) in each
+    worker process, and `igpu.devices()`, `igpu.snapshot()` and the other functions read the
+    last published state.
+
+    Only the numeric metrics (`read_metrics`, used by `igpu.snapshot`) are read straight from
+    the segment, without decoding. The device dicts are not zero-copy: they are decoded from
+    JSON and normalized once per publication, and each `query` or `query_all` then copies the
+    requested sections (a few microseconds per device), since the callers may modify them. Each
+    read checks the seqlock of the segment and retries while it is written.
+
+    A state older than `max_age` seconds (e.g. the publisher stopped) is stale: the queries are
+    delegated to the `fallback` backend, if given, or raise a ValueError otherwise. The same
+    happens while the segment does not exist, or for the sections which are not published. The
+    per-process utilization samples are never published, so they are always read from the
+    fallback backend.
+
+    Args:
+        name (str): The shared memory segment name.
+        max_age (float): The maximum age of the published state, in seconds.
+        fallback (Backend): The backend used when the published state is stale, e.g. a
+            `NVMLBackend`. If None, a stale state raises a ValueError.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, max_age: float = 2.0,
+                 fallback: Optional[Backend] = None) -> None:
+        Backend.__init__(self)
+        if max_age <= 0:
+            raise ValueError(f'Invalid max age: {max_age}')
+        self._name = name
+        self._max_age = max_age
+        self._fallback = fallback
+        self._segment: Any = None
+        self._rows: Dict[int, int] = dict()
+        self._sequence: Optional[int] = None
+        self._timestamp = 0.0
+        self._payload: Dict = dict()
+        self._dtype = snapshot_dtype(igpu_metrics.METRIC_NAMES)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        """str: Returns the shared memory segment name."""
+        return self._name
+
+    @property
+    def max_age(self) -> float:
+        """float: Returns the maximum age of the published state, in seconds."""
+        return self._max_age
+
+    @property
+    def fallback(self) -> Optional[Backend]:
+        """Backend: Returns the backend used when the published state is stale."""
+        return self._fallback
+
+    @property
+    def timestamp(self) -> float:
+        """float: Returns the publication time of the last read state, or 0 if none."""
+        return self._timestamp
+
+    def close(self) -> None:
+        """Detaches from the segment. It is attached again on the next query."""
+        with self._lock:
+            self._detach()
+
+    def _detach(self) -> None:
+        self._sequence = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _read_sequence(self) -> int:
+        return _SEQUENCE.unpack_from(self._segment.buf, _SEQUENCE_OFFSET)[0]
+
+    def _refresh(self) -> bool:
+        """Reads the segment if it changed, returning False if the state is stale."""
+        for _ in range(2):
+            if self._segment is None:
+                try:
+                    self._segment = _attach(self._name)
+                except FileNotFoundError:
+                    return False
+            fresh = self._read()
+            if fresh:
+                return True
+            # A stale segment may have been replaced by a new publisher.
+            self._detach()
+        return False
+
+    def _read(self) -> bool:
+        buf = self._segment.buf
+        for _ in range(_READ_ATTEMPTS):
+            sequence = self._read_sequence()
+            if sequence == self._sequence:
+                return time.time() - self._timestamp <= self._max_age
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            magic, _, timestamp, _, data_size, payload_size, _ = _HEADER.unpack_from(buf, 0)
+            if magic != _MAGIC:
+                return False
+            payload = bytes(buf[_DATA_OFFSET + data_size:
+                                _DATA_OFFSET + data_size + payload_size])
+            if self._read_sequence() != sequence:
+                continue
+            self._payload = json.loads(payload.decode())
+            self._payload['devices'] = [igpu_metrics.normalize(device_dict)
+                                        for device_dict in self._payload['devices']]
+            self._rows = {device_dict['index']: row
+                          for row, device_dict in enumerate(self._payload['devices'])}
+            self._sequence, self._timestamp = sequence, timestamp
+            return time.time() - timestamp <= self._max_age
+        return False
+
+    def _current(self, fields: Sequence[str] = ()) -> Optional[Dict]:
+        """Returns the published state, or None if the fallback backend must be used."""
+        with self._lock:
+            fresh = self._refresh()
+            payload = self._payload
+        if fresh and set(fields).issubset(payload['fields']):
+            return payload
+        if self._fallback is not None:
+            return None
+        if not fresh:
+            raise ValueError(f'The shared memory snapshot "{self._name}" is missing or older '
+                             f'than {self._max_age} seconds')
+        raise ValueError(f'The shared memory snapshot "{self._name}" does not publish the '
+                         f'fields {sorted(set(fields).difference(payload["fields"]))}')
+
+    def device_count(self) -> int:
+        payload = self._current()
+        if payload is None:
+            return self._fallback.device_count()
+        return len(payload['devices'])
+
+    def driver_version(self) -> Optional[str]:
+        payload = self._current()
+        if payload is None:
+            return self._fallback.driver_version()
+        return payload['driver_version']
+
+    def query(self, device_index: int, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        fields = parser.check_fields(fields)
+        payload = self._current(fields)
+        if payload is None:
+            return self._fallback.query(device_index, fields)
+        row = self._rows.get(device_index)
+        if row is None:
+            return None
+        return self._copy(payload['devices'][row], fields)
+
+    def query_all(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        fields = parser.check_fields(fields)
+        payload = self._current(fields)
+        if payload is None:
+            return self._fallback.query_all(fields)
+        return [self._copy(device_dict, fields) for device_dict in payload['devices']]
+
+    @staticmethod
+    def _copy(device_dict: Dict, fields: Tuple[str, ...]) -> Dict:
+        """
+        Copies the identification and the given sections of a shared (already normalized)
+        device dict, since the callers may modify the returned dicts (e.g. GPUInfo.update).
+        """
+        ret = {key: device_dict[key] for key in ('index',) + parser.STATIC_ATTRIBUTES['identity']}
+        for field in fields:
+            section = device_dict[field]
+            if isinstance(section, dict):
+                section = dict(section)
+            elif isinstance(section, list):
+                section = [dict(process_dict) for process_dict in section]
+            ret[field] = section
+        return ret
+
+    def read_metrics(self, device_index: int, metrics: Sequence[str], out: Any) -> bool:
+        payload = self._current(igpu_metrics.fields_of(metrics))
+        if payload is None:
+            return self._fallback.read_metrics(device_index, metrics, out)
+        with self._lock:
+            row = self._rows.get(device_index)
+            if row is None:
+                return False
+            for _ in range(_READ_ATTEMPTS):
+                sequence = self._sequence
+                # Only the row is copied out of the segment: keeping a view of the segment would
+                # prevent it from being closed.
+                offset = _DATA_OFFSET + row * self._dtype.itemsize
+                values = np.frombuffer(
+                    bytes(self._segment.buf[offset:offset + self._dtype.itemsize]),
+                    dtype=self._dtype)[0]
+                for position, name in enumerate(metrics):
+                    out[position] = values[name]
+                if self._read_sequence() == sequence:
+                    return True
+                if not self._refresh():
+                    break
+                row = self._rows.get(device_index)
+                if row is None:
+                    return False
+        if self._fallback is None:
+            raise ValueError(f'The shared memory snapshot "{self._name}" is unavailable')
+        return self._fallback.read_metrics(device_index, metrics, out)
+
+    def compute_processes(self, device_index: int) -> Optional[List[Tuple[int, float]]]:
+        payload = self._current(('processes',))
+        if payload is None:
+            return self._fallback.compute_processes(device_index)
+        row = self._rows.get(device_index)
+        if row is None:
+            return None
+        processes = payload['devices'][row]['processes'] or list()
+        return [(process_dict['pid'], process_dict['gpu_memory']) for process_dict in processes]
+
+    def process_utilization(self, device_index: int,
+                            since: int = 0) -> Optional[List[Tuple[int, int, float, float]]]:
+        # The utilization samples are not published.
+        if self._fallback is None:
+            return None
+        return self._fallback.process_utilization(device_index, since)
+
+    def topology_level(self, device_a: int, device_b: int) -> Optional[int]:
+        if self._fallback is None:
+            return None
+        return self._fallback.topology_level(device_a, device_b)
+
+
+def publish(name: str = DEFAULT_NAME, interval: float = 0.5,
+            fields: Optional[Iterable[str]] = None, size: int = 1 << 20) -> Publisher:
+    """
+    Creates and starts a `Publisher`.
+
+    Args:
+        name (str): The shared memory segment name.
+        interval (float): The publication interval, in seconds.
+        fields (list): The published GPUInfo sections. If None, all sections.
+        size (int): The segment size, in bytes.
+
+    Returns:
+        Publisher: The running publisher. Call `close` to stop it and remove the segment.
+    """
+    return Publisher(name, interval, fields, size).start()
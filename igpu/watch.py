@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of igpu change events
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import time
+import math
+import bisect
+import threading
+from typing import Dict, List, Optional, Any, Iterable, Iterator, NamedTuple, Tuple
+from igpu.backend import get_backend
+
+PROCESS_STARTED = 'process_started'
+PROCESS_EXITED = 'process_exited'
+OCCUPIED = 'occupied'
+FREED = 'freed'
+MEMORY_ABOVE = 'memory_above'
+MEMORY_BELOW = 'memory_below'
+TEMPERATURE_ABOVE = 'temperature_above'
+TEMPERATURE_BELOW = 'temperature_below'
+POWER_ABOVE = 'power_above'
+POWER_BELOW = 'power_below'
+PSTATE = 'pstate'
+
+
+class Event(NamedTuple):
+    """
+    A change of the state of a device.
+
+    Attributes:
+        kind (str): The event kind (e.g. `PROCESS_STARTED`, `MEMORY_ABOVE`).
+        device (int): The device index.
+        timestamp (float): The time of the sample, in seconds since the epoch.
+        value: The new value: the PID for process events, the process count for `OCCUPIED`
+            and `FREED`, the memory fraction (used / total) for memory events, the temperature
+            (C) or the power fraction (draw / limit) for the excursions, and the performance
+            state (e.g. 'P2') for `PSTATE`.
+        previous: The previous value, for `OCCUPIED`, `FREED` and `PSTATE`.
+        threshold (float): The crossed threshold, for the memory, temperature and power events.
+    """
+    kind: str
+    device: int
+    timestamp: float
+    value: Any = None
+    previous: Any = None
+    threshold: Optional[float] = None
+
+
+class _DeviceState(object):
+    """The last observed state of a device, used to compute the events of the next sample."""
+
+    def __init__(self) -> None:
+        self.processes: Dict[Tuple[int, Any], int] = dict()
+        self.levels = {'memory': 0, 'temperature': 0, 'power': 0}
+        self.pstate: Optional[str] = None
+
+
+def _number(value: float) -> Optional[float]:
+    # The parsed values are normalized, so a missing value is NaN.
+    return None if math.isnan(value) else value
+
+
+def _fraction(numerator: float, denominator: float) -> Optional[float]:
+    if not denominator:
+        return None
+    return _number(numerator / denominator)
+
+
+class Watcher(object):
+    """
+    Polls the devices and computes their change events.
+
+    Each poll reads the memory, utilization, power and processes sections of the devices as
+    parsed dicts (no GPUInfo is built), and compares them with the state kept from the previous
+    poll: the set of process keys, the threshold level of each watched value and the performance
+    state. Only the differences are returned as events.
+
+    Args:
+        interval (float): The polling interval of the iterator, in seconds.
+        devices (list): The indexes of the watched devices. If None, all available devices.
+        memory_thresholds (list): The memory thresholds, as fractions of the total memory.
+        temperature_thresholds (list): The temperature thresholds, in Celsius degrees.
+        power_thresholds (list): The power draw thresholds, as fractions of the power limit.
+        processes (bool): If True, watches the compute processes.
+        initial (bool): If True, the first poll reports the current state as changes from an
+            idle device (running processes, thresholds above and performance state). Otherwise,
+            the first poll only records the state.
+    """
+
+    def __init__(self, interval: float = 1.0, devices: Optional[Iterable[int]] = None,
+                 memory_thresholds: Iterable[float] = (0.5, 0.9),
+                 temperature_thresholds: Iterable[float] = (80.0,),
+                 power_thresholds: Iterable[float] = (0.9,),
+                 processes: bool = True, initial: bool = True) -> None:
+        if interval <= 0:
+            raise ValueError(f'Invalid interval: {interval}')
+        self._interval = interval
+        self._devices = None if devices is None else list(devices)
+        self._thresholds = {
+            'memory': sorted(memory_thresholds),
+            'temperature': sorted(temperature_thresholds),
+            'power': sorted(power_thresholds),
+        }
+        self._kinds = {
+            'memory': (MEMORY_ABOVE, MEMORY_BELOW),
+            'temperature': (TEMPERATURE_ABOVE, TEMPERATURE_BELOW),
+            'power': (POWER_ABOVE, POWER_BELOW),
+        }
+        self._fields: Tuple[str, ...] = ('memory', 'utilization', 'power')
+        if processes:
+            self._fields += ('processes',)
+        self._initial = initial
+        self._states: Dict[int, _DeviceState] = dict()
+        self._stop_event = threading.Event()
+
+    @property
+    def interval(self) -> float:
+        """float: Returns the polling interval, in seconds."""
+        return self._interval
+
+    def poll(self) -> List[Event]:
+        """
+        Reads the devices once and returns the changes since the previous poll.
+
+        Returns:
+            list: The change events, ordered by device.
+        """
+        backend = get_backend()
+        devices = self._devices
+        if devices is None:
+            devices = range(backend.device_count())
+        timestamp = time.time()
+        events: List[Event] = list()
+        for device_index in devices:
+            device_dict = backend.query(device_index, self._fields)
+            if device_dict is None:
+                raise ValueError(f'Invalid device index: {device_index}')
+            state = self._states.get(device_index)
+            first = state is None
+            if first:
+                state = self._states[device_index] = _DeviceState()
+            device_events = self._diff(device_index, timestamp, device_dict, state)
+            if not first or self._initial:
+                events.extend(device_events)
+        return events
+
+    def _diff(self, device_index: int, timestamp: float, device_dict: Dict,
+              state: _DeviceState) -> List[Event]:
+        events = list()
+
+        if 'processes' in device_dict:
+            current = {
+                (process['pid'], process['create_time']): process['pid']
+                for process in device_dict['processes'] or list()
+            }
+            previous = state.processes
+            if current.keys() != previous.keys():
+                for key in previous.keys() - current.keys():
+                    events.append(Event(PROCESS_EXITED, device_index, timestamp, previous[key]))
+                for key in current.keys() - previous.keys():
+                    events.append(Event(PROCESS_STARTED, device_index, timestamp, current[key]))
+                if previous and not current:
+                    events.append(Event(FREED, device_index, timestamp, 0, len(previous)))
+                elif current and not previous:
+                    events.append(Event(OCCUPIED, device_index, timestamp, len(current), 0))
+                state.processes = current
+
+        values = {
+            'memory': _fraction(device_dict['memory']['used'], device_dict['memory']['total']),
+            'temperature': _number(device_dict['utilization']['temperature']),
+            'power': _fraction(device_dict['power']['draw'], device_dict['power']['limit']),
+        }
+        for name, value in values.items():
+            if value is None:
+                continue
+            thresholds = self._thresholds[name]
+            level = bisect.bisect_right(thresholds, value)
+            previous_level = state.levels[name]
+            if level == previous_level:
+                continue
+            above, below = self._kinds[name]
+            if level > previous_level:
+                for threshold in thresholds[previous_level:level]:
+                    events.append(Event(above, device_index, timestamp, value,
+                                        threshold=threshold))
+            else:
+                for threshold in reversed(thresholds[level:previous_level]):
+                    events.append(Event(below, device_index, timestamp, value,
+                                        threshold=threshold))
+            state.levels[name] = level
+
+        pstate = device_dict['utilization']['performance']
+        if pstate != state.pstate:
+            events.append(Event(PSTATE, device_index, timestamp, pstate, state.pstate))
+            state.pstate = pstate
+
+        return events
+
+    def stop(self) -> None:
+        """
+        Stops the iteration, e.g. from another thread. The iterator ends after the current
+        interval.
+        """
+        self._stop_event.set()
+
+    def __iter__(self) -> Iterator[Event]:
+        self._stop_event.clear()
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            for event in self.poll():
+                yield event
+            next_time += self._interval
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            self._stop_event.wait(next_time - now)
+
+
+def watch(interval: float = 1.0, devices: Optional[Iterable[int]] = None,
+          memory_thresholds: Iterable[float] = (0.5, 0.9),
+          temperature_thresholds: Iterable[float] = (80.0,),
+          power_thresholds: Iterable[float] = (0.9,),
+          processes: bool = True, initial: bool = True) -> Iterator[Event]:
+    """
+    Polls the devices at each `interval` and yields their change events: processes started or
+    exited, devices occupied (first process) or freed (last process), memory, temperature and
+    power crossing the given thresholds, and performance state transitions. See `Watcher` for
+    the arguments.
+
+    Returns:
+        iterator: An endless iterator of Event objects.
+    """
+    return iter(Watcher(interval, devices, memory_thresholds, temperature_thresholds,
+                        power_thresholds, processes, initial))
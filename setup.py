@@ -43,6 +43,7 @@ setup(
     long_description_content_type='text/markdown',  # This is important!
     keywords='gpu cuda nvidia',
     packages=['igpu'],
+    entry_points={'console_scripts': ['igpu = igpu.cli:main']},
     zip_safe=False,
     python_requires='>=3.4',
     install_requires=REQUIREMENTS
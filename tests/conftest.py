@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Shared fixtures of the igpu tests
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import pytest
+from igpu.backend import set_backend
+
+
+@pytest.fixture(autouse=True)
+def reset_backend():
+    """Restores the default backend after each test which sets its own."""
+    yield
+    set_backend(None)
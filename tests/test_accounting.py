@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu process accounting, with FakeNVML devices
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import igpu
+from igpu.fake import FakeNVML, FakeProcess
+from igpu.cache import CachedBackend
+from igpu.process import ProcessCache
+from igpu.accounting import Accountant
+
+
+class _ProcessCache(ProcessCache):
+    """A process cache resolving every process as a job of `owner`, created at `created`."""
+
+    owner, created = 'alice', 1.0
+
+    def lookup(self, processes):
+        return [{'pid': pid, 'name': 'job', 'user': self.owner, 'parent_id': 1,
+                 'parent_name': 'init', 'create_time': self.created, 'gpu_memory': gpu_memory}
+                for pid, gpu_memory in processes]
+
+
+def test_add_sample():
+    fake = FakeNVML(1)
+    fake.devices[0].processes.append(FakeProcess(os.getpid(), 1024 * 2 ** 20, sm_util=50))
+    igpu.set_backend(CachedBackend(igpu.NVMLBackend(fake)))
+    accountant = Accountant(capacity=2)
+    for _ in range(3):
+        accountant.poll()
+    series = accountant.processes()[0]
+    assert series.count == 3 and len(series.samples()) == 2
+    assert series.samples()['gpu_memory'].tolist() == [1024.0, 1024.0]
+    # The utilization samples are forwarded by the cache.
+    assert series.samples()['sm_util'][-1] == 50.0
+    usage = accountant.usage()[series.user]
+    assert usage['gpu_seconds'] == series.gpu_seconds > 0.0
+    assert usage['sm_seconds'] == series.sm_seconds > 0.0
+
+
+def test_reused_pid():
+    fake = FakeNVML(1)
+    fake.devices[0].processes.append(FakeProcess(4242, 2 ** 30))
+    igpu.set_backend(igpu.NVMLBackend(fake))
+    process_cache = _ProcessCache()
+    accountant = Accountant(process_cache=process_cache)
+    accountant.poll()
+    accountant.poll()
+    process_cache.owner, process_cache.created = 'bob', 2.0
+    accountant.poll()
+    assert [series.user for series in accountant.processes(running=False)] == ['alice']
+    assert [series.user for series in accountant.processes(running=True)] == ['bob']
+    assert set(accountant.usage()) == {'alice', 'bob'}
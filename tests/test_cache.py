@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu query cache, with FakeNVML devices
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import igpu
+from igpu.fake import FakeNVML
+from igpu.cache import CachedBackend
+
+
+def test_results_are_copies():
+    backend = CachedBackend(igpu.NVMLBackend(FakeNVML(2, process_count=1)), max_age=60.0)
+    device_dict = backend.query(0)
+    device_dict['memory']['used'] = -1.0
+    device_dict['processes'][0]['gpu_memory'] = -1.0
+    assert backend.query(0)['memory']['used'] == 0.0
+    assert backend.query(0)['processes'][0]['gpu_memory'] != -1.0
+    backend.query_all()[1]['memory']['used'] = -1.0
+    assert backend.query_all()[1]['memory']['used'] == 0.0
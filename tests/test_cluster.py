@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu multi-host aggregation, with agents on localhost serving FakeNVML backends
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import math
+import time
+import socket
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import igpu
+from igpu.fake import FakeNVML
+from igpu.cluster import Cluster, start_agent
+
+
+@pytest.fixture(name='agents')
+def fixture_agents():
+    """Starts a TCP agent with 2 devices and a Unix socket agent with 3 devices."""
+    # Not pytest's tmp_path: the path of a Unix socket is limited to about 100 characters.
+    directory = tempfile.mkdtemp(prefix='igpu-')
+    backends = [igpu.NVMLBackend(FakeNVML(2, process_count=1)), igpu.NVMLBackend(FakeNVML(3))]
+    tcp_agent = start_agent(port=0, address='127.0.0.1', backend=backends[0], host='node0')
+    unix_agent = start_agent(unix_socket=os.path.join(directory, 'agent.sock'),
+                             backend=backends[1], host='node1')
+    hosts = {f'127.0.0.1:{tcp_agent.port}': backends[0],
+             f'unix:{unix_agent.unix_socket}': backends[1]}
+    yield hosts
+    tcp_agent.stop()
+    unix_agent.stop()
+    shutil.rmtree(directory)
+
+
+@pytest.fixture(name='refused_host')
+def fixture_refused_host():
+    """Returns a localhost address with no server, refusing the connections."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'127.0.0.1:{port}'
+
+
+@pytest.fixture(name='silent_host')
+def fixture_silent_host():
+    """Returns a localhost address which accepts the connections but never answers."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(8)
+        yield f'127.0.0.1:{sock.getsockname()[1]}'
+
+
+def test_devices(agents):
+    with Cluster(agents, timeout=2.0) as cluster:
+        results = cluster.devices(['memory', 'processes'])
+    assert list(results) == list(agents)
+    for host, backend in agents.items():
+        result = results[host]
+        assert result.ok, result.error
+        assert result.value == backend.query_all(['memory', 'processes'])
+        assert result.latency >= 0.0 and result.timestamp > 0.0
+
+
+def test_snapshot(agents):
+    metrics = ['memory.used', 'memory.total', 'power.draw']
+    for encoding in ('binary', 'json'):
+        with Cluster(agents, timeout=2.0) as cluster:
+            results = cluster.snapshot(metrics, encoding=encoding)
+        for host, backend in agents.items():
+            result = results[host]
+            assert result.ok, result.error
+            expected = igpu.snapshot(metrics=metrics, backend=backend)
+            assert result.value['index'].tolist() == expected['index'].tolist()
+            for metric in metrics:
+                assert result.value[metric].tolist() == pytest.approx(expected[metric].tolist())
+
+
+def test_refused_host(agents, refused_host):
+    hosts = list(agents) + [refused_host]
+    with Cluster(hosts, timeout=2.0) as cluster:
+        results = cluster.devices(['memory'])
+    assert not results[refused_host].ok
+    assert results[refused_host].value is None
+    assert 'ConnectionRefusedError' in results[refused_host].error
+    assert all(results[host].ok for host in agents)
+
+
+def test_timed_out_host(agents, silent_host):
+    hosts = list(agents) + [silent_host]
+    with Cluster(hosts, timeout=0.5) as cluster:
+        results = cluster.snapshot(['utilization.gpu'])
+    assert not results[silent_host].ok
+    # Either the collect or the socket of the connection times out first.
+    assert 'imeout' in results[silent_host].error
+    assert results[silent_host].latency < 2.0
+    for host in agents:
+        assert results[host].ok, results[host].error
+        assert not any(math.isnan(value) for value in results[host].value['utilization.gpu'])
+
+
+def test_invalid_request(agents):
+    with Cluster(agents, timeout=2.0) as cluster:
+        with pytest.raises(ValueError):
+            cluster.devices(['bad'])
+        with pytest.raises(ValueError):
+            cluster.snapshot(['bad.metric'])
+
+
+def test_agent_responses_are_bounded():
+    agent = igpu.cluster.Agent(port=0, backend=igpu.NVMLBackend(FakeNVML(1)))
+    first = agent.respond('/devices?fields=memory')
+    for number in range(50):
+        assert agent.respond(f'/devices?fields=memory&x={number}') == first
+    assert len(agent._responses) == 1 #pylint: disable=protected-access
+
+
+def test_empty_fields(agents):
+    with Cluster(agents, timeout=2.0) as cluster:
+        results = cluster.devices(())
+        snapshots = cluster.snapshot(())
+    for host, backend in agents.items():
+        assert results[host].value == backend.query_all(())
+        assert snapshots[host].value.dtype.names == ('index',)
+
+
+class _SlowBackend(igpu.NVMLBackend):
+    """A FakeNVML backend whose device queries take `delay` seconds."""
+
+    def __init__(self, delay: float) -> None:
+        igpu.NVMLBackend.__init__(self, FakeNVML(1))
+        self.delay = delay
+        self.queries = 0
+
+    def query_all(self, fields=None):
+        self.queries += 1
+        time.sleep(self.delay)
+        return igpu.NVMLBackend.query_all(self, fields)
+
+
+def test_agent_concurrent_requests():
+    backend = _SlowBackend(0.3)
+    agent = igpu.cluster.Agent(port=0, backend=backend)
+    paths = ['/devices?fields=memory'] * 4 + ['/devices?fields=power'] * 4
+    start = time.monotonic()
+    with ThreadPoolExecutor(len(paths)) as executor:
+        responses = list(executor.map(agent.respond, paths))
+    # Each distinct request is queried once, and the two are queried concurrently.
+    assert backend.queries == 2
+    assert time.monotonic() - start < 0.55
+    assert len(set(responses[:4])) == 1 and len(set(responses[4:])) == 1
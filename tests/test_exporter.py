@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu Prometheus/OpenMetrics exporter, with FakeNVML devices
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import re
+import urllib.request
+import pytest
+import igpu
+from igpu.fake import FakeNVML
+from igpu.exporter import CONTENT_TYPE, TEXT_CONTENT_TYPE, Exporter
+
+
+@pytest.fixture(name='exporter')
+def fixture_exporter():
+    """Starts an exporter of 2 FakeNVML devices with a compute process."""
+    igpu.set_backend(igpu.NVMLBackend(FakeNVML(2, process_count=1)))
+    with Exporter(port=0, address='127.0.0.1', interval=60.0) as exporter:
+        yield exporter
+
+
+def _scrape(exporter, accept=None):
+    request = urllib.request.Request(f'http://127.0.0.1:{exporter.port}/metrics')
+    if accept is not None:
+        request.add_header('Accept', accept)
+    with urllib.request.urlopen(request) as response:
+        return response.headers['Content-Type'], response.read().decode()
+
+
+def _check_families(text, openmetrics):
+    """Checks that each sample belongs to the family declared before it."""
+    families = dict()
+    family = None
+    for line in text.splitlines():
+        match = re.match(r'# TYPE (\S+) (\S+)$', line)
+        if match:
+            family = match.group(1)
+            families[family] = match.group(2)
+        elif not line.startswith('#'):
+            name = re.match(r'[a-z_]+', line).group(0)
+            if openmetrics and families[family] == 'counter':
+                assert name == family + '_total'
+            else:
+                assert name == family
+    return families
+
+
+def test_openmetrics(exporter):
+    content_type, text = _scrape(exporter, 'application/openmetrics-text; version=1.0.0')
+    assert content_type == CONTENT_TYPE
+    assert text.endswith('# EOF\n')
+    assert '# UNIT igpu_memory_used_bytes bytes' in text
+    families = _check_families(text, True)
+    assert families['igpu_exporter_collects'] == 'counter'
+    assert text.count('igpu_memory_used_bytes{') == 2
+    assert text.count('igpu_process_memory_used_bytes{') == 2
+
+
+def test_prometheus_text(exporter):
+    content_type, text = _scrape(exporter)
+    assert content_type == TEXT_CONTENT_TYPE
+    assert '# EOF' not in text and '# UNIT' not in text
+    families = _check_families(text, False)
+    assert families['igpu_exporter_collects_total'] == 'counter'
+    assert families['igpu_exporter_errors_total'] == 'counter'
+    assert text.count('igpu_memory_used_bytes{') == 2
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu fake NVML and nvidia-smi modules
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import igpu
+from igpu.fake import FakeNVML, FakeSMI
+from igpu.backend import SMIBackend
+
+
+def test_smi_and_nvml_backends_agree():
+    smi_dicts = SMIBackend(FakeSMI(FakeNVML(2, process_count=1))).query_all()
+    nvml_dicts = igpu.NVMLBackend(FakeNVML(2, process_count=1)).query_all()
+    assert smi_dicts == nvml_dicts
+    assert smi_dicts[0]['pci']['current_link_generation'] == '1'
+    assert smi_dicts[0]['pci']['max_link_generation'] == '3'
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu rolling statistics, against brute-force statistics of the sampler buffers
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import time
+import types
+import itertools
+import numpy as np
+import pytest
+import igpu
+from igpu.fake import FakeNVML
+from igpu.sampler import Sampler
+from igpu.history import parse_window
+
+METRICS = ['memory.used', 'utilization.gpu', 'power.draw']
+QUANTILES = [0.0, 0.25, 0.5, 0.95, 0.99, 1.0]
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(monkeypatch):
+    """Makes the sampler timestamps advance by 1 second at each sample."""
+    clock = itertools.count(1000.0)
+    monkeypatch.setattr(igpu.sampler, 'time',
+                        types.SimpleNamespace(time=lambda: float(next(clock)),
+                                              monotonic=time.monotonic))
+
+
+def _expected(sampler, metric, device_index, seconds):
+    """Returns the values of a window, brute-forced from the sampler buffers."""
+    values = sampler.window(metric, device_index)
+    timestamps = sampler.timestamps()
+    values = values[timestamps > timestamps[-1] - seconds]
+    return np.sort(values[~np.isnan(values)])
+
+
+def test_stats(clock): #pylint: disable=unused-argument
+    fake = FakeNVML(2)
+    igpu.set_backend(igpu.NVMLBackend(fake))
+    rng = np.random.default_rng(0)
+    sampler = Sampler(devices=[0, 1], fields=['memory', 'utilization', 'power'], capacity=40)
+    windows = {'10s': 10.0, 40: 40.0, 0.5: 0.5}
+    history = sampler.add_history(windows, METRICS, relative_accuracy=0.01)
+    for sample in range(300):
+        for device in fake.devices:
+            device.memory_used = int(rng.integers(0, 11 << 30))
+            device.gpu_util = int(rng.integers(0, 101))
+            device.power_draw = int(rng.integers(20000, 300000))
+        # Some missing values, and a burst of them emptying the short windows.
+        unsupported = rng.random() < 0.2 or 100 <= sample < 115
+        fake.devices[1].unsupported = {'nvmlDeviceGetPowerUsage'} if unsupported else set()
+        sampler.sample()
+        for window, seconds in windows.items():
+            for metric in METRICS:
+                stats = history.stats(metric, window, ['count', 'mean', 'std', 'min', 'max'] +
+                                      [f'p{quantile * 100:g}' for quantile in QUANTILES])
+                for row, device_index in enumerate([0, 1]):
+                    values = _expected(sampler, metric, device_index, seconds)
+                    assert stats['count'][row] == len(values)
+                    if not len(values):
+                        assert all(np.isnan(stats[agg][row]) for agg in stats if agg != 'count')
+                        continue
+                    assert stats['mean'][row] == pytest.approx(values.mean(), rel=1e-9)
+                    assert stats['std'][row] == pytest.approx(values.std(), rel=1e-6, abs=1e-9)
+                    assert stats['min'][row] == values[0]
+                    assert stats['max'][row] == values[-1]
+                    for quantile in QUANTILES:
+                        exact = values[int(np.floor(quantile * (len(values) - 1)))]
+                        value = stats[f'p{quantile * 100:g}'][row]
+                        assert abs(value - exact) <= 0.01 * exact + 1e-9
+
+
+def test_constant_std(clock): #pylint: disable=unused-argument
+    igpu.set_backend(igpu.NVMLBackend(FakeNVML(1)))
+    sampler = Sampler(fields=['power'], capacity=100)
+    history = sampler.add_history(['30s', 100], ['power.draw'], relative_accuracy=None)
+    for _ in range(5000):
+        sampler.sample()
+    for window in ('30s', 100):
+        stats = history.stats('power.draw', window, ['count', 'mean', 'std'])
+        assert stats['count'][0] == min(parse_window(window), 100)
+        assert stats['mean'][0] == 9.013
+        assert stats['std'][0] == 0.0
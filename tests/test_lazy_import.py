@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu lazy loading
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import sys
+import subprocess
+
+# The heavy dependencies `import igpu` must not load (as `HEAVY_MODULES` in benchmarks/bench.py).
+HEAVY_MODULES = ('pynvml', 'psutil', 'numpy', 'asyncio')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded(code: str):
+    """Runs the code in a new interpreter, returning the heavy modules it loaded."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (ROOT, env.get('PYTHONPATH'))))
+    code += f'\nimport sys; print(*(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    return subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, env=env,
+                          check=True).stdout.decode().split()
+
+
+def test_import_loads_no_heavy_module():
+    assert _loaded('import igpu; igpu.__version__') == []
+
+
+def test_attributes_load_their_modules():
+    assert 'numpy' in _loaded('import igpu; igpu.snapshot')
+    assert 'asyncio' in _loaded('import igpu; igpu.aio')
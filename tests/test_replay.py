@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu recording and replay, with FakeNVML devices
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import igpu
+from igpu.fake import FakeNVML
+from igpu.recorder import Recorder
+from igpu.replay import ReplayBackend
+
+
+def test_replay_device_subset(tmp_path):
+    fake = FakeNVML(4)
+    for device in fake.devices:
+        device.memory_used = 1024 * 1024 * 1024 * device.index
+    igpu.set_backend(igpu.NVMLBackend(fake))
+    path = str(tmp_path / 'subset.igpu')
+    with Recorder(path, devices=[2, 3], metrics=['memory.used', 'utilization.gpu']) as recorder:
+        recorder.record()
+
+    backend = ReplayBackend(path)
+    igpu.set_backend(backend)
+    assert backend.device_count() == 2
+    assert backend.query(2) is None
+    assert [gpu.index for gpu in igpu.devices(['memory'])] == [0, 1]
+    assert [gpu.memory.used for gpu in igpu.devices(['memory'])] == [2048.0, 3072.0]
+    array = igpu.snapshot(metrics=['memory.used'])
+    assert array['index'].tolist() == [0, 1]
+    assert array['memory.used'].tolist() == [2048.0, 3072.0]
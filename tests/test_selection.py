@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu device selection, with FakeNVML devices
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import igpu
+from igpu.fake import FakeNVML
+from igpu.core import resolve_visible_devices
+
+
+def test_select_as_env():
+    fake = FakeNVML(4)
+    fake.devices[0].gpu_util = 90
+    igpu.set_backend(igpu.NVMLBackend(fake))
+    selected = igpu.select(2, topology_aware=False)
+    assert selected == [1, 2]
+    value = igpu.select(2, topology_aware=False, as_env=True)
+    assert value == ','.join(fake.devices[index].uuid for index in selected)
+    assert resolve_visible_devices(value) == selected
+    assert igpu.select(2, topology_aware=False, as_env=True, uuids=False) == '1,2'
+    assert igpu.select(5, as_env=True) == ''
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu shared memory snapshots, published from FakeNVML backends
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import os
+import time
+import uuid
+from multiprocessing import shared_memory
+import pytest
+import igpu
+from igpu.fake import FakeNVML
+from igpu.shm import Publisher, SharedMemoryBackend
+
+METRICS = ['memory.used', 'utilization.gpu', 'power.draw']
+
+
+@pytest.fixture(name='name')
+def fixture_name():
+    """Returns a segment name unique to the test."""
+    return f'igpu-test-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+@pytest.fixture(name='fake')
+def fixture_fake():
+    """Sets a backend of 2 FakeNVML devices, with a process each, as the published backend."""
+    fake = FakeNVML(2, process_count=1)
+    igpu.set_backend(igpu.NVMLBackend(fake))
+    return fake
+
+
+def _snapshot(backend):
+    array = igpu.snapshot(metrics=METRICS, backend=backend)
+    return {metric: array[metric].tolist() for metric in ['index'] + METRICS}
+
+
+def test_publish_and_read(name, fake):
+    expected = igpu.NVMLBackend(fake)
+    with Publisher(name, interval=10.0) as publisher:
+        reader = SharedMemoryBackend(name)
+        assert reader.device_count() == 2
+        assert reader.driver_version() == expected.driver_version()
+        assert reader.query_all() == expected.query_all()
+        assert reader.query(1, ['memory']) == expected.query(1, ['memory'])
+        assert reader.query(5) is None
+        assert reader.compute_processes(0) == expected.compute_processes(0)
+        assert _snapshot(reader) == _snapshot(expected)
+        # A new publication is read on the next query.
+        fake.devices[0].memory_used = 1 << 30
+        publisher.publish()
+        assert reader.query(0, ['memory'])['memory']['used'] == 1024.0
+        assert _snapshot(reader) == _snapshot(expected)
+        reader.close()
+
+
+def test_returned_dicts_are_copies(name, fake): #pylint: disable=unused-argument
+    with Publisher(name, interval=10.0):
+        reader = SharedMemoryBackend(name)
+        reader.query(0)['memory']['used'] = -1.0
+        reader.query_all()[0]['processes'][0]['pid'] = -1
+        assert reader.query(0)['memory']['used'] != -1.0
+        assert reader.query(0)['processes'][0]['pid'] != -1
+        reader.close()
+
+
+def test_seqlock_retry(name, fake):
+    with Publisher(name, interval=10.0) as publisher:
+        reader = SharedMemoryBackend(name)
+        assert reader.query(0, ['memory'])['memory']['used'] == 0.0
+        read_sequence = reader._read_sequence #pylint: disable=protected-access
+        calls = []
+
+        def writing_sequence():
+            calls.append(None)
+            if len(calls) <= 5:
+                # The publisher is writing: the sequence is odd.
+                return read_sequence() + 1
+            if len(calls) == 7:
+                # A publication between the header read and its check: the read is torn.
+                fake.devices[0].memory_used = 1 << 30
+                publisher.publish()
+            return read_sequence()
+
+        reader._read_sequence = writing_sequence #pylint: disable=protected-access
+        fake.devices[0].memory_used = 1 << 29
+        publisher.publish()
+        assert reader.query(0, ['memory'])['memory']['used'] == 1024.0
+        assert len(calls) > 7
+        reader.close()
+
+
+def test_seqlock_never_released(name, fake): #pylint: disable=unused-argument
+    with Publisher(name, interval=10.0):
+        reader = SharedMemoryBackend(name, fallback=igpu.NVMLBackend(FakeNVML(3)))
+        reader._read_sequence = lambda: 1 #pylint: disable=protected-access
+        # A segment which is always being written is never read half-written.
+        assert reader.device_count() == 3
+        reader.close()
+
+
+def test_stale_state(name, fake):
+    fallback = igpu.NVMLBackend(FakeNVML(3))
+    with Publisher(name, interval=0.05) as publisher:
+        publisher.stop()
+        reader = SharedMemoryBackend(name, max_age=0.2)
+        stale_ok = SharedMemoryBackend(name, max_age=0.2, fallback=fallback)
+        assert reader.device_count() == stale_ok.device_count() == 2
+        time.sleep(0.3)
+        with pytest.raises(ValueError, match='older than'):
+            reader.device_count()
+        with pytest.raises(ValueError, match='older than'):
+            igpu.snapshot(metrics=METRICS, backend=reader)
+        assert stale_ok.device_count() == 3
+        assert stale_ok.query_all(['memory']) == fallback.query_all(['memory'])
+        assert _snapshot(stale_ok) == _snapshot(fallback)
+        # A new publication is fresh again.
+        fake.devices[1].gpu_util = 42
+        publisher.publish()
+        assert reader.query(1, ['utilization'])['utilization']['gpu'] == 42.0
+        assert stale_ok.device_count() == 2
+        reader.close()
+        stale_ok.close()
+
+
+def test_missing_segment(name):
+    with pytest.raises(ValueError, match='missing'):
+        SharedMemoryBackend(name).device_count()
+    assert SharedMemoryBackend(name, fallback=igpu.NVMLBackend(FakeNVML(3))).device_count() == 3
+
+
+def test_unpublished_fields(name, fake): #pylint: disable=unused-argument
+    with Publisher(name, interval=10.0, fields=['memory']):
+        reader = SharedMemoryBackend(name)
+        assert reader.query(0, ['memory'])['memory']['total'] > 0
+        with pytest.raises(ValueError, match='does not publish'):
+            reader.query(0, ['power'])
+        reader.close()
+
+
+def test_live_segment_is_not_replaced(name, fake):
+    with Publisher(name, interval=10.0):
+        second = Publisher(name, interval=10.0)
+        with pytest.raises(ValueError, match='running publisher'):
+            second.publish()
+        with pytest.raises(ValueError, match='running publisher'):
+            igpu.shm.publish(name)
+        # The running publisher is still read.
+        fake.devices[0].memory_used = 1 << 30
+        reader = SharedMemoryBackend(name)
+        assert reader.query(0, ['memory'])['memory']['used'] == 0.0
+        reader.close()
+        second.close()
+
+
+def test_stale_segment_is_replaced(name, fake):
+    first = Publisher(name, interval=0.05)
+    first.publish()
+    reader = SharedMemoryBackend(name, max_age=0.2)
+    assert reader.query(0, ['memory'])['memory']['used'] == 0.0
+    # The first publisher exits without removing its segment.
+    first._segment.close() #pylint: disable=protected-access
+    first._segment = None #pylint: disable=protected-access
+    time.sleep(0.2)
+    fake.devices[0].memory_used = 1 << 30
+    with Publisher(name, interval=10.0):
+        # The reader attached to the old segment sees it as stale and attaches to the new one.
+        time.sleep(0.1)
+        assert reader.query(0, ['memory'])['memory']['used'] == 1024.0
+        reader.close()
+
+
+def test_foreign_segment(name, fake): #pylint: disable=unused-argument
+    segment = shared_memory.SharedMemory(name=name, create=True, size=4096)
+    try:
+        segment.buf[:8] = b'NOTIGPU!'
+        with pytest.raises(ValueError, match='not an igpu segment'):
+            Publisher(name).publish()
+    finally:
+        segment.close()
+        segment.unlink()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests of igpu CUDA_VISIBLE_DEVICES resolution, with FakeNVML devices
+@author Antonio Carlos Nazare Jr.
+@url http://github.com/acnazarejr/igpu
+"""
+
+import pytest
+import igpu
+from igpu.fake import FakeNVML
+from igpu.core import resolve_visible_devices
+
+# The UUID of the fake device i is 'GPU-0000000i-0000-0000-0000-00000000000i', and the device 1
+# has the MIG device 'MIG-00000001-0000-0000-0000-000000000001'.
+UUID_2 = 'GPU-00000002-0000-0000-0000-000000000002'
+UUID_3 = 'GPU-00000003-0000-0000-0000-000000000003'
+MIG_1 = 'MIG-00000001-0000-0000-0000-000000000001'
+
+CASES = [
+    # Unset and empty.
+    (None, [0, 1, 2, 3]),
+    ('', []),
+    # Indexes, in the given order, with spaces.
+    ('0', [0]),
+    ('3,1', [3, 1]),
+    (' 2 , 0 ', [2, 0]),
+    # The list ends at the first invalid entry.
+    ('1,4,2', [1]),
+    ('1,-1,2', [1]),
+    ('1,abc,2', [1]),
+    ('4', []),
+    # ... or at the first repeated one.
+    ('1,2,1,3', [1, 2]),
+    # Full UUIDs and unique prefixes.
+    (UUID_2, [2]),
+    (f'{UUID_3},{UUID_2}', [3, 2]),
+    ('GPU-00000002', [2]),
+    ('GPU-00000003-0000', [3]),
+    # Ambiguous, or unknown, prefixes and UUIDs are invalid.
+    ('0,GPU-0000000', [0]),
+    ('0,GPU-00000009', [0]),
+    ('0,GPU-00000009-0000-0000-0000-000000000009', [0]),
+    # Mixed entries, repeated through another form.
+    (f'0,{UUID_2},1', [0, 2, 1]),
+    (f'2,{UUID_2}', [2]),
+    # MIG devices resolve to their parent device.
+    (MIG_1, [1]),
+    (f'MIG-GPU-{UUID_2[len("GPU-"):]}/1/0', [2]),
+    (f'MIG-{UUID_2}/1/0,0', [2, 0]),
+    (f'3,{MIG_1}', [3, 1]),
+    ('MIG-00000009-0000-0000-0000-000000000009', []),
+]
+
+
+@pytest.fixture(name='fake', autouse=True)
+def fixture_fake():
+    """Sets a backend of 4 FakeNVML devices, the device 1 with a MIG device."""
+    fake = FakeNVML(4)
+    fake.devices[1].add_mig_device()
+    igpu.set_backend(igpu.NVMLBackend(fake))
+    return fake
+
+
+@pytest.mark.parametrize('value, expected', CASES)
+def test_resolve_visible_devices(value, expected):
+    assert resolve_visible_devices(value) == expected
+
+
+def test_visible_devices_index(monkeypatch):
+    monkeypatch.setenv('CUDA_VISIBLE_DEVICES', f'{UUID_3},0')
+    assert igpu.core.visible_devices_index() == [3, 0]
+    assert igpu.count_visible_devices() == 2
+    monkeypatch.delenv('CUDA_VISIBLE_DEVICES')
+    assert igpu.count_visible_devices() == 4